@@ -6,8 +6,42 @@ load_dotenv()
 # Project root (1 level above /app)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
+# Development mode: enables extra runtime validation (e.g. ReportLab shape checks)
+DEBUG = os.getenv("DEBUG", "false").lower() in ("1", "true", "yes")
+
+# uvicorn worker processes per host (same default as the Dockerfile: one per CPU).
+# Per-process pools below are sized from it so the host-wide totals stay bounded.
+WEB_CONCURRENCY = max(1, int(os.getenv("WEB_CONCURRENCY", str(os.cpu_count() or 1))))
+_CPUS_PER_WORKER = max(1, (os.cpu_count() or 1) // WEB_CONCURRENCY)
+
 # Database (sync + async)
 DATABASE_URL = os.getenv("DATABASE_URL","sqlite+aiosqlite:///./test.db")
+# Connection pool (per worker process). By default WEB_CONCURRENCY * (size + overflow)
+# stays within DB_MAX_CONNECTIONS, the share of Postgres max_connections this host may use
+DB_MAX_CONNECTIONS = int(os.getenv("DB_MAX_CONNECTIONS", "80"))
+_DB_POOL_DEFAULT = max(1, min(5, DB_MAX_CONNECTIONS // (2 * WEB_CONCURRENCY)))
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", str(_DB_POOL_DEFAULT)))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", str(_DB_POOL_DEFAULT)))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+# Run Base.metadata.create_all on startup (disable once the schema is managed elsewhere)
+CREATE_TABLES = os.getenv("CREATE_TABLES", "true").lower() in ("1", "true", "yes")
+
+# Answer saves are batched in memory and written to questions.json at most this often
+# (seconds); 0 writes every save through immediately. Pending answers are only visible
+# to the worker holding them, so multi-worker deployments default to write-through.
+QUESTIONS_FLUSH_SECONDS = float(os.getenv("QUESTIONS_FLUSH_SECONDS", "3" if WEB_CONCURRENCY == 1 else "0"))
+# Questionnaire fan-out: one theme-extraction call plus one prompt per theme (each
+# carrying the full RFP/KB context) instead of a single prompt. Only pays off when
+# Ollama serves several requests in parallel (OLLAMA_NUM_PARALLEL), so it is opt-in.
+QUESTION_THEME_FANOUT = os.getenv("QUESTION_THEME_FANOUT", "false").lower() in ("1", "true", "yes")
+QUESTION_THEME_CONCURRENCY = int(os.getenv("QUESTION_THEME_CONCURRENCY", "3"))
+# Worker processes for xlsx/PDF rendering (per uvicorn worker)
+EXPORT_PROCESSES = int(os.getenv("EXPORT_PROCESSES", str(min(2, _CPUS_PER_WORKER))))
+# Worker processes for RFP text extraction / OCR (per uvicorn worker; the CPUs are
+# already split across WEB_CONCURRENCY workers)
+EXTRACT_PROCESSES = int(os.getenv("EXTRACT_PROCESSES", str(_CPUS_PER_WORKER)))
+# Reuse parsed Paragraph fragments for repeated PDF cell text (bounded LRU, opt-in)
+PDF_PARAGRAPH_CACHE = os.getenv("PDF_PARAGRAPH_CACHE", "false").lower() in ("1", "true", "yes")
 
 FRONTEND_URL = os.getenv("FRONTEND_URL")
 
@@ -34,6 +68,10 @@ AZURE_SEARCH_INDEX = os.getenv("AZURE_SEARCH_INDEX","your-azure-search-index")
 AZURE_STORAGE_ACCOUNT = os.getenv("AZURE_STORAGE_ACCOUNT","your-azure-storage-account")
 AZURE_STORAGE_KEY = os.getenv("AZURE_STORAGE_KEY","your-azure-storage-key")
 AZURE_STORAGE_CONTAINER = os.getenv("AZURE_STORAGE_CONTAINER","your-azure-storage-container")
+# Shared HTTPS pool for all blob calls (connections kept open between requests)
+AZURE_BLOB_POOL_SIZE = int(os.getenv("AZURE_BLOB_POOL_SIZE", "64"))
+AZURE_BLOB_KEEPALIVE = float(os.getenv("AZURE_BLOB_KEEPALIVE", "60"))
+AZURE_BLOB_CONNECT_TIMEOUT = float(os.getenv("AZURE_BLOB_CONNECT_TIMEOUT", "20"))
 
 
 # Email (SMTP)
@@ -44,13 +82,61 @@ SMTP_PASS = os.getenv("SMTP_PASS","your-smtp-pass")
 
 # ---------- LLM / OLLAMA ----------
 OLLAMA_HOST = os.getenv("OLLAMA_HOST", "http://localhost:11434")
+# Quantized tags trade a little precision for speed/memory: prefer a Q4_K_M tag for
+# interactive generation and Q8_0 where output precision matters
 OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "deepseek-r1")
 OLLAMA_EMBED_MODEL = os.getenv("OLLAMA_EMBED_MODEL", "qwen3-embedding")
+# How long Ollama keeps models loaded after a request (sent with every call; the
+# server default of 5m would evict them between sessions)
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "24h")
+# Startup model preload can take a while for large models
+OLLAMA_PRELOAD_TIMEOUT = float(os.getenv("OLLAMA_PRELOAD_TIMEOUT", "120"))
+# /api/generate options. num_ctx covers prompt + completion: scope prompts are trimmed
+# to a few thousand tokens but the scope JSON itself can run to several thousand more.
+OLLAMA_NUM_CTX = int(os.getenv("OLLAMA_NUM_CTX", "16384"))
+OLLAMA_NUM_BATCH = int(os.getenv("OLLAMA_NUM_BATCH", "512"))
+# CPU threads for inference; 0 leaves it to Ollama (physical cores)
+OLLAMA_NUM_THREAD = int(os.getenv("OLLAMA_NUM_THREAD", "0"))
+# Generated-token caps (num_predict; -1 = unlimited). Reasoning models spend part of
+# the budget on their <think> block, so leave headroom over the answer itself.
+OLLAMA_DOT_NUM_PREDICT = int(os.getenv("OLLAMA_DOT_NUM_PREDICT", "1024"))
+OLLAMA_SCOPE_NUM_PREDICT = int(os.getenv("OLLAMA_SCOPE_NUM_PREDICT", "8192"))
+# Shared Ollama HTTP pool (per worker process): concurrent generations/embeddings share
+# these connections on the event loop, so size keep-alive for the expected concurrency
+OLLAMA_HTTP_MAX_CONNECTIONS = int(os.getenv("OLLAMA_HTTP_MAX_CONNECTIONS", "100"))
+OLLAMA_HTTP_MAX_KEEPALIVE = int(os.getenv("OLLAMA_HTTP_MAX_KEEPALIVE", "64"))
+OLLAMA_HTTP_KEEPALIVE_EXPIRY = float(os.getenv("OLLAMA_HTTP_KEEPALIVE_EXPIRY", "300"))
+# Read timeout (seconds) between streamed /api/generate chunks; prompt evaluation of
+# long scope prompts happens before the first chunk and can take minutes
+OLLAMA_GENERATE_TIMEOUT = float(os.getenv("OLLAMA_GENERATE_TIMEOUT", "600"))
+# Persistent embedding cache shared by all workers on this host (SQLite); empty disables
+EMBED_CACHE_DB = os.getenv("EMBED_CACHE_DB", os.path.join(os.path.dirname(BASE_DIR), "embedding_cache.db"))
+# Reuse the embedding of a recently embedded long text (e.g. a re-uploaded RFP) when
+# its MinHash similarity is at least this high (embed_text_ollama(fuzzy=True) callers
+# only); 0 disables
+EMBED_FUZZY_THRESHOLD = float(os.getenv("EMBED_FUZZY_THRESHOLD", "0.95"))
+# Cache of validated scope/architecture generations (SQLite); empty disables.
+# Prompts embed today's date, so keep the TTL around a day.
+LLM_CACHE_DB = os.getenv("LLM_CACHE_DB", os.path.join(os.path.dirname(BASE_DIR), "llm_cache.db"))
+LLM_CACHE_TTL = int(os.getenv("LLM_CACHE_TTL", "86400"))
+# Default semantic threshold for llm_cache lookups that don't pass one; 0 = exact only.
+# Full scope/architecture prompts always use exact matching (shared static prefix).
+LLM_CACHE_SIM_THRESHOLD = float(os.getenv("LLM_CACHE_SIM_THRESHOLD", "0"))
+LLM_CACHE_MAX_ROWS = int(os.getenv("LLM_CACHE_MAX_ROWS", "500"))
+# Reuse a scope regeneration for the same draft when the instruction is the same or a
+# close paraphrase (same numbers and role names) of a cached one; 0 = exact only
+PLAN_CACHE_ENABLED = os.getenv("PLAN_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+PLAN_CACHE_SIM_THRESHOLD = float(os.getenv("PLAN_CACHE_SIM_THRESHOLD", "0.92"))
+# Per-process cache of KB retrieval results for repeated queries (seconds; 0 disables).
+# The KB is ingested outside this service, so this bounds how stale retrieval can be.
+RAG_CACHE_TTL = int(os.getenv("RAG_CACHE_TTL", "3600"))
 # qwen3-embedding produces 4096-dimensional vectors
 VECTOR_DIM = int(os.getenv("VECTOR_DIM", "4096"))
 
 # ---------- VECTOR DATABASE / QDRANT ----------
 QDRANT_HOST = os.getenv("QDRANT_HOST", "localhost")
 QDRANT_PORT = int(os.getenv("QDRANT_PORT", "6333"))
+# gRPC endpoint, used for bulk loads (recreate_qdrant_collection.py)
+QDRANT_GRPC_PORT = int(os.getenv("QDRANT_GRPC_PORT", "6334"))
 QDRANT_COLLECTION = os.getenv("QDRANT_COLLECTION", "knowledge_chunks")
 
@@ -4,9 +4,20 @@ from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.orm import sessionmaker, declarative_base
 from app.config import config
 
+# Pool tuning only applies to server databases (SQLite is used for local/tests)
+_pool_kwargs = {}
+if not config.DATABASE_URL.startswith("sqlite"):
+    _pool_kwargs = dict(
+        pool_size=config.DB_POOL_SIZE,
+        max_overflow=config.DB_MAX_OVERFLOW,
+        pool_pre_ping=True,
+        pool_recycle=config.DB_POOL_RECYCLE,
+        pool_use_lifo=True,
+    )
+
 # Async SQLAlchemy engine
 async_engine = create_async_engine(
-    config.DATABASE_URL, echo=False, future=True
+    config.DATABASE_URL, echo=False, future=True, **_pool_kwargs
 )
 
 # Async session factory
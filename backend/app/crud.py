@@ -114,7 +114,6 @@ async def create_project(
     db_project = models.Project(**project.dict(), owner_id=owner_id)
     db.add(db_project)
     await db.commit()
-    await db.refresh(db_project)
     logger.info(f" Created project {db_project.id} (owner={owner_id}, company={project.company_id})")
 
     # Attach files if provided
@@ -139,7 +138,6 @@ async def update_project(
     for field, value in update_data.dict(exclude_unset=True).items():
         setattr(db_project, field, value)
     await db.commit()
-    await db.refresh(db_project)
     logger.info(f" Updated project {db_project.id}")
     return db_project
 
@@ -202,7 +200,6 @@ async def add_project_file(
         )
         db.add(db_file)
         await db.commit()
-        await db.refresh(db_file)
         return _attach_file_urls(db_file)
 
     # Handle new UploadFile objects
@@ -219,7 +216,6 @@ async def add_project_file(
     )
     db.add(db_file)
     await db.commit()
-    await db.refresh(db_file)
     return _attach_file_urls(db_file)
 
 
@@ -256,15 +252,28 @@ async def list_project_files(
     return [_attach_file_urls(f) for f in files]
 
 
-# FINALIZED SCOPE UTILITIES
-async def has_finalized_scope(db: AsyncSession, project_id: uuid.UUID) -> bool:
-    """Check whether a project has a finalized scope JSON file."""
-    result = await db.execute(
-        select(models.ProjectFile).filter(
+async def get_file_by_name(
+    db: AsyncSession, project_id: uuid.UUID, file_name: str
+) -> Optional[str]:
+    """
+    Return the blob path of a named project file (uses ix_projectfile_pid_fname).
+    Names in models.GENERATED_FILE_NAMES resolve to the generated record only, never
+    to a user upload that happens to share the name.
+    """
+    return await db.scalar(
+        select(models.ProjectFile.file_path)
+        .filter(
             models.ProjectFile.project_id == project_id,
-            models.ProjectFile.file_name == "finalized_scope.json",
+            models.ProjectFile.file_name == file_name,
+            models.ProjectFile.is_generated.is_(file_name in models.GENERATED_FILE_NAMES),
         )
+        .limit(1)
     )
-    exists = result.scalar_one_or_none() is not None
+
+
+# FINALIZED SCOPE UTILITIES
+async def has_finalized_scope(db: AsyncSession, project_id: uuid.UUID) -> bool:
+    """Check whether a project has a finalized scope JSON file."""
+    exists = await get_file_by_name(db, project_id, "finalized_scope.json") is not None
     logger.debug(f"🔍 Project {project_id} finalized scope exists={exists}")
     return exists
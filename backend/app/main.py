@@ -1,29 +1,48 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import ORJSONResponse
 from fastapi.staticfiles import StaticFiles
 import os
 from app.config.database import async_engine, Base 
 from app.auth import router as auth_router
 from app.routers import projects, exports, blob, ratecards, project_prompts
-from app.utils import azure_blob
+from app.utils import azure_blob, ai_clients, scope_engine
+from app.config import config
 
 # ---------- App Init ----------
 app = FastAPI(
     title="AI-Powered Project Scoping Bot Backend",
     description="AI-Powered Project Scoping Bot Backend",
     version="1.0.0",
+    default_response_class=ORJSONResponse,
 )
 # ---------- Startup ----------
 @app.on_event("startup")
 async def on_startup():
     # Create DB tables
-    print("Creating database tables...")
-    async with async_engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
-    print("Database tables created.")
+    if config.CREATE_TABLES:
+        print("Creating database tables...")
+        async with async_engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        print("Database tables created.")
     # Ensure Blob container exists
     await azure_blob.init_container()
     print("Azure Blob container ready.")
+    # Background workers for project folder cleanup
+    azure_blob.start_cleanup_workers()
+    # Pre-warm Qdrant / Ollama clients so the first request doesn't pay init cost
+    await ai_clients.warm_up_clients()
+    print("AI clients ready.")
+
+# ---------- Shutdown ----------
+@app.on_event("shutdown")
+async def on_shutdown():
+    # Write answers still waiting for their debounced questions.json flush
+    await scope_engine.flush_all_question_answers()
+    await azure_blob.stop_cleanup_workers()
+    await azure_blob.close()
+    await ai_clients.close_http_client()
 
 # ---------- CORS ----------
 app.add_middleware(
@@ -34,6 +53,10 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# ---------- Compression ----------
+# Large scope JSON compresses 5-10x; small responses are passed through untouched
+app.add_middleware(GZipMiddleware, minimum_size=1024, compresslevel=5)
+
 # ---------- Static Files ----------
 UPLOAD_DIR = "uploads"
 os.makedirs(UPLOAD_DIR, exist_ok=True)
@@ -55,3 +78,11 @@ async def health_check():
     """
     return {"status": "ok"}
 
+
+@app.get("/health/embed-cache")
+async def embed_cache_health():
+    """
+    Query-embedding cache counters for this worker (hit rate visibility).
+    """
+    return ai_clients.embed_cache_info()
+
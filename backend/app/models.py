@@ -1,16 +1,46 @@
 import uuid
 import datetime
 from sqlalchemy import (
-    String, Text, DateTime, ForeignKey, Float, event
+    String, Text, DateTime, ForeignKey, Float, Index, JSON, Boolean, event, text, false
 )
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.dialects.postgresql import UUID, JSONB
+from sqlalchemy.types import TypeDecorator
 from sqlalchemy.orm import relationship, Mapped, mapped_column
 from sqlalchemy.sql import func
 from fastapi_users.db import SQLAlchemyBaseUserTableUUID
+from uuid6 import uuid7
 from app.config.database import Base
 from app.utils import azure_blob
 
 
+# COLUMN TYPES
+class CommaList(TypeDecorator):
+    """
+    Comma-separated text ("React, FastAPI") exposed to Python as a plain string but
+    stored as a JSON array (JSONB on PostgreSQL), so it can be filtered server-side
+    with containment queries, e.g. Project.tech_stack.contains(["React"]).
+    """
+    impl = JSONB
+    cache_ok = True
+
+    def load_dialect_impl(self, dialect):
+        if dialect.name == "postgresql":
+            return dialect.type_descriptor(JSONB())
+        return dialect.type_descriptor(JSON())
+
+    def process_bind_param(self, value, dialect):
+        if value is None or isinstance(value, list):
+            return value
+        return [item.strip() for item in str(value).split(",") if item.strip()]
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        if isinstance(value, list):
+            return ", ".join(str(item) for item in value)
+        return str(value)
+
+
 # USER MODEL
 class User(SQLAlchemyBaseUserTableUUID, Base):
     __tablename__ = "users"
@@ -45,7 +75,7 @@ class Company(Base):
     __tablename__ = "companies"
 
     id: Mapped[uuid.UUID] = mapped_column(
-        UUID(as_uuid=True), primary_key=True, default=uuid.uuid4, index=True
+        UUID(as_uuid=True), primary_key=True, default=uuid7, index=True
     )
     name: Mapped[str] = mapped_column(String(100), unique=True, nullable=False)
     currency: Mapped[str] = mapped_column(String(10), default="USD")
@@ -74,7 +104,7 @@ class RateCard(Base):
     __tablename__ = "rate_cards"
 
     id: Mapped[uuid.UUID] = mapped_column(
-        UUID(as_uuid=True), primary_key=True, default=uuid.uuid4, index=True
+        UUID(as_uuid=True), primary_key=True, default=uuid7, index=True
     )
 
     company_id: Mapped[uuid.UUID] = mapped_column(
@@ -105,18 +135,24 @@ class RateCard(Base):
 # PROJECT MODEL
 class Project(Base):
     __tablename__ = "projects"
+    __table_args__ = (
+        Index("ix_projects_tech_stack_gin", "tech_stack", postgresql_using="gin"),
+    )
+    # created_at / updated_at come back via RETURNING on the INSERT/UPDATE itself,
+    # so a commit doesn't leave them expired (no refresh round-trip to read them)
+    __mapper_args__ = {"eager_defaults": True}
 
     id: Mapped[uuid.UUID] = mapped_column(
-        UUID(as_uuid=True), primary_key=True, default=uuid.uuid4, index=True
+        UUID(as_uuid=True), primary_key=True, default=uuid7, index=True
     )
 
     # Core fields
     name: Mapped[str | None] = mapped_column(String(150), index=True, nullable=True)
     domain: Mapped[str | None] = mapped_column(String(100), nullable=True)
     complexity: Mapped[str | None] = mapped_column(String(50), nullable=True)
-    tech_stack: Mapped[str | None] = mapped_column(Text, nullable=True)
-    use_cases: Mapped[str | None] = mapped_column(Text, nullable=True)
-    compliance: Mapped[str | None] = mapped_column(Text, nullable=True)
+    tech_stack: Mapped[str | None] = mapped_column(CommaList, nullable=True)
+    use_cases: Mapped[str | None] = mapped_column(CommaList, nullable=True)
+    compliance: Mapped[str | None] = mapped_column(CommaList, nullable=True)
     duration: Mapped[str | None] = mapped_column(String(20), nullable=True)
 
     # Audit
@@ -159,14 +195,33 @@ class Project(Base):
 
 
 # PROJECT FILE MODEL
+# Files the scope engine keeps exactly one record of per project (upserted in place).
+# They are flagged is_generated: user uploads may use the same names (and share names
+# with each other), so uniqueness is enforced for generated records only.
+GENERATED_FILE_NAMES = ("finalized_scope.json", "questions.json", "architecture.png", "architecture.svg")
+GENERATED_FILE_WHERE = text("is_generated")
+
+
 class ProjectFile(Base):
     __tablename__ = "project_files"
+    __table_args__ = (
+        Index("ix_projectfile_pid_fname", "project_id", "file_name"),
+        Index(
+            "uq_projectfile_generated", "project_id", "file_name", unique=True,
+            postgresql_where=GENERATED_FILE_WHERE, sqlite_where=GENERATED_FILE_WHERE,
+        ),
+    )
+    # uploaded_at comes back via RETURNING on the INSERT
+    __mapper_args__ = {"eager_defaults": True}
 
     id: Mapped[uuid.UUID] = mapped_column(
-        UUID(as_uuid=True), primary_key=True, default=uuid.uuid4, index=True
+        UUID(as_uuid=True), primary_key=True, default=uuid7, index=True
     )
     file_name: Mapped[str] = mapped_column(String(255), nullable=False)
     file_path: Mapped[str] = mapped_column(Text, nullable=False)
+    is_generated: Mapped[bool] = mapped_column(
+        Boolean, nullable=False, default=False, server_default=false()
+    )
     uploaded_at: Mapped[datetime.datetime] = mapped_column(
         DateTime(timezone=True), server_default=func.now()
     )
@@ -195,7 +250,7 @@ class ProjectPromptHistory(Base):
     __tablename__ = "project_prompt_history"
 
     id: Mapped[uuid.UUID] = mapped_column(
-        UUID(as_uuid=True), primary_key=True, default=uuid.uuid4, index=True
+        UUID(as_uuid=True), primary_key=True, default=uuid7, index=True
     )
 
     project_id: Mapped[uuid.UUID] = mapped_column(
@@ -235,12 +290,7 @@ def delete_project_folder(mapper, connection, target):
         prefix = f"projects/{target.id}/"
 
         # This ensures folder deletion only when a project is truly deleted
-        import asyncio
-        try:
-            loop = asyncio.get_running_loop()
-            loop.create_task(azure_blob.delete_folder(prefix))
-        except RuntimeError:
-            asyncio.run(azure_blob.delete_folder(prefix))
+        azure_blob.enqueue_folder_delete(prefix)
 
         # mark so individual files won’t be deleted again
         setattr(target, "_blob_folder_deleted", True)
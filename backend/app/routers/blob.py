@@ -1,15 +1,18 @@
 from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Query
-from fastapi.responses import StreamingResponse
+from fastapi.responses import Response, StreamingResponse
 from typing import List, Literal
 from app.utils import azure_blob
 from app.auth.router import fastapi_users
-import io, mimetypes
+import mimetypes, asyncio, os
+from functools import lru_cache
 
 get_current_superuser = fastapi_users.current_user(active=True, superuser=True)
 
 router = APIRouter(prefix="/api/blobs", tags=["Azure Blobs"])
 
 VALID_BASES = ("projects", "knowledge_base")
+UPLOAD_CONCURRENCY = 8  # keep folder uploads within Azure connection limits
+SMALL_BLOB_BYTES = 1 << 20  # below this, skip streaming and send one body
 
 
 def _validate_base(base: str) -> str:
@@ -18,6 +21,23 @@ def _validate_base(base: str) -> str:
     return base
 
 
+@lru_cache(maxsize=512)
+def _mime_for(ext: str) -> str:
+    return mimetypes.guess_type(f"x{ext}")[0] or "application/octet-stream"
+
+
+async def _blob_response(blob_name: str, base: str, disposition: str) -> Response:
+    """Small blobs are sent as a single body; larger ones are streamed chunk by chunk."""
+    downloader = await azure_blob.open_blob(blob_name, base)
+    filename = blob_name.split("/")[-1]
+    content_type = _mime_for(os.path.splitext(filename)[1].lower())
+    headers = {"Content-Disposition": f'{disposition}; filename="{filename}"'}
+
+    if downloader.size < SMALL_BLOB_BYTES:
+        return Response(content=await downloader.readall(), media_type=content_type, headers=headers)
+    return StreamingResponse(downloader.chunks(), media_type=content_type, headers=headers)
+
+
 # Uploads
 @router.post("/upload/file")
 async def upload_file(
@@ -32,8 +52,7 @@ async def upload_file(
         blob_name = f"{folder}/{safe_name}" if folder else safe_name
         blob_name = blob_name.strip("/")
 
-        data = await file.read()
-        path = await azure_blob.upload_bytes(data, blob_name, base)
+        path = await azure_blob.upload_stream(file.file, blob_name, base)
 
         return {"status": "success", "blob": path}
     except Exception as e:
@@ -49,16 +68,16 @@ async def upload_folder(
     try:
         base = _validate_base(base)
         folder = folder.strip().rstrip("/")
-        uploaded = []
+        sem = asyncio.Semaphore(UPLOAD_CONCURRENCY)
 
-        for file in files:
+        async def _one(file: UploadFile) -> str:
             relative_path = file.filename.replace(" ", "_")
             blob_name = f"{folder}/{relative_path}" if folder else relative_path
             blob_name = blob_name.strip("/")
+            async with sem:
+                return await azure_blob.upload_stream(file.file, blob_name, base)
 
-            data = await file.read()
-            path = await azure_blob.upload_bytes(data, blob_name, base)
-            uploaded.append(path)
+        uploaded = await asyncio.gather(*[_one(f) for f in files])
 
         return {"status": "success", "files": uploaded}
     except Exception as e:
@@ -84,17 +103,7 @@ async def explorer_tree(base: Literal["projects", "knowledge_base"]):
 async def download_blob(blob_name: str, base: Literal["projects", "knowledge_base"] = Query(...)):
     try:
         base = _validate_base(base)
-        blob_bytes = await azure_blob.download_bytes(blob_name, base)
-        file_like = io.BytesIO(blob_bytes)
-        filename = blob_name.split("/")[-1]
-        content_type, _ = mimetypes.guess_type(filename)
-        content_type = content_type or "application/octet-stream"
-
-        return StreamingResponse(
-            file_like,
-            media_type=content_type,
-            headers={"Content-Disposition": f'attachment; filename="{filename}"'},
-        )
+        return await _blob_response(blob_name, base, "attachment")
     except Exception as e:
         raise HTTPException(404, f"Blob not found: {e}")
 
@@ -103,17 +112,7 @@ async def download_blob(blob_name: str, base: Literal["projects", "knowledge_bas
 async def preview_blob(blob_name: str, base: Literal["projects", "knowledge_base"] = Query(...)):
     try:
         base = _validate_base(base)
-        blob_bytes = await azure_blob.download_bytes(blob_name, base)
-        file_like = io.BytesIO(blob_bytes)
-        filename = blob_name.split("/")[-1]
-        content_type, _ = mimetypes.guess_type(filename)
-        content_type = content_type or "application/octet-stream"
-
-        return StreamingResponse(
-            file_like,
-            media_type=content_type,
-            headers={"Content-Disposition": f'inline; filename="{filename}"'},
-        )
+        return await _blob_response(blob_name, base, "inline")
     except Exception as e:
         raise HTTPException(404, f"Blob not found: {e}")
 
@@ -1,9 +1,9 @@
-import uuid, json, re, logging
-from typing import Any, Dict, Optional
+import uuid, re, logging, asyncio
+from typing import Any, Dict, Optional, Tuple
 from app.utils import azure_blob
 
 from fastapi import APIRouter, Depends, HTTPException
-from fastapi.responses import StreamingResponse
+from fastapi.responses import Response, StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app import models
@@ -17,34 +17,58 @@ current_active_user = fastapi_users.current_user(active=True)
 
 router = APIRouter(prefix="/api/projects/{project_id}/export", tags=["Export"])
 
+_UNSAFE_CHARS = re.compile(r"[^a-zA-Z0-9_-]+")
+
 
 # Helpers
 async def _get_project(project_id: uuid.UUID, user_id: uuid.UUID, db: AsyncSession) -> models.Project:
     project = await projects.get_project(db, project_id=project_id, owner_id=user_id)
     if not project:
         raise HTTPException(status_code=404, detail="Project not found or access denied")
-    await db.refresh(project, attribute_names=["files"])
     return project
 
 
+async def _download_scope(path: str) -> Optional[Dict[str, Any]]:
+    try:
+        return await azure_blob.load_json_cached(path)
+    except Exception as e:
+        logger.warning(f"Failed to load finalized scope from blob {path}: {e}")
+        return None
+
+
 async def _load_finalized_scope(project: models.Project) -> Optional[Dict[str, Any]]:
-    for f in project.files:
-        if f.file_name == "finalized_scope.json":
-            try:
-                blob_bytes = await azure_blob.download_bytes(f.file_path)
-                return json.loads(blob_bytes.decode("utf-8"))
-            except Exception as e:
-                logging.warning(f"Failed to load finalized scope from blob {f.file_path}: {e}")
-                return None
-    return None
+    """Finalized scope of an already authorized project (path from its loaded files)."""
+    path = next(
+        (f.file_path for f in project.files
+         if f.file_name == "finalized_scope.json" and f.is_generated),
+        None,
+    )
+    if not path:
+        return None
+    return await _download_scope(path)
+
+
+async def _get_project_and_scope(
+    project_id: uuid.UUID, user_id: uuid.UUID, db: AsyncSession
+) -> Tuple[models.Project, Optional[Dict[str, Any]]]:
+    """
+    Fetch the project (ownership checked) and then its finalized scope. get_project
+    already selectinloads project.files, so the blob path needs no extra query, and
+    nothing is read from storage for projects the user doesn't own.
+    """
+    project = await _get_project(project_id, user_id, db)
+    return project, await _load_finalized_scope(project)
 
 
 def _safe_filename(name: str) -> str:
-    return re.sub(r"[^a-zA-Z0-9_-]+", "_", (name or "").strip().lower())
+    return _UNSAFE_CHARS.sub("_", (name or "").strip().lower())
 
 
-async def _ensure_scope(project: models.Project, db: AsyncSession) -> Dict[str, Any]:
-    scope = await _load_finalized_scope(project)
+async def _ensure_scope(
+    project: models.Project,
+    db: AsyncSession,
+    scope: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
     if not scope:
         raw_scope = await scope_engine.generate_project_scope(db, project)
         scope = export.generate_json_data(raw_scope or {})
@@ -60,11 +84,10 @@ async def preview_json_from_scope(
     db: AsyncSession = Depends(get_async_session),
     current_user: models.User = Depends(current_active_user),
 ):
-    project = await _get_project(project_id, current_user.id, db)
-    finalized = await _load_finalized_scope(project)
+    project, finalized = await _get_project_and_scope(project_id, current_user.id, db)
     if (not scope or len(scope) == 0) and finalized:
-        return finalized
-    return export.generate_json_data(scope or {})
+        return Response(export.generate_json_bytes(finalized), media_type="application/json")
+    return Response(export.generate_json_bytes(scope or {}), media_type="application/json")
 
 
 @router.post("/preview/excel")
@@ -74,10 +97,9 @@ async def preview_excel_from_scope(
     db: AsyncSession = Depends(get_async_session),
     current_user: models.User = Depends(current_active_user),
 ):
-    project = await _get_project(project_id, current_user.id, db)
-    finalized = await _load_finalized_scope(project)
+    project, finalized = await _get_project_and_scope(project_id, current_user.id, db)
     normalized = export.generate_json_data(scope or {}) if not finalized else finalized
-    file = export.generate_xlsx(normalized)
+    file = await export.generate_xlsx(normalized)
     safe_name = _safe_filename(normalized.get("overview", {}).get("Project Name") or f"project_{project_id}")
     return StreamingResponse(
         file,
@@ -93,11 +115,9 @@ async def preview_pdf_from_scope(
     db: AsyncSession = Depends(get_async_session),
     current_user: models.User = Depends(current_active_user),
 ):
-    import asyncio
     try:
         logger.info(f"📄 Generating PDF preview for project {project_id}")
-        project = await _get_project(project_id, current_user.id, db)
-        finalized = await _load_finalized_scope(project)
+        project, finalized = await _get_project_and_scope(project_id, current_user.id, db)
         normalized = export.generate_json_data(scope or {}) if not finalized else finalized
 
         logger.info(f"  - Activities count: {len(normalized.get('activities', []))}")
@@ -153,9 +173,9 @@ async def export_project_json(
     db: AsyncSession = Depends(get_async_session),
     current_user: models.User = Depends(current_active_user),
 ):
-    project = await _get_project(project_id, current_user.id, db)
-    scope = await _ensure_scope(project, db)
-    return scope
+    project, finalized = await _get_project_and_scope(project_id, current_user.id, db)
+    scope = await _ensure_scope(project, db, finalized)
+    return Response(export.generate_json_bytes(scope), media_type="application/json")
 
 
 @router.get("/excel")
@@ -164,10 +184,10 @@ async def export_project_excel(
     db: AsyncSession = Depends(get_async_session),
     current_user: models.User = Depends(current_active_user),
 ):
-    project = await _get_project(project_id, current_user.id, db)
-    scope = await _ensure_scope(project, db)
+    project, finalized = await _get_project_and_scope(project_id, current_user.id, db)
+    scope = await _ensure_scope(project, db, finalized)
     normalized = export.generate_json_data(scope or {})
-    file = export.generate_xlsx(normalized)
+    file = await export.generate_xlsx(normalized)
     safe_name = _safe_filename(project.name or f"project_{project.id}")
     return StreamingResponse(
         file,
@@ -182,9 +202,8 @@ async def export_project_pdf(
     db: AsyncSession = Depends(get_async_session),
     current_user: models.User = Depends(current_active_user),
 ):
-    import asyncio
-    project = await _get_project(project_id, current_user.id, db)
-    scope = await _ensure_scope(project, db)
+    project, finalized = await _get_project_and_scope(project_id, current_user.id, db)
+    scope = await _ensure_scope(project, db, finalized)
     normalized = export.generate_json_data(scope or {})
 
     # Add timeout protection for PDF generation (60 seconds max)
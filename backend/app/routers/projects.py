@@ -1,4 +1,5 @@
-import uuid, json, logging
+import uuid, logging
+import orjson
 from typing import List, Optional, Dict, Any
 
 from fastapi import (
@@ -208,20 +209,14 @@ async def get_finalized_scope(
     if not db_project:
         raise HTTPException(status_code=404, detail="Project not found")
 
-    result = await db.execute(
-        select(models.ProjectFile).filter(
-            models.ProjectFile.project_id == project_id,
-            models.ProjectFile.file_name == "finalized_scope.json"
-        )
-    )
-    db_file = result.scalars().first()
+    file_path = await projects.get_file_by_name(db, project_id, "finalized_scope.json")
 
-    if not db_file:
+    if not file_path:
         return None 
 
     try:
-        blob_bytes = await azure_blob.download_bytes(db_file.file_path)
-        scope_data = json.loads(blob_bytes.decode("utf-8"))
+        blob_bytes = await azure_blob.download_bytes(file_path)
+        scope_data = orjson.loads(blob_bytes)
         return scope_data
     except Exception as e:
         logger.error(f"Failed to fetch finalized scope: {e}")
@@ -336,7 +331,7 @@ async def update_project_questions_with_answers(
         raise HTTPException(status_code=400, detail="Missing user_answers payload")
 
     try:
-        result = await scope_engine.update_questions_with_user_input(db, db_project, user_answers)
+        result = await scope_engine.save_question_answers(db, db_project, user_answers)
         return {
             "msg": "Questions updated successfully with user answers.",
             "updated_questions": result.get("questions", []),
@@ -364,13 +359,15 @@ async def get_project_questions(
     blob_name = f"projects/{project_id}/questions.json"
 
     try:
+        # Make sure answers saved moments ago are in the blob we are about to read
+        await scope_engine.flush_question_answers(blob_name)
         # Check if blob exists
         if not await azure_blob.blob_exists(blob_name):
             raise HTTPException(status_code=404, detail="questions.json not found for this project")
 
         # Download the blob content
         q_bytes = await azure_blob.download_bytes(blob_name)
-        q_json = json.loads(q_bytes.decode("utf-8"))
+        q_json = orjson.loads(q_bytes)
         return q_json
 
     except Exception as e:
@@ -1,3 +1,11 @@
-from . import ai_clients,emails, azure_blob, export
+import importlib
 
 __all__ = ["emails", "ai_clients", "azure_blob", "export"]
+
+
+def __getattr__(name):
+    # Submodules load on first use, so e.g. file_extract can be imported in the
+    # extraction worker processes without config or the SDK clients
+    if name in __all__:
+        return importlib.import_module(f".{name}", __name__)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
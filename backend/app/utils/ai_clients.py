@@ -1,8 +1,15 @@
 from __future__ import annotations
+import asyncio
+import hashlib
 import logging
 import os
-import time
-import requests
+import re
+import sqlite3
+import threading
+import httpx
+import numpy as np
+import orjson
+from collections import OrderedDict
 from functools import lru_cache
 from typing import List, Dict, Any
 
@@ -12,10 +19,18 @@ from app.config.config import (
     OLLAMA_HOST,
     OLLAMA_MODEL,
     OLLAMA_EMBED_MODEL,
+    OLLAMA_KEEP_ALIVE,
+    OLLAMA_PRELOAD_TIMEOUT,
+    OLLAMA_NUM_CTX,
+    OLLAMA_HTTP_MAX_CONNECTIONS,
+    OLLAMA_HTTP_MAX_KEEPALIVE,
+    OLLAMA_HTTP_KEEPALIVE_EXPIRY,
     QDRANT_HOST,
     QDRANT_PORT,
     QDRANT_COLLECTION,
     VECTOR_DIM,
+    EMBED_CACHE_DB,
+    EMBED_FUZZY_THRESHOLD,
 )
 
 logger = logging.getLogger(__name__)
@@ -24,8 +39,13 @@ logger.setLevel(logging.INFO)
 __all__ = [
     "get_llm_client",
     "get_embed_client",
+    "get_http_client",
+    "close_http_client",
     "embed_text_ollama",
+    "embed_cache_info",
+    "minhash_signature",
     "get_qdrant_client",
+    "warm_up_clients",
 ]
 
 # -------------------------------------------------------------------------
@@ -43,33 +63,194 @@ def get_embed_client() -> dict:
     return {"host": OLLAMA_HOST, "model": OLLAMA_EMBED_MODEL, "vector_dim": VECTOR_DIM}
 
 
+@lru_cache(maxsize=1)
+def get_http_client() -> httpx.AsyncClient:
+    """Shared keep-alive HTTP client for Ollama calls (one connection pool per process)."""
+    return httpx.AsyncClient(
+        limits=httpx.Limits(
+            max_keepalive_connections=OLLAMA_HTTP_MAX_KEEPALIVE,
+            max_connections=OLLAMA_HTTP_MAX_CONNECTIONS,
+            keepalive_expiry=OLLAMA_HTTP_KEEPALIVE_EXPIRY,
+        ),
+        timeout=30,
+    )
+
+
+async def close_http_client() -> None:
+    """Close the shared Ollama client if it was created (app shutdown)."""
+    if get_http_client.cache_info().currsize:
+        await get_http_client().aclose()
+        get_http_client.cache_clear()
+
+
+
 # -------------------------------------------------------------------------
-# Embedding generator
+# Embedding cache (in-process LRU keyed by model + text digest)
 # -------------------------------------------------------------------------
-def embed_text_ollama(texts: List[str]) -> List[List[float]]:
-    """
-    Generate embeddings using Ollama embedding model.
-    Retries once on transient errors, auto-detects dimension if needed.
-    """
-    embed_cfg = get_embed_client()
-    url = f"{embed_cfg['host'].rstrip('/')}/api/embed"
-    model = embed_cfg["model"]
-    expected_dim = int(embed_cfg["vector_dim"])
+EMBED_CACHE_SIZE = 4096
+EMBED_BATCH_SIZE = 32  # texts per /api/embed request
+_embed_cache: "OrderedDict[bytes, List[float]]" = OrderedDict()
+_embed_stats = {"hits": 0, "misses": 0, "disk_hits": 0, "fuzzy_hits": 0}
 
-    if not isinstance(texts, list):
-        texts = [str(texts)]
-    texts = [t.strip() for t in texts if t and t.strip()]
-    if not texts:
-        logger.warning("⚠️ No valid texts provided for embedding.")
-        return []
 
-    payload = {"model": model, "input": texts}
+def _embed_key(model: str, text: str) -> bytes:
+    return hashlib.blake2b(f"{model}\0{text}".encode("utf-8"), digest_size=16).digest()
+
+
+def _embed_cache_put(key: bytes, vector: List[float]) -> None:
+    _embed_cache[key] = vector
+    _embed_cache.move_to_end(key)
+    if len(_embed_cache) > EMBED_CACHE_SIZE:
+        _embed_cache.popitem(last=False)
+
+
+def embed_cache_info() -> Dict[str, Any]:
+    """Hit/miss counters for the query-embedding LRU (per process, since startup)."""
+    hits, misses = _embed_stats["hits"], _embed_stats["misses"]
+    total = hits + misses
+    return {
+        "hits": hits,
+        "misses": misses,
+        "disk_hits": _embed_stats["disk_hits"],
+        "fuzzy_hits": _embed_stats["fuzzy_hits"],
+        "hit_rate": round(hits / total, 4) if total else 0.0,
+        "size": len(_embed_cache),
+        "maxsize": EMBED_CACHE_SIZE,
+    }
+
+
+# -------------------------------------------------------------------------
+# Persistent embedding cache (SQLite, survives restarts, shared across workers)
+# -------------------------------------------------------------------------
+_embed_db_lock = threading.Lock()
+
+
+@lru_cache(maxsize=1)
+def _get_embed_db() -> sqlite3.Connection:
+    conn = sqlite3.connect(EMBED_CACHE_DB, check_same_thread=False, timeout=5)
+    # WAL lets several uvicorn/gunicorn workers read while one writes
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS embeddings ("
+        " sha256 TEXT NOT NULL, model TEXT NOT NULL, dim INTEGER NOT NULL, vec BLOB NOT NULL,"
+        " PRIMARY KEY (sha256, model))"
+    )
+    conn.commit()
+    return conn
+
+
+def _text_sha256(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _disk_cache_get(model: str, texts: List[str]) -> Dict[str, List[float]]:
+    """Look up stored float32 vectors for texts; returns {text: vector} for the hits."""
+    by_digest = {_text_sha256(t): t for t in texts}
+    digests = list(by_digest)
+    rows = []
+    try:
+        with _embed_db_lock:
+            conn = _get_embed_db()
+            # Stay under SQLite's bound-parameter limit on large ingestion batches
+            for i in range(0, len(digests), 500):
+                part = digests[i:i + 500]
+                rows += conn.execute(
+                    "SELECT sha256, vec FROM embeddings WHERE model = ? AND sha256 IN "
+                    f"({','.join('?' * len(part))})",
+                    (model, *part),
+                ).fetchall()
+    except Exception as e:
+        logger.warning(f"⚠️ Embedding disk cache read failed: {e}")
+        return {}
+    return {by_digest[d]: np.frombuffer(vec, dtype=np.float32).tolist() for d, vec in rows}
+
+
+def _disk_cache_put(model: str, items: List[tuple]) -> None:
+    """Store (text, vector) pairs as float32 blobs (vectors are float32 already)."""
+    rows = [
+        (_text_sha256(t), model, len(v), np.asarray(v, dtype=np.float32).tobytes())
+        for t, v in items
+    ]
+    try:
+        with _embed_db_lock:
+            conn = _get_embed_db()
+            conn.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?, ?)", rows)
+            conn.commit()
+    except Exception as e:
+        logger.warning(f"⚠️ Embedding disk cache write failed: {e}")
+
+
+# -------------------------------------------------------------------------
+# Near-duplicate reuse (MinHash over word shingles)
+# -------------------------------------------------------------------------
+# Re-uploaded RFPs often differ only by typo fixes or whitespace. For callers that opt
+# in (embed_text_ollama(..., fuzzy=True)), long texts get a MinHash signature; a miss
+# whose estimated Jaccard similarity to a recently embedded text is >=
+# EMBED_FUZZY_THRESHOLD reuses that text's vector. Off by default: RAG queries and
+# llm_cache prompts must get their own vectors.
+FUZZY_MIN_CHARS = 500  # short queries: small edits change meaning, always embed
+FUZZY_MAX_ENTRIES = 1024
+_MINHASH_PERM = 128
+_MINHASH_PRIME = np.uint64(4294967311)  # smallest prime > 2**32
+_minhash_rng = np.random.default_rng(1)
+_MINHASH_A = _minhash_rng.integers(1, 2**32, _MINHASH_PERM, dtype=np.uint64)
+_MINHASH_B = _minhash_rng.integers(0, 2**32, _MINHASH_PERM, dtype=np.uint64)
+_NON_WORD_RE = re.compile(r"[^\w\s]+")
+_fuzzy_index: "OrderedDict[bytes, tuple]" = OrderedDict()  # key -> (model, signature, vector)
+
+
+def minhash_signature(text: str) -> np.ndarray:
+    """MinHash signature of text's normalized word 3-shingles; equal-position share ~ Jaccard similarity."""
+    words = _NON_WORD_RE.sub(" ", text.lower()).split()
+    shingles = {" ".join(words[i:i + 3]) for i in range(max(len(words) - 2, 1))}
+    hv = np.fromiter(
+        (int.from_bytes(hashlib.blake2b(sh.encode("utf-8"), digest_size=4).digest(), "little") for sh in shingles),
+        dtype=np.uint64, count=len(shingles),
+    )
+    # (a*x + b) mod p for every permutation/shingle pair; a, x < 2**32 so no uint64
+    # overflow. Blocks of shingles keep the temporary matrix small for long RFPs.
+    signature = np.full(_MINHASH_PERM, _MINHASH_PRIME, dtype=np.uint64)
+    for i in range(0, len(hv), 4096):
+        block = (np.outer(hv[i:i + 4096], _MINHASH_A) + _MINHASH_B) % _MINHASH_PRIME
+        np.minimum(signature, block.min(axis=0), out=signature)
+    return signature
+
+
+def _fuzzy_lookup(model: str, signature: np.ndarray) -> List[float] | None:
+    if not _fuzzy_index:
+        return None
+    keys = list(_fuzzy_index)
+    entries = list(_fuzzy_index.values())
+    similarity = (np.stack([e[1] for e in entries]) == signature).mean(axis=1)
+    for i in np.argsort(similarity)[::-1]:
+        if similarity[i] < EMBED_FUZZY_THRESHOLD:
+            break
+        if entries[i][0] == model:
+            _fuzzy_index.move_to_end(keys[i])
+            return entries[i][2]
+    return None
+
+
+def _fuzzy_put(key: bytes, model: str, signature: np.ndarray, vector: List[float]) -> None:
+    _fuzzy_index[key] = (model, signature, vector)
+    _fuzzy_index.move_to_end(key)
+    if len(_fuzzy_index) > FUZZY_MAX_ENTRIES:
+        _fuzzy_index.popitem(last=False)
+
+
+# -------------------------------------------------------------------------
+# Embedding generator
+# -------------------------------------------------------------------------
+async def _request_embeddings(url: str, model: str, texts: List[str], expected_dim: int) -> List[List[float]]:
+    """POST a batch of texts to Ollama. Retries once; returns [] on failure."""
+    payload = {"model": model, "input": texts, "keep_alive": OLLAMA_KEEP_ALIVE}
 
     for attempt in range(2):  # Retry once
         try:
-            resp = requests.post(url, json=payload, timeout=30)
+            resp = await get_http_client().post(url, json=payload, timeout=30)
             resp.raise_for_status()
-            data = resp.json()
+            data = orjson.loads(resp.content)
 
             embeddings = (
                 data.get("embedding")
@@ -81,38 +262,121 @@ def embed_text_ollama(texts: List[str]) -> List[List[float]]:
             # Normalize nested structure
             if isinstance(embeddings, list) and embeddings and isinstance(embeddings[0], (int, float)):
                 embeddings = [embeddings]
-            elif isinstance(embeddings, list) and isinstance(embeddings[0], dict):
+            elif isinstance(embeddings, list) and embeddings and isinstance(embeddings[0], dict):
                 embeddings = [d.get("embedding", []) for d in embeddings if "embedding" in d]
 
-            valid_vectors = [
-                v for v in embeddings
-                if isinstance(v, list)
-                and len(v) > 0
-                and all(isinstance(x, (int, float)) for x in v)
-            ]
-
-            if not valid_vectors:
-                raise ValueError("Empty or invalid embedding vectors")
+            # One vectorised coercion: rejects ragged / non-numeric payloads in C
+            arr = np.asarray(embeddings, dtype=np.float32)
+            if arr.ndim != 2 or arr.shape[0] != len(texts) or arr.shape[1] == 0:
+                raise ValueError(
+                    f"Empty or invalid embedding vectors (shape {arr.shape} for {len(texts)} texts)"
+                )
 
-            dim = len(valid_vectors[0])
+            dim = arr.shape[1]
             if dim != expected_dim:
                 logger.warning(
                     f"⚠️ Embedding dimension mismatch — got {dim}, expected {expected_dim}. "
                     f"Update VECTOR_DIM in config if model changed."
                 )
 
-            return valid_vectors
+            return arr.tolist()
 
         except Exception as e:
             logger.error(f"Embedding attempt {attempt+1} failed: {e}")
             if attempt == 0:
-                time.sleep(1.5)
+                await asyncio.sleep(1.5)
                 continue
             else:
                 logger.error("❌ Ollama embedding failed after retry.")
                 return []
 
 
+async def embed_text_ollama(texts: List[str], fuzzy: bool = False) -> List[List[float]]:
+    """
+    Generate embeddings using Ollama embedding model.
+    Duplicate and previously seen texts are served from an in-process LRU cache,
+    then from the SQLite cache at EMBED_CACHE_DB; only the remaining misses are sent
+    to Ollama, split into concurrent batches of EMBED_BATCH_SIZE so no single
+    response body grows with the input size.
+    fuzzy=True also lets long texts reuse the vector of a near-identical recent text
+    (MinHash, see above); only for callers where that approximation is acceptable.
+    Retries once on transient errors, auto-detects dimension if needed.
+    """
+    embed_cfg = get_embed_client()
+    url = f"{embed_cfg['host'].rstrip('/')}/api/embed"
+    model = embed_cfg["model"]
+    expected_dim = int(embed_cfg["vector_dim"])
+
+    if not isinstance(texts, list):
+        texts = [str(texts)]
+    texts = [t.strip() for t in texts if t and t.strip()]
+    if not texts:
+        logger.warning("⚠️ No valid texts provided for embedding.")
+        return []
+
+    keys = [_embed_key(model, t) for t in texts]
+    resolved: Dict[bytes, List[float]] = {}
+    misses: Dict[bytes, str] = {}
+    for key, text in zip(keys, texts):
+        if key in resolved or key in misses:
+            continue
+        cached = _embed_cache.get(key)
+        if cached is not None:
+            _embed_cache.move_to_end(key)
+            resolved[key] = cached
+            _embed_stats["hits"] += 1
+        else:
+            misses[key] = text
+            _embed_stats["misses"] += 1
+
+    if misses and EMBED_CACHE_DB:
+        stored = await asyncio.to_thread(_disk_cache_get, model, list(misses.values()))
+        for key in [k for k, t in misses.items() if t in stored]:
+            vector = stored[misses.pop(key)]
+            resolved[key] = vector
+            _embed_cache_put(key, vector)
+            _embed_stats["disk_hits"] += 1
+
+    signatures: Dict[bytes, np.ndarray] = {}
+    if fuzzy and misses and EMBED_FUZZY_THRESHOLD > 0:
+        long_keys = [k for k, t in misses.items() if len(t) >= FUZZY_MIN_CHARS]
+        # Shingling + 128 permutations is CPU work; keep it off the event loop
+        computed = await asyncio.to_thread(lambda: [minhash_signature(misses[k]) for k in long_keys])
+        for key, signature in zip(long_keys, computed):
+            signatures[key] = signature
+            vector = _fuzzy_lookup(model, signature)
+            if vector is not None:
+                # Not stored under this text's exact key: exact-cache callers must
+                # never see another text's vector
+                del misses[key]
+                resolved[key] = vector
+                _embed_stats["fuzzy_hits"] += 1
+
+    if misses:
+        miss_keys = list(misses)
+        miss_texts = list(misses.values())
+        batches = [
+            miss_texts[i:i + EMBED_BATCH_SIZE]
+            for i in range(0, len(miss_texts), EMBED_BATCH_SIZE)
+        ]
+        results = await asyncio.gather(
+            *[_request_embeddings(url, model, batch, expected_dim) for batch in batches]
+        )
+        if not all(results):
+            return []
+        vectors = [v for batch_vectors in results for v in batch_vectors]
+        for key, vector in zip(miss_keys, vectors):
+            resolved[key] = vector
+            _embed_cache_put(key, vector)
+            if key in signatures:
+                _fuzzy_put(key, model, signatures[key], vector)
+        if EMBED_CACHE_DB:
+            await asyncio.to_thread(_disk_cache_put, model, list(zip(miss_texts, vectors)))
+
+    return [resolved[key] for key in keys]
+
+
+
 # -------------------------------------------------------------------------
 # Qdrant Client
 # -------------------------------------------------------------------------
@@ -131,6 +395,17 @@ def get_qdrant_client() -> QdrantClient:
                 vectors_config=models.VectorParams(
                     size=VECTOR_DIM,
                     distance=models.Distance.COSINE,
+                    # Full-precision vectors stay on disk; only the int8 copy is resident
+                    on_disk=True,
+                ),
+                # int8 copies of the vectors kept in RAM: 4x smaller and faster to
+                # scan; searches rescore the top candidates with the originals
+                quantization_config=models.ScalarQuantization(
+                    scalar=models.ScalarQuantizationConfig(
+                        type=models.ScalarType.INT8,
+                        quantile=0.99,
+                        always_ram=True,
+                    ),
                 ),
             )
             logger.info(f"✅ Created Qdrant collection '{QDRANT_COLLECTION}' ({VECTOR_DIM} dims)")
@@ -142,3 +417,50 @@ def get_qdrant_client() -> QdrantClient:
     except Exception as e:
         logger.exception(f"❌ Failed to initialize Qdrant client: {e}")
         raise
+
+
+# -------------------------------------------------------------------------
+# Startup warm-up
+# -------------------------------------------------------------------------
+async def warm_up_clients() -> None:
+    """
+    Initialise cached clients before traffic arrives: Qdrant connection + collection
+    check, Ollama configs, one request on the shared HTTP pool (DNS + TCP connect),
+    then load the generation and embedding models so the first request doesn't.
+    Failures are logged, not raised, so the API can still start if a backend is down.
+    """
+    get_llm_client()
+    get_embed_client()
+
+    try:
+        await asyncio.to_thread(get_qdrant_client)
+    except Exception as e:
+        logger.warning(f"⚠️ Qdrant warm-up failed: {e}")
+
+    try:
+        resp = await get_http_client().get(f"{OLLAMA_HOST.rstrip('/')}/api/tags", timeout=5)
+        resp.raise_for_status()
+        logger.info("✅ Ollama connection pool warmed up")
+    except Exception as e:
+        logger.warning(f"⚠️ Ollama warm-up failed: {e}")
+        return
+
+    await asyncio.gather(
+        # Same num_ctx as ollama_chat, or the first real request would reload the model
+        _preload_model("/api/generate", OLLAMA_MODEL, options={"num_ctx": OLLAMA_NUM_CTX}),
+        _preload_model("/api/embed", OLLAMA_EMBED_MODEL, input=["."]),
+    )
+
+
+async def _preload_model(path: str, model: str, **body: Any) -> None:
+    """Load a model into Ollama memory now (and pin it with keep_alive) instead of on the first request."""
+    try:
+        resp = await get_http_client().post(
+            f"{OLLAMA_HOST.rstrip('/')}{path}",
+            json={"model": model, "keep_alive": OLLAMA_KEEP_ALIVE, **body},
+            timeout=OLLAMA_PRELOAD_TIMEOUT,
+        )
+        resp.raise_for_status()
+        logger.info(f"✅ Ollama model '{model}' loaded")
+    except Exception as e:
+        logger.warning(f"⚠️ Ollama preload of '{model}' failed: {e}")
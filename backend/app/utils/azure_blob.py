@@ -1,9 +1,14 @@
 # app/utils/azure_blob.py
-from typing import List, Dict, Union
+from typing import Any, BinaryIO, List, Dict, Optional, Union
 import anyio, asyncio
-from azure.storage.blob.aio import BlobServiceClient, ContainerClient
+import aiohttp
+import orjson
+from cachetools import TTLCache
+from azure.storage.blob.aio import BlobServiceClient, ContainerClient, StorageStreamDownloader
 from azure.storage.blob import generate_container_sas, ContainerSasPermissions
-from azure.core.exceptions import ResourceExistsError, ResourceNotFoundError
+from azure.core import MatchConditions
+from azure.core.exceptions import ResourceExistsError, ResourceNotFoundError, ResourceModifiedError
+from azure.core.pipeline.transport import AioHttpTransport
 from app.config import config
 from datetime import datetime, timedelta
 
@@ -15,9 +20,32 @@ AZURE_STORAGE_CONTAINER = config.AZURE_STORAGE_CONTAINER or "scopingbot"
 if not AZURE_STORAGE_ACCOUNT or not AZURE_STORAGE_KEY:
     raise RuntimeError("Azure Storage credentials missing in config.py/.env")
 
+class _PooledAioHttpTransport(AioHttpTransport):
+    """
+    AioHttpTransport whose session uses a larger, longer-lived connection pool than
+    aiohttp's defaults. The session is created on first use (it needs a running loop).
+    """
+
+    async def open(self):
+        if not self.session and self._session_owner:
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(
+                    limit=config.AZURE_BLOB_POOL_SIZE,
+                    keepalive_timeout=config.AZURE_BLOB_KEEPALIVE,
+                ),
+                trust_env=self._use_env_settings,
+                cookie_jar=aiohttp.DummyCookieJar(),
+                auto_decompress=False,
+            )
+        await super().open()
+
+
+# One client (and so one transport / connection pool) for the whole process;
+# container and blob clients derived from it share its pipeline
 _blob_service: BlobServiceClient = BlobServiceClient(
     account_url=f"https://{AZURE_STORAGE_ACCOUNT}.blob.core.windows.net",
     credential=AZURE_STORAGE_KEY,
+    transport=_PooledAioHttpTransport(connection_timeout=config.AZURE_BLOB_CONNECT_TIMEOUT),
 )
 
 container: ContainerClient = _blob_service.get_container_client(AZURE_STORAGE_CONTAINER)
@@ -30,6 +58,11 @@ async def init_container():
         pass
 
 
+async def close():
+    """Close the shared client and its connection pool (app shutdown)."""
+    await _blob_service.close()
+
+
 # Helpers
 def _normalize_path(blob_name: str, base: str) -> str:
     blob_name = blob_name.strip("/")
@@ -44,15 +77,24 @@ async def upload_bytes(
     data: Union[bytes, bytearray],
     blob_name: str,
     base: str = "",
-    overwrite: bool = True
+    overwrite: bool = True,
+    metadata: Optional[Dict[str, str]] = None,
+    etag: Optional[str] = None,
 ) -> str:
+    """
+    Upload bytes to a blob. With etag, the write only succeeds if the blob still has
+    that ETag; otherwise ResourceModifiedError is raised (and not retried).
+    """
     path = _normalize_path(blob_name, base)
     blob = container.get_blob_client(path)
+    conditions = {"etag": etag, "match_condition": MatchConditions.IfNotModified} if etag else {}
 
     for attempt in range(3):
         try:
-            await blob.upload_blob(data, overwrite=overwrite)
+            await blob.upload_blob(data, overwrite=overwrite, metadata=metadata, **conditions)
             return path
+        except ResourceModifiedError:
+            raise
         except Exception as e:
             # Azure may briefly reject upload if the blob was just deleted
             if attempt < 2:
@@ -63,6 +105,37 @@ async def upload_bytes(
             raise
 
 
+async def upload_stream(
+    file_obj: BinaryIO,
+    blob_name: str,
+    base: str = "",
+    overwrite: bool = True
+) -> str:
+    """Upload from a file-like object; the SDK reads it in blocks instead of buffering it whole."""
+    path = _normalize_path(blob_name, base)
+    blob = container.get_blob_client(path)
+    start = file_obj.tell() if file_obj.seekable() else None
+
+    for attempt in range(3):
+        try:
+            await blob.upload_blob(
+                file_obj,
+                overwrite=overwrite,
+                blob_type="BlockBlob",
+                max_concurrency=4,
+            )
+            return path
+        except Exception as e:
+            # Only retry when the stream can be rewound
+            if attempt < 2 and start is not None:
+                print(f" Upload retry {attempt+1}/3 for {path}: {e}")
+                file_obj.seek(start)
+                await anyio.sleep(1.0)
+                continue
+            print(f" Upload failed permanently for {path}: {e}")
+            raise
+
+
 async def upload_file(path: str, blob_name: str, base: str = "") -> str:
     with open(path, "rb") as f:
         data = f.read()
@@ -76,6 +149,72 @@ async def download_bytes(blob_name: str, base: str = "") -> bytes:
     stream = await blob.download_blob()
     return await stream.readall()
 
+
+async def download_bytes_with_etag(blob_name: str, base: str = "") -> tuple[bytes, str]:
+    """Download a blob and return its bytes with the ETag they were read at."""
+    path = _normalize_path(blob_name, base)
+    blob = container.get_blob_client(path)
+    stream = await blob.download_blob()
+    return await stream.readall(), stream.properties.etag
+
+# Parsed-JSON cache: path -> (etag, object). Entries are revalidated against the
+# blob ETag, so a rewrite is picked up immediately; the TTL only bounds memory.
+_json_cache: TTLCache = TTLCache(maxsize=256, ttl=60)
+
+
+async def load_json_cached(blob_name: str, base: str = "") -> Any:
+    """
+    Load and parse a JSON blob, reusing the parsed object while the blob's ETag is unchanged.
+    The returned object is shared between callers and must be treated as read-only.
+    """
+    path = _normalize_path(blob_name, base)
+    blob = container.get_blob_client(path)
+    props = await blob.get_blob_properties()
+
+    cached = _json_cache.get(path)
+    if cached and cached[0] == props.etag:
+        return cached[1]
+
+    stream = await blob.download_blob()
+    obj = orjson.loads(await stream.readall())
+    _json_cache[path] = (stream.properties.etag or props.etag, obj)
+    return obj
+
+
+# Raw-bytes cache for small, frequently re-read blobs (e.g. architecture PNGs
+# embedded in every PDF export). Same ETag revalidation as _json_cache.
+_bytes_cache: TTLCache = TTLCache(maxsize=32, ttl=300)
+
+
+async def download_bytes_cached(blob_name: str, base: str = "") -> bytes:
+    """
+    Download a blob, reusing the previous bytes while its ETag is unchanged.
+    Costs one properties round-trip instead of a full download on a hit.
+    """
+    path = _normalize_path(blob_name, base)
+    blob = container.get_blob_client(path)
+    props = await blob.get_blob_properties()
+
+    cached = _bytes_cache.get(path)
+    if cached and cached[0] == props.etag:
+        return cached[1]
+
+    stream = await blob.download_blob()
+    data = await stream.readall()
+    _bytes_cache[path] = (stream.properties.etag or props.etag, data)
+    return data
+
+
+async def open_blob(blob_name: str, base: str = "") -> StorageStreamDownloader:
+    """
+    Start a download and return the SDK downloader without reading the body.
+    Callers can check `.size`, then `readall()` small blobs or stream `.chunks()`.
+    A missing blob raises here, before any bytes are sent to a client.
+    """
+    path = _normalize_path(blob_name, base)
+    blob = container.get_blob_client(path)
+    return await blob.download_blob()
+
 async def download_text(blob_name: str, base: str = "", encoding: str = "utf-8") -> str:
     raw = await download_bytes(blob_name, base)
     return raw.decode(encoding, errors="ignore")
@@ -209,6 +348,70 @@ def delete_blob_sync(blob_path: str):
         return False
 
 
+# Background folder cleanup (bounded worker pool instead of one task per delete)
+_cleanup_queue: Optional[asyncio.Queue] = None
+_cleanup_workers: List[asyncio.Task] = []
+
+
+async def _cleanup_worker():
+    while True:
+        prefix = await _cleanup_queue.get()
+        try:
+            deleted = await delete_folder(prefix)
+            print(f" Cleaned up {len(deleted)} blobs under {prefix}")
+        except Exception as e:
+            print(f" Folder cleanup failed for {prefix}: {e}")
+        finally:
+            _cleanup_queue.task_done()
+
+
+def start_cleanup_workers(workers: int = 2):
+    """Create the cleanup queue and its workers on the running loop (call once at startup)."""
+    global _cleanup_queue
+    if _cleanup_queue is not None:
+        return
+    _cleanup_queue = asyncio.Queue()
+    for _ in range(workers):
+        _cleanup_workers.append(asyncio.create_task(_cleanup_worker()))
+
+
+async def stop_cleanup_workers(timeout: float = 10.0):
+    """
+    Give queued folder deletes up to timeout seconds to finish, then cancel the
+    workers (app shutdown, before close()).
+    """
+    global _cleanup_queue
+    if _cleanup_queue is None:
+        return
+    try:
+        await asyncio.wait_for(_cleanup_queue.join(), timeout)
+    except asyncio.TimeoutError:
+        print(f" {_cleanup_queue.qsize()} folder cleanup(s) still pending at shutdown")
+    for task in _cleanup_workers:
+        task.cancel()
+    await asyncio.gather(*_cleanup_workers, return_exceptions=True)
+    _cleanup_workers.clear()
+    _cleanup_queue = None
+
+
+def enqueue_folder_delete(prefix: str):
+    """
+    Schedule deletion of every blob under a folder prefix.
+    Uses the worker queue when the app is running; falls back to a direct
+    task (no queue started) or asyncio.run (no event loop at all).
+    """
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        asyncio.run(delete_folder(prefix))
+        return
+
+    if _cleanup_queue is not None:
+        _cleanup_queue.put_nowait(prefix)
+    else:
+        loop.create_task(delete_folder(prefix))
+
+
 def safe_delete_blob(blob_path: str):
     """
     Fire-and-forget blob delete — now protected against folder wipes.
@@ -231,6 +434,16 @@ async def blob_exists(blob_name: str, base: str = "") -> bool:
     blob = container.get_blob_client(path)
     return await blob.exists()
 
+async def get_blob_metadata(blob_name: str, base: str = "") -> Dict[str, str]:
+    """User metadata of a blob ({} if the blob doesn't exist)."""
+    path = _normalize_path(blob_name, base)
+    blob = container.get_blob_client(path)
+    try:
+        props = await blob.get_blob_properties()
+    except ResourceNotFoundError:
+        return {}
+    return dict(props.metadata or {})
+
 def get_blob_url(blob_name: str, base: str = "") -> str:
     path = _normalize_path(blob_name, base)
     return (
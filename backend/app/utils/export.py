@@ -1,27 +1,59 @@
 # app/utils/export.py
+# Export entry points. The xlsx/PDF renderers live in export_xlsx / export_pdf and
+# are imported only inside export workers, so web workers never load reportlab.
 from __future__ import annotations
-import io, json, logging
+import io, json, logging, asyncio, multiprocessing, hashlib
+import orjson
+from collections import namedtuple
+from cachetools import LRUCache
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from datetime import datetime, timezone, timedelta
-from textwrap import wrap
-from typing import Any, Dict
-from reportlab.platypus import Image as RLImage
-import xlsxwriter
+from functools import lru_cache
+from typing import Any, Dict, List
 from app.utils import azure_blob
+from app.config import config
 
 logger = logging.getLogger(__name__)
-from reportlab.lib.pagesizes import A4, landscape
-from reportlab.lib.units import cm
-from reportlab.lib import colors
-from reportlab.platypus import (
-    SimpleDocTemplate, Paragraph, Table, TableStyle,
-    Spacer, PageBreak, LongTable
-)
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.graphics.shapes import Drawing, Rect, String
-from reportlab.graphics.charts.piecharts import Pie
-from reportlab.lib.enums import TA_CENTER
-
-# Theme 
+
+# xlsx/PDF rendering is pure-Python CPU work that holds the GIL, so it runs in
+# worker processes. Created on first export; "spawn" because the parent already
+# has event-loop and SDK threads running that must not be forked.
+_EXPORT_POOL: ProcessPoolExecutor | None = None
+
+
+def _get_export_pool() -> ProcessPoolExecutor:
+    global _EXPORT_POOL
+    if _EXPORT_POOL is None:
+        _EXPORT_POOL = ProcessPoolExecutor(
+            max_workers=config.EXPORT_PROCESSES,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_export_worker,
+        )
+    return _EXPORT_POOL
+
+
+def _init_export_worker():
+    # Runs once in each new worker: load the renderers and font metrics up front
+    # so the first export a worker handles doesn't pay for them
+    from app.utils import export_xlsx  # noqa: F401
+    from app.utils.export_pdf import ensure_fonts
+    ensure_fonts()
+
+
+async def _run_in_export_pool(fn, *args):
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(_get_export_pool(), fn, *args)
+    except BrokenProcessPool:
+        # A worker died (e.g. OOM); drop the pool so the next export starts a fresh one
+        global _EXPORT_POOL
+        logger.error("❌ Export worker pool broke - recreating on next export")
+        _EXPORT_POOL = None
+        raise
+
+
+# Theme
 THEME = {
     "header_bg": "#BDD7EE",
     "zebra1": "#FFFFFF",
@@ -29,6 +61,7 @@ THEME = {
     "total_bg": "#C6E0B4",
     "palette": ["#8DA6D7", "#E2DBBB", "#97BAEB", "#F28282", "#B9E7EB", "#E0C0A8"]
 }
+
 # Currency symbols for formatting
 CURRENCY_SYMBOLS = {
     "USD": "$",
@@ -48,716 +81,117 @@ CURRENCY_SYMBOLS = {
 
 IST = timezone(timedelta(hours=5, minutes=30))
 
+# Missing key, malformed string, or a non-string value
+_DATE_ERRORS = (ValueError, KeyError, TypeError)
+
+
+@lru_cache(maxsize=8192)
+def _parse_iso_str(value: str) -> datetime:
+    return datetime.fromisoformat(value)
+
+
+def _parse_iso(value: Any) -> datetime:
+    """ISO date parsing shared by the xlsx and PDF exports; repeat exports hit the cache."""
+    if isinstance(value, datetime):
+        return value
+    return _parse_iso_str(value)
+
+
+# Risk items as both renderers consume them (non-dict entries are not rendered)
+RiskRow = namedtuple("RiskRow", "risk mitigation")
+
+
+def normalize_risks(items: Any) -> List[RiskRow]:
+    if not isinstance(items, list):
+        return []
+    return [
+        RiskRow(r.get("risk", ""), r.get("mitigation", ""))
+        for r in items if isinstance(r, dict)
+    ]
+
+
 # JSON Export
 def generate_json_data(scope: Dict[str, Any]) -> Dict[str, Any]:
     return scope
 
+
+def generate_json_bytes(scope: Dict[str, Any]) -> bytes:
+    """Serialize a scope for the JSON endpoints, bypassing FastAPI's jsonable_encoder walk."""
+    return orjson.dumps(
+        generate_json_data(scope),
+        option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS,
+    )
+
+
 # Excel Export
-def generate_xlsx(scope: Dict[str, Any]) -> io.BytesIO:
-    try:
-        from xlsxwriter.utility import xl_col_to_name
-        data = scope
-        buf = io.BytesIO()
-        wb = xlsxwriter.Workbook(buf, {"in_memory": True})
-        currency = (data.get("overview", {}) or {}).get("Currency", "USD").upper()
-        symbol = CURRENCY_SYMBOLS.get(currency, "$")
-
-
-        # ---------- Formats ----------
-        fmt_th = wb.add_format({
-            "bold": True, "bg_color": THEME["header_bg"],
-            "border": 1, "align": "center", "text_wrap": True
-        })
-        fmt_z1 = wb.add_format({"border": 1, "bg_color": THEME["zebra1"]})
-        fmt_z2 = wb.add_format({"border": 1, "bg_color": THEME["zebra2"]})
-        fmt_date = wb.add_format({"border": 1, "num_format": "yyyy-mm-dd"})
-        fmt_num = wb.add_format({"border": 1, "num_format": "0.00"})
-        fmt_money = wb.add_format({
-            "border": 1,
-            "num_format": f'"{symbol}"#,##0.00'
-        })
-
-        fmt_total = wb.add_format({"bold": True, "border": 1, "bg_color": THEME["total_bg"]})
-
-        # --------- Overview ----------
-        ws_ov = wb.add_worksheet("Overview")
-        ws_ov.write_row("A1", ["Field", "Value"], fmt_th)
-
-        # Include discount information if present
-        overview_data = data.get("overview", {})
-        discount_pct = data.get("discount_percentage", 0)
-
-        for i, (k, v) in enumerate(overview_data.items(), start=2):
-            zfmt = fmt_z1 if i % 2 else fmt_z2
-            ws_ov.write(f"A{i}", k, zfmt)
-            ws_ov.write(f"B{i}", str(v), zfmt)
-
-        # Add discount row if discount was applied
-        if discount_pct and isinstance(discount_pct, (int, float)) and discount_pct > 0:
-            next_row = len(overview_data.items()) + 2
-            zfmt = fmt_z1 if next_row % 2 else fmt_z2
-            ws_ov.write(f"A{next_row}", "Discount Applied", zfmt)
-            ws_ov.write(f"B{next_row}", f"{discount_pct}% discount applied to all costs", zfmt)
-
-        ws_ov.set_column("A:A", 20)
-        ws_ov.set_column("B:B", 100)
-
-        # -------- Activities ----------
-        ws_a = wb.add_worksheet("Activities")
-        headers = [
-            "ID", "Activities", "Description", "Owner",
-            "Resources", "Start Date", "End Date", "Effort (months)", "DurationTemp"
-        ]
-        ws_a.write_row("A1", headers, fmt_th)
-
-        ws_a.set_column("A:A", 5)
-        ws_a.set_column("B:B", 25) 
-        ws_a.set_column("C:D", 30)  
-        ws_a.set_column("E:E", 20)  
-        ws_a.set_column("F:I", 15)   
-
-        starts, ends = [], []
-        for r, a in enumerate(data.get("activities", []), start=2):
-            zfmt = fmt_z1 if r % 2 else fmt_z2
-            ws_a.write(r-1, 0, a.get("ID"), zfmt)
-            ws_a.write(r-1, 1, a.get("Activities"), zfmt)
-            ws_a.write(r-1, 2, a.get("Description"), zfmt)
-            ws_a.write(r-1, 3, a.get("Owner"), zfmt)
-            ws_a.write(r-1, 4, a.get("Resources"), zfmt)
-            try:
-                s = datetime.fromisoformat(a["Start Date"])
-                ws_a.write_datetime(r-1, 5, s, fmt_date)
-                starts.append(s)
-            except:
-                ws_a.write_blank(r-1, 5, None, fmt_date)
-            try:
-                e = datetime.fromisoformat(a["End Date"])
-                ws_a.write_datetime(r-1, 6, e, fmt_date)
-                ends.append(e)
-            except:
-                ws_a.write_blank(r-1, 6, None, fmt_date)
-
-        last_a = len(data.get("activities", [])) + 1
-
-        # Column Formulas
-        if data.get("activities"):
-            ws_a.add_table(
-                f"A1:I{last_a}",
-                {
-                    "name": "ActivitiesTable",
-                    "columns": [
-                        {"header": h} if h not in ("Effort (months)", "DurationTemp") else (
-                            {
-                                "header": "Effort (months)",
-                                "formula": (
-                                    'IF(AND([@[Start Date]]<>"",[@[End Date]]<>""),'
-                                    '([@[End Date]]-[@[Start Date]])/30,"")'
-                                )
-                            } if h == "Effort (months)" else
-                            {
-                                "header": "DurationTemp",
-                                "formula": (
-                                    'IF(AND([@[Start Date]]<>"",[@[End Date]]<>""),'
-                                    '[@[End Date]]-[@[Start Date]],"")'
-                                ),
-                                "format": fmt_num
-                            }
-                        )
-                        for h in headers
-                    ],
-                    "style": "Table Style Medium 2",
-                    "autofilter": True
-                }
-            )
+async def generate_xlsx(scope: Dict[str, Any]) -> io.BytesIO:
+    return io.BytesIO(await _run_in_export_pool(_xlsx_bytes, scope))
 
-            # ------- Gantt chart --------
-            if starts and ends:
-                gantt = wb.add_chart({"type": "bar", "subtype": "stacked"})
-                gantt.add_series({
-                    "name": "Start",
-                    "categories": f"='Activities'!$B$2:$B${last_a}",
-                    "values": f"='Activities'!$F$2:$F${last_a}",  
-                    "fill": {"none": True},
-                    "border": {"none": True}
-                })
-                gantt.add_series({
-                    "name": "Duration",
-                    "categories": f"='Activities'!$B$2:$B${last_a}", 
-                    "values": f"='Activities'!$I$2:$I${last_a}",  
-                    "fill": {"color": "#4D96FF"},
-                    "border": {"color": "#4D96FF"}
-                })
-
-                gantt.set_title({"name": "Project Gantt Chart"})
-                gantt.set_x_axis({
-                    "date_axis": True,
-                    "num_format": "mmm yyyy",
-                    "major_unit": 30,
-                    "major_unit_type": "days"
-                })
-                gantt.set_y_axis({"reverse": True})
-                gantt.set_legend({"none": True})
-
-                ws_a.insert_chart("K1", gantt, {"x_scale": 2.2, "y_scale": 1.6})
-
-
-        # -------- Resources Plan --------
-        ws_r = wb.add_worksheet("Resources Plan")
-        if data.get("resourcing_plan"):
-            month_keys = [k for k in data["resourcing_plan"][0] if len(k.split()) == 2]
-            res_headers = ["Resources", "Rate/month"] + month_keys + ["Efforts", "Cost"]
-            ws_r.write_row("A1", res_headers, fmt_th)
-            ws_r.set_column("A:A", 25)
-            ws_r.set_column("B:B", 12)
-            for i in range(2, 2 + len(month_keys)):
-                ws_r.set_column(i, i, 10)
-            ws_r.set_column(2 + len(month_keys), 2 + len(month_keys), 10)
-            ws_r.set_column(3 + len(month_keys), 3 + len(month_keys), 14)
-
-            for r, row in enumerate(data["resourcing_plan"], start=2):
-                zfmt = fmt_z1 if r % 2 else fmt_z2
-                ws_r.write(r-1, 0, row["Resources"], zfmt)
-                ws_r.write_number(r-1, 1, row.get("Rate/month", 2000.0), fmt_money)
-                for j, m in enumerate(month_keys, start=2):
-                    ws_r.write_number(r-1, j, row.get(m, 0.0), fmt_num)
-
-            last_r = len(data["resourcing_plan"]) + 1
-
-            # Table
-            ws_r.add_table(
-                f"A1:{xl_col_to_name(len(res_headers)-1)}{last_r}",
-                {
-                    "name": "ResourcesTable",
-                    "columns": [
-                        {"header": h} if h not in ("Efforts", "Cost") else (
-                            {
-                                "header": "Efforts",
-                                "formula": "+".join(f"[@[{m}]]" for m in month_keys)
-                            } if h == "Efforts" else
-                            {
-                                "header": "Cost",
-                                "formula": "=[@Efforts]*[@[Rate/month]]"
-                            }
-                        )
-                        for h in res_headers
-                    ],
-                    "style": "Table Style Medium 2",
-                    "autofilter": True,
-                    "total_row": True
-                }
-            )
 
-            # Formulas
-            efforts_col = 2 + len(month_keys)
-            cost_col = 3 + len(month_keys)
-            efforts_letter = xl_col_to_name(efforts_col)
-            cost_letter = xl_col_to_name(cost_col)
-
-            for r in range(2, last_r+1):
-                month_cols = [xl_col_to_name(j) for j in range(2, 2+len(month_keys))]
-                sum_expr = "+".join([f"{c}{r}" for c in month_cols])
-                ws_r.write_formula(r-1, efforts_col, f"={sum_expr}", fmt_num)
-                ws_r.write_formula(r-1, cost_col, f"=B{r}*{efforts_letter}{r}", fmt_money)
-
-            # Totals
-            for c in range(len(res_headers)):
-                if c == 0:
-                    ws_r.write(last_r, c, "Total", fmt_total)
-                else:
-                    ws_r.write_blank(last_r, c, None, fmt_total)
-            ws_r.write_formula(
-                last_r, efforts_col,
-                f"=SUBTOTAL(109,{efforts_letter}2:{efforts_letter}{last_r})",
-                fmt_total
-            )
-            ws_r.write_formula(
-                last_r, cost_col,
-                f"=SUBTOTAL(109,{cost_letter}2:{cost_letter}{last_r})",
-                fmt_total
-            )
+def _xlsx_bytes(scope: Dict[str, Any]) -> bytes:
+    # Runs in an export worker; bytes pickle back to the parent cheaply.
+    # xlsxwriter is only imported by processes that actually render.
+    from app.utils.export_xlsx import build_xlsx
+    return build_xlsx(scope).getvalue()
+
 
-            # Pie chart
-            pie = wb.add_chart({"type": "pie"})
-            pie.add_series({
-                "categories": f"='Resources Plan'!$A$2:$A${last_r}",
-                "values": f"='Resources Plan'!${cost_letter}$2:${cost_letter}${last_r}",
-                "data_labels": {"percentage": True, "value": True, "category": True}
-            })
-            pie.set_title({"name": "Cost by Role"})
-            ws_r.insert_chart("M1", pie, {"x_scale": 1.5, "y_scale": 1.5})
-
-        # -------- Project Summary --------
-        summary = data.get("project_summary", {})
-        if summary and isinstance(summary, dict):
-            ws_s = wb.add_worksheet("Project Summary")
-            ws_s.set_column("A:A", 25)
-            ws_s.set_column("B:B", 100)
-
-            # Add title
-            title_format = wb.add_format({
-                "bold": True, "font_size": 14, "bg_color": THEME["header_bg"],
-                "border": 1, "align": "left"
-            })
-            ws_s.merge_range("A1:B1", "Project Summary", title_format)
-
-            row = 2
-
-            # Executive Summary
-            exec_summary = summary.get("executive_summary", "")
-            if exec_summary:
-                ws_s.write(row, 0, "Executive Summary", fmt_th)
-                ws_s.write(row, 1, exec_summary, wb.add_format({
-                    "border": 1, "text_wrap": True, "valign": "top"
-                }))
-                row += 2
-
-            # Key Deliverables
-            deliverables = summary.get("key_deliverables", [])
-            if deliverables and isinstance(deliverables, list):
-                ws_s.write(row, 0, "Key Deliverables", fmt_th)
-                deliverables_text = "\n".join([f"• {item}" for item in deliverables])
-                ws_s.write(row, 1, deliverables_text, wb.add_format({
-                    "border": 1, "text_wrap": True, "valign": "top"
-                }))
-                row += 2
-
-            # Success Criteria
-            success = summary.get("success_criteria", [])
-            if success and isinstance(success, list):
-                ws_s.write(row, 0, "Success Criteria", fmt_th)
-                success_text = "\n".join([f"• {item}" for item in success])
-                ws_s.write(row, 1, success_text, wb.add_format({
-                    "border": 1, "text_wrap": True, "valign": "top"
-                }))
-                row += 2
-
-            # Risks and Mitigation
-            risks = summary.get("risks_and_mitigation", [])
-            if risks and isinstance(risks, list) and len(risks) > 0:
-                ws_s.write(row, 0, "Risks & Mitigation", fmt_th)
-                ws_s.write(row, 1, "", fmt_th)
-                row += 1
-
-                # Create table for risks
-                risk_headers = ["Risk", "Mitigation Strategy"]
-                ws_s.write_row(row, 0, risk_headers, fmt_th)
-                row += 1
-
-                for risk_item in risks:
-                    if isinstance(risk_item, dict):
-                        zfmt = fmt_z1 if row % 2 else fmt_z2
-                        ws_s.write(row, 0, risk_item.get("risk", ""), zfmt)
-                        ws_s.write(row, 1, risk_item.get("mitigation", ""), zfmt)
-                        row += 1
-
-        wb.close()
-        buf.seek(0)
-        return buf
-
-    except Exception as e:
-        import traceback
-        out = io.BytesIO()
-        wb = xlsxwriter.Workbook(out)
-        ws = wb.add_worksheet("Error")
-        ws.write(0, 0, "Error generating Excel")
-        ws.write(1, 0, str(e))
-        ws.write(2, 0, traceback.format_exc())
-        wb.close()
-        out.seek(0)
-        return out
 # PDF EXPORT
+# Rendered PDFs keyed by content hash, bounded by total size (re-downloads of an
+# unchanged scope skip rendering entirely)
+PDF_LAYOUT_VERSION = 1
+_pdf_cache: LRUCache = LRUCache(maxsize=32 * 1024 * 1024, getsizeof=len)
+
 async def generate_pdf(scope: Dict[str, Any]) -> io.BytesIO:
     data = scope or {}
     logger.info(f"📄 Generating PDF with scope data keys: {list(data.keys())}")
     logger.info(f"  - Has architecture_diagram: {'architecture_diagram' in data}")
     logger.info(f"  - Has project_summary: {'project_summary' in data}")
-    currency = (data.get("overview", {}) or {}).get("Currency", "USD").upper()
-    symbol = "Rs. " if currency == "INR" else CURRENCY_SYMBOLS.get(currency, "$")
-
-    buf = io.BytesIO()
-    W, H = landscape(A4)
-    doc = SimpleDocTemplate(
-        buf, pagesize=(W * 1.1, H * 2),
-        leftMargin=1 * cm, rightMargin=1 * cm,
-        topMargin=1 * cm, bottomMargin=1 * cm
-    )
-
-    styles = getSampleStyleSheet()
-    wrap = styles["Normal"]
-    wrap.fontSize = 10     
-    wrap.leading = 12       
-    wrap.spaceAfter = 3
-    wrap.spaceBefore = 3
-
-    elems = []
-
-    # -------- Title --------
-    title_style = ParagraphStyle(
-        name="CenterHeading", fontSize=18, leading=22, alignment=TA_CENTER,
-        textColor=colors.HexColor("#333366"), spaceAfter=12, spaceBefore=12
-    )
-    project_name = data.get("overview", {}).get("Project Name", "Untitled Project")
-    elems.append(Paragraph(project_name, title_style))
 
-    # -------- Architecture Diagram --------
+    # Blob IO stays on the event loop; everything after it is CPU-bound
+    img_bytes = None
     arch_path = data.get("architecture_diagram")
     logger.info(f"🔍 Architecture diagram path in scope data: {arch_path}")
     if arch_path:
         try:
             logger.info(f"📊 Attempting to download architecture diagram from: {arch_path}")
-
             # Add timeout protection for blob download (15 seconds max)
-            import asyncio
-            try:
-                img_bytes = await asyncio.wait_for(
-                    azure_blob.download_bytes(arch_path),
-                    timeout=15.0
-                )
-            except asyncio.TimeoutError:
-                logger.warning(f"⏱️ Architecture diagram download timed out after 15s - skipping")
-                raise Exception("Blob download timeout")
-
-            if not img_bytes or len(img_bytes) == 0:
+            img_bytes = await asyncio.wait_for(
+                azure_blob.download_bytes_cached(arch_path),
+                timeout=15.0
+            )
+            if not img_bytes:
                 logger.warning(f"⚠️ Architecture diagram is empty - skipping")
-                raise Exception("Empty blob")
-
-            logger.info(f"✅ Downloaded architecture diagram: {len(img_bytes)} bytes")
-            img_buf = io.BytesIO(img_bytes)
-
-            # Section header
-            elems.append(Paragraph("<b>System Architecture</b>", styles["Heading2"]))
-
-            # ---- Improved image rendering with height constraint ----
-            img = RLImage(img_buf)
-
-            # Define maximum dimensions that fit within page
-            max_width = 780  # fits within current A4 landscape scaling
-            max_height = 1000  # leave room for margins and other content
-
-            # Calculate scaling to fit within both width and height constraints
-            width_scale = max_width / float(img.imageWidth)
-            height_scale = max_height / float(img.imageHeight)
-
-            # Use the smaller scale factor to ensure image fits both dimensions
-            scale = min(width_scale, height_scale)
-
-            new_width = img.imageWidth * scale
-            new_height = img.imageHeight * scale
-
-            img.drawWidth = new_width
-            img.drawHeight = new_height
-
-            # Left align cleanly using Table (ReportLab trick)
-            img_table = Table([[img]], colWidths=[new_width], hAlign="LEFT")
-            img_table.setStyle(TableStyle([
-                ("ALIGN", (0, 0), (-1, -1), "LEFT"),
-                ("VALIGN", (0, 0), (-1, -1), "TOP"),
-                ("LEFTPADDING", (0, 0), (-1, -1), 0),
-                ("RIGHTPADDING", (0, 0), (-1, -1), 0),
-                ("TOPPADDING", (0, 0), (-1, -1), 0),
-                ("BOTTOMPADDING", (0, 0), (-1, -1), 0),
-            ]))
-
-            elems.append(img_table)
-            elems.append(Spacer(1, 0.6 * cm))
-            logger.info(f"✅ Architecture diagram embedded successfully")
-
-        except Exception as e:
-            logger.error(f"❌ Failed to embed architecture diagram: {e}")
-            # Add a notice in PDF that diagram is unavailable
-            elems.append(Paragraph("<b>System Architecture</b>", styles["Heading2"]))
-            elems.append(Paragraph(
-                "<i>Architecture diagram unavailable (failed to load from storage)</i>",
-                wrap
-            ))
-            elems.append(Spacer(1, 0.6 * cm))
-
-    # -------- Overview --------
-    ov = data.get("overview", {})
-    if ov:
-        ov_rows = [["Field", "Value"]]
-        for k, v in ov.items():
-            # 🔹 Append "months" if key is Duration and value is a number
-            if isinstance(v, (int, float)) and k.strip().lower() == "duration":
-                display_val = f"{v} months"
             else:
-                display_val = str(v)
-            ov_rows.append([k, display_val])
-
-        tbl = Table(ov_rows, colWidths=[120, 720], repeatRows=1)
-        ts_ov = TableStyle([
-            ("GRID", (0, 0), (-1, -1), 0.5, colors.black),
-            ("BACKGROUND", (0, 0), (-1, 0), colors.HexColor(THEME["header_bg"])),
-            ("FONTNAME", (0, 0), (-1, -1), "Helvetica"),
-            ("FONTSIZE", (0, 0), (-1, -1), 10),
-            ("FONTNAME", (0, 0), (-1, 0), "Helvetica-Bold"),
-            ("VALIGN", (0, 0), (-1, -1), "TOP"),
-        ])
-
-        for i in range(1, len(ov_rows)):
-            ts_ov.add(
-                "BACKGROUND", (0, i), (-1, i),
-                colors.HexColor(THEME["zebra1" if i % 2 else "zebra2"])
-            )
+                logger.info(f"✅ Downloaded architecture diagram: {len(img_bytes)} bytes")
+        except asyncio.TimeoutError:
+            logger.warning(f"⏱️ Architecture diagram download timed out after 15s - skipping")
+        except Exception as e:
+            logger.error(f"❌ Failed to download architecture diagram: {e}")
 
-        tbl.setStyle(ts_ov)
-        tbl.hAlign = "LEFT"
-        elems.append(Paragraph("<b>Project Overview</b>", styles["Heading2"]))
-        elems.append(tbl)
-        elems.append(Spacer(1, 0.6 * cm))
-
-
-    # -------- Activities --------
-    activities = data.get("activities", [])
-    if activities:
-        headers = [
-            "ID", "Activities", "Description", "Owner",
-            "Resources", "Start Date", "End Date", "Effort Months"
-        ]
-        rows = [headers]
-        parsed = []
-        for idx, a in enumerate(activities, start=1):
-            try:
-                s = datetime.fromisoformat(a["Start Date"])
-                e = datetime.fromisoformat(a["End Date"])
-                parsed.append((a, s, e))
-            except Exception:
-                pass
-            rows.append([
-                idx,  # auto incremental ID
-                Paragraph(a.get("Activities", ""), wrap),
-                Paragraph(a.get("Description", ""), wrap),
-                Paragraph(a.get("Owner", ""), wrap),
-                Paragraph(a.get("Resources", ""), wrap),
-                a.get("Start Date", ""),
-                a.get("End Date", ""),
-                a.get("Effort Months", "")
-            ])
-
-        t = Table(rows, repeatRows=1,
-                  colWidths=[25, 150, 225, 100, 120, 70, 70, 80])
-        ts = TableStyle([
-            ("GRID", (0, 0), (-1, -1), 0.5, colors.black),
-            ("BACKGROUND", (0, 0), (-1, 0), colors.HexColor(THEME["header_bg"])),
-            ("FONTNAME", (0, 0), (-1, -1), "Helvetica"),
-            ("FONTSIZE", (0, 0), (-1, -1), 10),
-            ("FONTNAME", (0, 0), (-1, 0), "Helvetica-Bold"),
-        ])
-
-        for i in range(1, len(rows)):
-            ts.add("BACKGROUND", (0, i), (-1, i),
-                   colors.HexColor(THEME["zebra1" if i % 2 else "zebra2"]))
-        t.setStyle(ts)
-        t.hAlign = "LEFT"
-        elems.append(Paragraph("<b>Activities Breakdown</b>", styles["Heading2"]))
-        elems.append(t)
-        elems.append(Spacer(1, 0.6 * cm))
-
-        # ----- Gantt chart -----
-        if parsed:
-            parsed.sort(key=lambda x: x[1])
-            batches = [parsed[i:i + 20] for i in range(0, len(parsed), 20)]
-            for bi, batch in enumerate(batches, start=1):
-                min_s = min(s for _, s, _ in batch)
-                max_e = max(e for _, _, e in batch)
-                total_days = max(1, (max_e - min_s).days)
-                px_per_day = 620.0 / total_days
-                d = Drawing(780, (len(batch) * 20) + 80)
-                # Month grid
-                cur = datetime(min_s.year, min_s.month, 1)
-                while cur <= max_e:
-                    x = 80 + (cur - min_s).days * px_per_day
-                    d.add(Rect(x, 30, 0.5, len(batch) * 20 + 30,
-                               fillColor=colors.lightgrey, strokeColor=colors.lightgrey))
-                    d.add(String(x+2, 10, cur.strftime("%b %Y"),
-                                 fontSize=6, fillColor=colors.grey))
-                    cur = datetime(cur.year + (1 if cur.month == 12 else 0),
-                                   1 if cur.month == 12 else cur.month+1, 1)
-                # Bars
-                for i, (a, s, e) in enumerate(batch):
-                    y = 50 + i * 20
-                    x = 80 + (s - min_s).days * px_per_day
-                    w = max(1, (e - s).days) * px_per_day
-                    label = (a["Activities"] or "")[:35]
-                    d.add(Rect(x, y, w, 10, fillColor=colors.HexColor("#4D96FF")))
-                    d.add(String(x+w+4, y+2, label, fontSize=8))
-                elems.append(Paragraph("<b>Project Timeline</b>", styles["Heading2"]))
-                elems.append(d)
-                elems.append(Spacer(1, 0.6 * cm))
-                if bi < len(batches):
-                    elems.append(PageBreak())
-
-    # -------- Resourcing Plan --------
-    plan = data.get("resourcing_plan", [])
-    if plan and isinstance(plan[0], dict):
-        mkeys = [k for k in plan[0].keys() if len(k.split()) == 2]
+    key = _pdf_cache_key(data, img_bytes)
+    pdf = _pdf_cache.get(key)
+    if pdf is None:
+        pdf = await _run_in_export_pool(_pdf_bytes, data, img_bytes)
+        _pdf_cache[key] = pdf
     else:
-        mkeys = []
-
-    if plan:
-        merged = {}
-        for r in plan:
-            rk = r["Resources"].lower()
-            eff = float(r.get("Efforts", 0))
-            cost = float(r.get("Cost", eff * r.get("Rate/month", 2000)))
-            if rk not in merged:
-                merged[rk] = {
-                    "Resources": r["Resources"], "Efforts": eff,
-                    "Rate/month": r["Rate/month"], "Cost": cost,
-                    "months": [float(r.get(m, 0)) for m in mkeys]
-                }
-            else:
-                m = merged[rk]
-                m["Efforts"] += eff
-                m["Cost"] += cost
-                m["months"] = [
-                    x+y for x, y in zip(m["months"], [float(r.get(m, 0)) for m in mkeys])
-                ]
-
-        merged_res = sorted(merged.values(), key=lambda x: x["Cost"], reverse=True)
-
-        # Collect rows
-        tot_eff = tot_cost = 0
-        pie_labels, pie_vals = [], []
-        base_rows = []
-        for idx, r in enumerate(merged_res, start=1):
-            tot_eff += r["Efforts"]; tot_cost += r["Cost"]
-            pie_labels.append(r["Resources"]); pie_vals.append(r["Cost"])
-            base_rows.append([
-                idx,
-                Paragraph(r["Resources"], wrap),
-                f"{symbol}{r['Rate/month']:,.2f}",
-                *[f"{v:.2f}" for v in r["months"]], 
-                f"{r['Efforts']:.2f}",
-                f"{symbol}{r['Cost']:,.2f}"
-
-            ])
-
-        base_rows.append(
-        ["Total", "", ""] + [""]*len(mkeys) +
-        [f"{tot_eff:.2f}", f"{symbol}{tot_cost:,.2f}"]
-    )
-
-
-        # ---- Split into chunks if too wide ----
-        MAX_MONTH_COLS = 10
-        for start in range(0, len(mkeys), MAX_MONTH_COLS):
-            month_chunk = mkeys[start:start+MAX_MONTH_COLS]
-
-            sub_rows = []
-            for row in base_rows:
-                fixed = row[:3]
-                months = row[3:3+len(mkeys)]
-                end = row[-2:]
-                sub_months = months[start:start+MAX_MONTH_COLS]
-                sub_rows.append(fixed + sub_months + end)
-
-            header = ["ID", "Resources", "Rate/month"] + month_chunk + ["Efforts", "Cost"]
-            sub_rows.insert(0, header)
-
-            t2 = LongTable(sub_rows, repeatRows=1,
-                        colWidths=[40, 120, 70] + [55]*len(month_chunk) + [50, 80])
-            ts2 = TableStyle([
-                ("GRID", (0, 0), (-1, -1), 0.5, colors.black),
-                ("BACKGROUND", (0, 0), (-1, 0), colors.HexColor(THEME["header_bg"])),
-                ("FONTNAME", (0, 0), (-1, -1), "Helvetica"),
-                ("FONTSIZE", (0, 0), (-1, -1), 10),
-                ("FONTNAME", (0, 0), (-1, 0), "Helvetica-Bold"),
-                ("BACKGROUND", (0, len(sub_rows)-1), (-1, len(sub_rows)-1),
-                colors.HexColor(THEME["total_bg"]))
-            ])
-
-            for i in range(1, len(sub_rows)-1):
-                ts2.add("BACKGROUND", (0, i), (-1, i),
-                        colors.HexColor(THEME["zebra1" if i % 2 else "zebra2"]))
-            t2.setStyle(ts2)
-            t2.hAlign = "LEFT"
-
-            elems.append(Paragraph("<b>Resourcing Plan</b>", styles["Heading2"]))
-            elems.append(t2)
-            elems.append(Spacer(1, 0.6*cm))
-
-        # Pie chart
-        if pie_labels:
-            d2 = Drawing(400, 250)
-            pie = Pie()
-            pie.x, pie.y = 100, 20
-            pie.width, pie.height = 200, 200
-            pie.data = pie_vals
-            pie.labels = pie_labels
-            pal = THEME["palette"]
-            for i in range(len(pie.labels)):
-                pie.slices[i].fillColor = colors.HexColor(pal[i % len(pal)])
-            d2.add(pie)
-            elems.append(Paragraph("<b>Cost Projection</b>", styles["Heading2"]))
-            elems.append(Spacer(1, 0.6 * cm))
-            elems.append(d2)
-
-    # -------- Project Summary --------
-    summary = data.get("project_summary", {})
-    logger.info(f"📋 Project summary in scope data: {bool(summary)} (keys: {list(summary.keys()) if summary else 'None'})")
-    if summary and isinstance(summary, dict):
-        logger.info(f"✅ Adding Project Summary section to PDF")
-        elems.append(PageBreak())
-        elems.append(Paragraph("<b>Project Summary</b>", styles["Heading1"]))
-        elems.append(Spacer(1, 0.4 * cm))
-
-        # Executive Summary
-        exec_summary = summary.get("executive_summary", "")
-        if exec_summary:
-            elems.append(Paragraph("<b>Executive Summary</b>", styles["Heading2"]))
-            elems.append(Paragraph(exec_summary, wrap))
-            elems.append(Spacer(1, 0.4 * cm))
-
-        # Key Deliverables
-        deliverables = summary.get("key_deliverables", [])
-        if deliverables and isinstance(deliverables, list):
-            elems.append(Paragraph("<b>Key Deliverables</b>", styles["Heading2"]))
-            for item in deliverables:
-                elems.append(Paragraph(f"• {item}", wrap))
-            elems.append(Spacer(1, 0.4 * cm))
-
-        # Success Criteria
-        success = summary.get("success_criteria", [])
-        if success and isinstance(success, list):
-            elems.append(Paragraph("<b>Success Criteria</b>", styles["Heading2"]))
-            for item in success:
-                elems.append(Paragraph(f"• {item}", wrap))
-            elems.append(Spacer(1, 0.4 * cm))
-
-        # Risks and Mitigation
-        risks = summary.get("risks_and_mitigation", [])
-        if risks and isinstance(risks, list):
-            elems.append(Paragraph("<b>Risks and Mitigation Strategies</b>", styles["Heading2"]))
-            risk_rows = [["Risk", "Mitigation Strategy"]]
-            for risk_item in risks:
-                if isinstance(risk_item, dict):
-                    risk_rows.append([
-                        Paragraph(risk_item.get("risk", ""), wrap),
-                        Paragraph(risk_item.get("mitigation", ""), wrap)
-                    ])
-
-            if len(risk_rows) > 1:  # Only add table if there are risks
-                risk_table = Table(risk_rows, colWidths=[300, 400], repeatRows=1)
-                ts_risk = TableStyle([
-                    ("GRID", (0, 0), (-1, -1), 0.5, colors.black),
-                    ("BACKGROUND", (0, 0), (-1, 0), colors.HexColor(THEME["header_bg"])),
-                    ("FONTNAME", (0, 0), (-1, -1), "Helvetica"),
-                    ("FONTSIZE", (0, 0), (-1, -1), 10),
-                    ("FONTNAME", (0, 0), (-1, 0), "Helvetica-Bold"),
-                    ("VALIGN", (0, 0), (-1, -1), "TOP"),
-                ])
-
-                for i in range(1, len(risk_rows)):
-                    ts_risk.add("BACKGROUND", (0, i), (-1, i),
-                               colors.HexColor(THEME["zebra1" if i % 2 else "zebra2"]))
-
-                risk_table.setStyle(ts_risk)
-                risk_table.hAlign = "LEFT"
-                elems.append(risk_table)
-                elems.append(Spacer(1, 0.4 * cm))
-
-    # Build PDF
-    doc.build(elems)
-    buf.seek(0)
-    return buf
+        logger.info(f"♻️ Serving cached PDF ({len(pdf)} bytes)")
+    # The bytes stay resident in _pdf_cache anyway, so wrap them rather than copy
+    return io.BytesIO(pdf)
+
+
+def _pdf_cache_key(data: Dict[str, Any], img_bytes: bytes | None) -> bytes:
+    # Same scope + same diagram bytes -> same document; bump PDF_LAYOUT_VERSION
+    # whenever export_pdf changes its output so stale renders aren't served
+    h = hashlib.blake2b(digest_size=16)
+    h.update(PDF_LAYOUT_VERSION.to_bytes(2, "big"))
+    h.update(orjson.dumps(
+        data, default=str,
+        option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY,
+    ))
+    h.update(img_bytes or b"")
+    return h.digest()
+
+
+def _pdf_bytes(data: Dict[str, Any], img_bytes: bytes | None) -> bytes:
+    from app.utils.export_pdf import build_pdf
+    return build_pdf(data, img_bytes).getvalue()
@@ -0,0 +1,515 @@
+# app/utils/export_pdf.py
+# PDF renderer. Imported lazily from export._pdf_bytes inside export workers.
+from __future__ import annotations
+import io, logging
+from collections import defaultdict
+from datetime import datetime
+from functools import lru_cache
+from typing import Any, Dict
+
+from app.config import config
+
+# Attribute validation on every shape/widget assignment; only worth paying in DEBUG.
+# Must be set before reportlab.graphics.shapes is imported; it reads the flag once
+from reportlab import rl_config
+rl_config.shapeChecking = 1 if config.DEBUG else 0
+
+from reportlab.platypus import Image as RLImage
+from reportlab.lib.pagesizes import A4, landscape
+from reportlab.lib.units import cm
+from reportlab.lib import colors
+from reportlab.platypus import (
+    BaseDocTemplate, PageTemplate, Frame, Paragraph, Table, TableStyle,
+    Spacer, PageBreak, LongTable
+)
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.graphics.shapes import Drawing, Rect, String
+from reportlab.graphics.charts.piecharts import Pie
+from reportlab.lib.enums import TA_CENTER
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.pdfmetrics import stringWidth
+from app.utils.export import THEME, CURRENCY_SYMBOLS, _DATE_ERRORS, _parse_iso, normalize_risks
+
+logger = logging.getLogger(__name__)
+
+# Parsed once; HexColor is otherwise re-parsed for every table row
+HEADER_BG = colors.HexColor(THEME["header_bg"])
+ZEBRA1 = colors.HexColor(THEME["zebra1"])
+ZEBRA2 = colors.HexColor(THEME["zebra2"])
+TOTAL_BG = colors.HexColor(THEME["total_bg"])
+GANTT_BAR = colors.HexColor("#4D96FF")
+PALETTE_COLORS = [colors.HexColor(c) for c in THEME["palette"]]
+# Zebra stripes for ROWBACKGROUNDS starting at row 1: odd rows zebra1, even rows zebra2
+_ROW_CYCLE = [ZEBRA1, ZEBRA2]
+
+# Column widths (points) per table; _cell() uses the same values to decide wrapping
+_OV_COLWIDTHS = [120, 720]
+_ACT_COLWIDTHS = [25, 150, 225, 100, 120, 70, 70, 80]
+_RES_FIXED_COLWIDTHS = [40, 120, 70]
+_RES_MONTH_COLWIDTH = 55
+_RES_TAIL_COLWIDTHS = [50, 80]
+
+# Invariant part of the risk table style; the ROWBACKGROUNDS stripe is added per document
+_RISK_COLWIDTHS = [300, 400]
+_RISK_HEADER = ("Risk", "Mitigation Strategy")
+_RISK_TS_CMDS = [
+    ("GRID", (0, 0), (-1, -1), 0.5, colors.black),
+    ("BACKGROUND", (0, 0), (-1, 0), HEADER_BG),
+    ("FONTNAME", (0, 0), (-1, -1), "Helvetica"),
+    ("FONTSIZE", (0, 0), (-1, -1), 10),
+    ("FONTNAME", (0, 0), (-1, 0), "Helvetica-Bold"),
+    ("VALIGN", (0, 0), (-1, -1), "TOP"),
+]
+
+# Stylesheet is built once per process; body cells share one derived style
+_STYLES = getSampleStyleSheet()
+_BODY_STYLE = ParagraphStyle(
+    name="BodyWrap", parent=_STYLES["Normal"],
+    fontSize=10, leading=12, spaceAfter=3, spaceBefore=3
+)
+_TITLE_STYLE = ParagraphStyle(
+    name="CenterHeading", fontSize=18, leading=22, alignment=TA_CENTER,
+    textColor=colors.HexColor("#333366"), spaceAfter=12, spaceBefore=12
+)
+_H1 = _STYLES["Heading1"]
+_H2 = _STYLES["Heading2"]
+
+# Default Table cell padding (LEFTPADDING + RIGHTPADDING)
+_CELL_PAD = 12
+# Widest Helvetica glyph at 10pt ('@' is 1015/1000 em)
+_MAX_GLYPH_W = 10.2
+
+
+@lru_cache(maxsize=4096)
+def _fits_line(text: str, col_width: float) -> bool:
+    return stringWidth(text, "Helvetica", 10) <= col_width - _CELL_PAD
+
+
+def _cell(text: Any, col_width: float):
+    """
+    Table cell content: the raw string when it is plain text that fits on one
+    line of the column, otherwise a wrapping Paragraph. Raw strings skip the
+    Paragraph markup parser and line breaking entirely. Numbers and None never
+    need wrapping and are returned as plain strings.
+    """
+    if not isinstance(text, str):
+        return "" if text is None else str(text)
+    if not text:
+        return ""
+    if "<" in text or "&" in text or "\n" in text:
+        return _body_para(text)
+    # Short enough to fit even if every glyph were the widest one: skip measuring
+    if len(text) * _MAX_GLYPH_W <= col_width - _CELL_PAD or _fits_line(text, col_width):
+        return text
+    return _body_para(text)
+
+
+@lru_cache(maxsize=1024)
+def _body_frags(text: str) -> tuple:
+    return tuple(Paragraph(text, _BODY_STYLE).frags)
+
+
+def _body_para(text: str) -> Paragraph:
+    """
+    Body-style Paragraph. With PDF_PARAGRAPH_CACHE on, the parsed fragments of
+    repeated texts (canned risks/mitigations) are reused; each Paragraph gets
+    its own frag clones because layout mutates them.
+    """
+    if not config.PDF_PARAGRAPH_CACHE:
+        return Paragraph(text, _BODY_STYLE)
+    return Paragraph(text, _BODY_STYLE, frags=[f.clone() for f in _body_frags(text)])
+
+
+# Standard Type1 fonts the tables/paragraphs use (<b>, <i> included)
+_FONTS = ("Helvetica", "Helvetica-Bold", "Helvetica-Oblique", "Helvetica-BoldOblique")
+_FONTS_READY = False
+
+
+def ensure_fonts():
+    """Load font metrics once per process so the first render doesn't pay for it."""
+    global _FONTS_READY
+    if _FONTS_READY:
+        return
+    for name in _FONTS:
+        pdfmetrics.getFont(name)
+    _FONTS_READY = True
+
+
+class PDFExporter:
+    """
+    Renders scope PDFs. The page template (page size, margins, frame) is built
+    once and shared by every document this exporter produces; each render only
+    creates the output buffer, the doc wrapper and the flowables.
+    """
+
+    def __init__(self):
+        ensure_fonts()
+        W, H = landscape(A4)
+        self.pagesize = (W * 1.1, H * 2)
+        self.margin = 1 * cm
+        frame = Frame(
+            self.margin, self.margin,
+            self.pagesize[0] - 2 * self.margin, self.pagesize[1] - 2 * self.margin,
+            id="normal",
+        )
+        self._templates = [PageTemplate(id="Page", frames=[frame], pagesize=self.pagesize)]
+
+    def render(self, data: Dict[str, Any], img_bytes: bytes | None) -> io.BytesIO:
+        buf = io.BytesIO()
+        m = self.margin
+        doc = BaseDocTemplate(
+            buf, pagesize=self.pagesize, pageTemplates=self._templates,
+            leftMargin=m, rightMargin=m, topMargin=m, bottomMargin=m,
+        )
+        doc.build(_build_elems(data, img_bytes))
+        buf.seek(0)
+        return buf
+
+
+_EXPORTER: PDFExporter | None = None
+
+
+def build_pdf(data: Dict[str, Any], img_bytes: bytes | None) -> io.BytesIO:
+    """Lay out and render the PDF. Runs in an export worker process."""
+    global _EXPORTER
+    if _EXPORTER is None:
+        _EXPORTER = PDFExporter()
+    return _EXPORTER.render(data, img_bytes)
+
+
+def _build_elems(data: Dict[str, Any], img_bytes: bytes | None) -> list:
+    currency = (data.get("overview", {}) or {}).get("Currency", "USD").upper()
+    symbol = "Rs. " if currency == "INR" else CURRENCY_SYMBOLS.get(currency, "$")
+
+    body_style = _BODY_STYLE
+
+    elems = []
+
+    # -------- Title --------
+    project_name = data.get("overview", {}).get("Project Name", "Untitled Project")
+    elems.append(Paragraph(project_name, _TITLE_STYLE))
+
+    # -------- Architecture Diagram --------
+    if data.get("architecture_diagram"):
+        try:
+            if not img_bytes:
+                raise Exception("Diagram not available")
+            img_buf = io.BytesIO(img_bytes)
+
+            # Section header
+            elems.append(Paragraph("<b>System Architecture</b>", _H2))
+
+            # ---- Improved image rendering with height constraint ----
+            img = RLImage(img_buf)
+
+            # Define maximum dimensions that fit within page
+            max_width = 780  # fits within current A4 landscape scaling
+            max_height = 1000  # leave room for margins and other content
+
+            # Calculate scaling to fit within both width and height constraints
+            width_scale = max_width / float(img.imageWidth)
+            height_scale = max_height / float(img.imageHeight)
+
+            # Use the smaller scale factor to ensure image fits both dimensions
+            scale = min(width_scale, height_scale)
+
+            new_width = img.imageWidth * scale
+            new_height = img.imageHeight * scale
+
+            img.drawWidth = new_width
+            img.drawHeight = new_height
+
+            # Left align cleanly using Table (ReportLab trick)
+            img_table = Table([[img]], colWidths=[new_width], hAlign="LEFT")
+            img_table.setStyle(TableStyle([
+                ("ALIGN", (0, 0), (-1, -1), "LEFT"),
+                ("VALIGN", (0, 0), (-1, -1), "TOP"),
+                ("LEFTPADDING", (0, 0), (-1, -1), 0),
+                ("RIGHTPADDING", (0, 0), (-1, -1), 0),
+                ("TOPPADDING", (0, 0), (-1, -1), 0),
+                ("BOTTOMPADDING", (0, 0), (-1, -1), 0),
+            ]))
+
+            elems.append(img_table)
+            elems.append(Spacer(1, 0.6 * cm))
+            logger.info(f"✅ Architecture diagram embedded successfully")
+
+        except Exception as e:
+            logger.error(f"❌ Failed to embed architecture diagram: {e}")
+            # Add a notice in PDF that diagram is unavailable
+            elems.append(Paragraph("<b>System Architecture</b>", _H2))
+            elems.append(Paragraph(
+                "<i>Architecture diagram unavailable (failed to load from storage)</i>",
+                body_style
+            ))
+            elems.append(Spacer(1, 0.6 * cm))
+
+    # -------- Overview --------
+    ov = data.get("overview", {})
+    if ov:
+        ov_rows = [["Field", "Value"]]
+        for k, v in ov.items():
+            # 🔹 Append "months" if key is Duration and value is a number
+            if isinstance(v, (int, float)) and k.strip().lower() == "duration":
+                display_val = f"{v} months"
+            else:
+                display_val = str(v)
+            ov_rows.append([k, display_val])
+
+        tbl = Table(ov_rows, colWidths=_OV_COLWIDTHS, repeatRows=1)
+        ts_ov = TableStyle([
+            ("GRID", (0, 0), (-1, -1), 0.5, colors.black),
+            ("BACKGROUND", (0, 0), (-1, 0), HEADER_BG),
+            ("FONTNAME", (0, 0), (-1, -1), "Helvetica"),
+            ("FONTSIZE", (0, 0), (-1, -1), 10),
+            ("FONTNAME", (0, 0), (-1, 0), "Helvetica-Bold"),
+            ("VALIGN", (0, 0), (-1, -1), "TOP"),
+        ])
+
+        ts_ov.add("ROWBACKGROUNDS", (0, 1), (-1, -1), _ROW_CYCLE)
+
+        tbl.setStyle(ts_ov)
+        tbl.hAlign = "LEFT"
+        elems.append(Paragraph("<b>Project Overview</b>", _H2))
+        elems.append(tbl)
+        elems.append(Spacer(1, 0.6 * cm))
+
+
+    # -------- Activities --------
+    activities = data.get("activities", [])
+    if activities:
+        headers = [
+            "ID", "Activities", "Description", "Owner",
+            "Resources", "Start Date", "End Date", "Effort Months"
+        ]
+        rows = [headers]
+        parsed = []
+        aw = _ACT_COLWIDTHS
+        for idx, a in enumerate(activities, start=1):
+            try:
+                s = _parse_iso(a["Start Date"])
+                e = _parse_iso(a["End Date"])
+                parsed.append((a, s, e))
+            except _DATE_ERRORS:
+                pass
+            rows.append([
+                str(idx),  # auto incremental ID
+                _cell(a.get("Activities", ""), aw[1]),
+                _cell(a.get("Description", ""), aw[2]),
+                _cell(a.get("Owner", ""), aw[3]),
+                _cell(a.get("Resources", ""), aw[4]),
+                _cell(a.get("Start Date", ""), aw[5]),
+                _cell(a.get("End Date", ""), aw[6]),
+                _cell(a.get("Effort Months", ""), aw[7])
+            ])
+
+        t = LongTable(rows, repeatRows=1, splitByRow=1,
+                      colWidths=_ACT_COLWIDTHS)
+        ts = TableStyle([
+            ("GRID", (0, 0), (-1, -1), 0.5, colors.black),
+            ("BACKGROUND", (0, 0), (-1, 0), HEADER_BG),
+            ("FONTNAME", (0, 0), (-1, -1), "Helvetica"),
+            ("FONTSIZE", (0, 0), (-1, -1), 10),
+            ("FONTNAME", (0, 0), (-1, 0), "Helvetica-Bold"),
+        ])
+
+        ts.add("ROWBACKGROUNDS", (0, 1), (-1, -1), _ROW_CYCLE)
+        t.setStyle(ts)
+        t.hAlign = "LEFT"
+        elems.append(Paragraph("<b>Activities Breakdown</b>", _H2))
+        elems.append(t)
+        elems.append(Spacer(1, 0.6 * cm))
+
+        # ----- Gantt chart -----
+        if parsed:
+            parsed.sort(key=lambda x: x[1])
+            batches = [parsed[i:i + 20] for i in range(0, len(parsed), 20)]
+            for bi, batch in enumerate(batches, start=1):
+                min_s = min(s for _, s, _ in batch)
+                max_e = max(e for _, _, e in batch)
+                total_days = max(1, (max_e - min_s).days)
+                px_per_day = 620.0 / total_days
+                d = Drawing(780, (len(batch) * 20) + 80)
+                shapes = d.contents  # extend directly; Drawing.add re-validates each node
+                # Month grid: first day of every month from min_s's month up to max_e
+                grid_h = len(batch) * 20 + 30
+                span = (max_e.year - min_s.year) * 12 + max_e.month - min_s.month + 1
+                for k in range(min_s.month - 1, min_s.month - 1 + span):
+                    tick = datetime(min_s.year + k // 12, k % 12 + 1, 1)
+                    x = 80 + (tick - min_s).days * px_per_day
+                    shapes.extend((
+                        Rect(x, 30, 0.5, grid_h,
+                             fillColor=colors.lightgrey, strokeColor=colors.lightgrey),
+                        String(x+2, 10, tick.strftime("%b %Y"),
+                               fontSize=6, fillColor=colors.grey),
+                    ))
+                # Bars
+                for i, (a, s, e) in enumerate(batch):
+                    y = 50 + i * 20
+                    x = 80 + (s - min_s).days * px_per_day
+                    w = max(1, (e - s).days) * px_per_day
+                    label = (a["Activities"] or "")[:35]
+                    shapes.extend((
+                        Rect(x, y, w, 10, fillColor=GANTT_BAR),
+                        String(x+w+4, y+2, label, fontSize=8),
+                    ))
+                elems.append(Paragraph("<b>Project Timeline</b>", _H2))
+                elems.append(d)
+                elems.append(Spacer(1, 0.6 * cm))
+                if bi < len(batches):
+                    elems.append(PageBreak())
+
+    # -------- Resourcing Plan --------
+    plan = data.get("resourcing_plan", [])
+    if plan and isinstance(plan[0], dict):
+        mkeys = [k for k in plan[0].keys() if len(k.split()) == 2]
+    else:
+        mkeys = []
+
+    if plan:
+        # Merge duplicate roles (case-insensitive); first row wins for name and rate
+        merged = defaultdict(lambda: {
+            "Resources": None, "Efforts": 0.0, "Rate/month": 0.0,
+            "Cost": 0.0, "months": [0.0] * len(mkeys)
+        })
+        for r in plan:
+            eff = float(r.get("Efforts", 0))
+            cost = float(r.get("Cost", eff * r.get("Rate/month", 2000)))
+            acc = merged[r["Resources"].lower()]
+            if acc["Resources"] is None:
+                acc["Resources"] = r["Resources"]
+                acc["Rate/month"] = r["Rate/month"]
+            acc["Efforts"] += eff
+            acc["Cost"] += cost
+            months = acc["months"]
+            for i, mk in enumerate(mkeys):
+                months[i] += float(r.get(mk, 0))
+
+        merged_res = sorted(merged.values(), key=lambda x: x["Cost"], reverse=True)
+
+        # Collect rows
+        tot_eff = tot_cost = 0
+        pie_labels, pie_vals = [], []
+        base_rows = []
+        for idx, r in enumerate(merged_res, start=1):
+            tot_eff += r["Efforts"]; tot_cost += r["Cost"]
+            pie_labels.append(r["Resources"]); pie_vals.append(r["Cost"])
+            base_rows.append([
+                str(idx),
+                _cell(r["Resources"], _RES_FIXED_COLWIDTHS[1]),
+                f"{symbol}{r['Rate/month']:,.2f}",
+                *[f"{v:.2f}" for v in r["months"]], 
+                f"{r['Efforts']:.2f}",
+                f"{symbol}{r['Cost']:,.2f}"
+
+            ])
+
+        base_rows.append(
+        ["Total", "", ""] + [""]*len(mkeys) +
+        [f"{tot_eff:.2f}", f"{symbol}{tot_cost:,.2f}"]
+    )
+
+
+        # ---- Split into chunks if too wide ----
+        MAX_MONTH_COLS = 10
+        for start in range(0, len(mkeys), MAX_MONTH_COLS):
+            month_chunk = mkeys[start:start+MAX_MONTH_COLS]
+
+            sub_rows = []
+            for row in base_rows:
+                fixed = row[:3]
+                months = row[3:3+len(mkeys)]
+                end = row[-2:]
+                sub_months = months[start:start+MAX_MONTH_COLS]
+                sub_rows.append(fixed + sub_months + end)
+
+            header = ["ID", "Resources", "Rate/month"] + month_chunk + ["Efforts", "Cost"]
+            sub_rows.insert(0, header)
+
+            t2 = LongTable(sub_rows, repeatRows=1,
+                        colWidths=_RES_FIXED_COLWIDTHS + [_RES_MONTH_COLWIDTH]*len(month_chunk) + _RES_TAIL_COLWIDTHS)
+            ts2 = TableStyle([
+                ("GRID", (0, 0), (-1, -1), 0.5, colors.black),
+                ("BACKGROUND", (0, 0), (-1, 0), HEADER_BG),
+                ("FONTNAME", (0, 0), (-1, -1), "Helvetica"),
+                ("FONTSIZE", (0, 0), (-1, -1), 10),
+                ("FONTNAME", (0, 0), (-1, 0), "Helvetica-Bold"),
+                ("BACKGROUND", (0, len(sub_rows)-1), (-1, len(sub_rows)-1),
+                TOTAL_BG)
+            ])
+
+            # Total row keeps its own background
+            ts2.add("ROWBACKGROUNDS", (0, 1), (-1, -2), _ROW_CYCLE)
+            t2.setStyle(ts2)
+            t2.hAlign = "LEFT"
+
+            elems.append(Paragraph("<b>Resourcing Plan</b>", _H2))
+            elems.append(t2)
+            elems.append(Spacer(1, 0.6*cm))
+
+        # Pie chart
+        if pie_labels:
+            d2 = Drawing(400, 250)
+            pie = Pie()
+            pie.x, pie.y = 100, 20
+            pie.width, pie.height = 200, 200
+            pie.data = pie_vals
+            pie.labels = pie_labels
+            for i in range(len(pie.labels)):
+                pie.slices[i].fillColor = PALETTE_COLORS[i % len(PALETTE_COLORS)]
+            d2.add(pie)
+            elems.append(Paragraph("<b>Cost Projection</b>", _H2))
+            elems.append(Spacer(1, 0.6 * cm))
+            elems.append(d2)
+
+    # -------- Project Summary --------
+    summary = data.get("project_summary", {})
+    logger.info(f"📋 Project summary in scope data: {bool(summary)} (keys: {list(summary.keys()) if summary else 'None'})")
+    if summary and isinstance(summary, dict):
+        logger.info(f"✅ Adding Project Summary section to PDF")
+        elems.append(PageBreak())
+        elems.append(Paragraph("<b>Project Summary</b>", _H1))
+        elems.append(Spacer(1, 0.4 * cm))
+
+        # Executive Summary
+        exec_summary = summary.get("executive_summary", "")
+        if exec_summary:
+            elems.append(Paragraph("<b>Executive Summary</b>", _H2))
+            elems.append(Paragraph(exec_summary, body_style))
+            elems.append(Spacer(1, 0.4 * cm))
+
+        # Key Deliverables
+        deliverables = summary.get("key_deliverables", [])
+        if deliverables and isinstance(deliverables, list):
+            elems.append(Paragraph("<b>Key Deliverables</b>", _H2))
+            for item in deliverables:
+                elems.append(Paragraph(f"• {item}", body_style))
+            elems.append(Spacer(1, 0.4 * cm))
+
+        # Success Criteria
+        success = summary.get("success_criteria", [])
+        if success and isinstance(success, list):
+            elems.append(Paragraph("<b>Success Criteria</b>", _H2))
+            for item in success:
+                elems.append(Paragraph(f"• {item}", body_style))
+            elems.append(Spacer(1, 0.4 * cm))
+
+        # Risks and Mitigation (section skipped entirely when no renderable risks)
+        items = normalize_risks(summary.get("risks_and_mitigation"))
+        if items:
+            elems.append(Paragraph("<b>Risks and Mitigation Strategies</b>", _H2))
+            w_risk, w_mit = _RISK_COLWIDTHS
+            risk_rows = [None] * (len(items) + 1)
+            risk_rows[0] = _RISK_HEADER
+            for i, rk in enumerate(items, 1):
+                risk_rows[i] = (_cell(rk.risk, w_risk), _cell(rk.mitigation, w_mit))
+
+            risk_table = Table(risk_rows, colWidths=_RISK_COLWIDTHS, repeatRows=1)
+            ts_risk = TableStyle(_RISK_TS_CMDS)
+            ts_risk.add("ROWBACKGROUNDS", (0, 1), (-1, -1), _ROW_CYCLE)
+            risk_table.setStyle(ts_risk)
+            risk_table.hAlign = "LEFT"
+            elems.append(risk_table)
+            elems.append(Spacer(1, 0.4 * cm))
+
+    return elems
@@ -0,0 +1,332 @@
+# app/utils/export_xlsx.py
+# Excel renderer. Imported lazily from export._xlsx_bytes inside export workers.
+from __future__ import annotations
+import io
+from typing import Any, Dict
+import xlsxwriter
+from app.utils.export import THEME, CURRENCY_SYMBOLS, _DATE_ERRORS, _parse_iso, normalize_risks
+
+# Output-size estimate for the xlsx buffer (a small scope is ~16 KiB)
+XLSX_BASE_BYTES = 32 * 1024
+XLSX_ROW_BYTES = 512
+
+# Column order of the text cells on the Activities sheet (dates follow in F/G)
+ACTIVITY_KEYS = ("ID", "Activities", "Description", "Owner", "Resources")
+
+
+def build_xlsx(scope: Dict[str, Any]) -> io.BytesIO:
+    try:
+        from xlsxwriter.utility import xl_col_to_name
+        data = scope
+        overview_data = data.get("overview") or {}
+        activities = data.get("activities") or []
+        plan = data.get("resourcing_plan") or []
+        # Seed the buffer near the expected size so the zip writer doesn't keep
+        # regrowing it; truncated to the real length after close()
+        n_rows = len(activities) + len(plan)
+        buf = io.BytesIO(bytearray(XLSX_BASE_BYTES + XLSX_ROW_BYTES * n_rows))
+        # constant_memory is deliberately not used: xlsxwriter ignores it when in_memory
+        # is set, and add_table() (needed for the Activities/Resources formula columns
+        # that feed the Gantt chart and totals) returns -3 in that mode.
+        wb = xlsxwriter.Workbook(buf, {"in_memory": True})
+        currency = overview_data.get("Currency", "USD").upper()
+        symbol = CURRENCY_SYMBOLS.get(currency, "$")
+
+
+        # ---------- Formats ----------
+        fmt_th = wb.add_format({
+            "bold": True, "bg_color": THEME["header_bg"],
+            "border": 1, "align": "center", "text_wrap": True
+        })
+        fmt_z1 = wb.add_format({"border": 1, "bg_color": THEME["zebra1"]})
+        fmt_z2 = wb.add_format({"border": 1, "bg_color": THEME["zebra2"]})
+        fmt_date = wb.add_format({"border": 1, "num_format": "yyyy-mm-dd"})
+        fmt_num = wb.add_format({"border": 1, "num_format": "0.00"})
+        fmt_money = wb.add_format({
+            "border": 1,
+            "num_format": f'"{symbol}"#,##0.00'
+        })
+
+        fmt_total = wb.add_format({"bold": True, "border": 1, "bg_color": THEME["total_bg"]})
+        fmt_wrap_top = wb.add_format({"border": 1, "text_wrap": True, "valign": "top"})
+        title_format = wb.add_format({
+            "bold": True, "font_size": 14, "bg_color": THEME["header_bg"],
+            "border": 1, "align": "left"
+        })
+
+        # --------- Overview ----------
+        ws_ov = wb.add_worksheet("Overview")
+        ws_ov.write_row("A1", ["Field", "Value"], fmt_th)
+
+        # Include discount information if present
+        discount_pct = data.get("discount_percentage", 0)
+
+        # Emit each Field/Value record as one row (numeric row/col, no A1 parsing)
+        for i, (k, v) in enumerate(overview_data.items(), start=2):
+            ws_ov.write_row(i - 1, 0, (k, str(v)), fmt_z1 if i % 2 else fmt_z2)
+
+        # Add discount row if discount was applied
+        if discount_pct and isinstance(discount_pct, (int, float)) and discount_pct > 0:
+            next_row = len(overview_data) + 2
+            ws_ov.write_row(
+                next_row - 1, 0,
+                ("Discount Applied", f"{discount_pct}% discount applied to all costs"),
+                fmt_z1 if next_row % 2 else fmt_z2,
+            )
+
+        ws_ov.set_column("A:A", 20)
+        ws_ov.set_column("B:B", 100)
+
+        # -------- Activities ----------
+        ws_a = wb.add_worksheet("Activities")
+        headers = [
+            "ID", "Activities", "Description", "Owner",
+            "Resources", "Start Date", "End Date", "Effort (months)", "DurationTemp"
+        ]
+        ws_a.write_row("A1", headers, fmt_th)
+
+        ws_a.set_column("A:A", 5)
+        ws_a.set_column("B:B", 25) 
+        ws_a.set_column("C:D", 30)  
+        ws_a.set_column("E:E", 20)  
+        ws_a.set_column("F:I", 15)   
+
+        starts, ends = [], []
+        write_row, write_dt, write_blank = ws_a.write_row, ws_a.write_datetime, ws_a.write_blank
+        zebra = (fmt_z2, fmt_z1)
+        for r, a in enumerate(activities, start=2):
+            write_row(r-1, 0, [a.get(k) for k in ACTIVITY_KEYS], zebra[r % 2])
+            try:
+                s = _parse_iso(a["Start Date"])
+                write_dt(r-1, 5, s, fmt_date)
+                starts.append(s)
+            except _DATE_ERRORS:
+                write_blank(r-1, 5, None, fmt_date)
+            try:
+                e = _parse_iso(a["End Date"])
+                write_dt(r-1, 6, e, fmt_date)
+                ends.append(e)
+            except _DATE_ERRORS:
+                write_blank(r-1, 6, None, fmt_date)
+
+        last_a = len(activities) + 1
+
+        # Column Formulas
+        if activities:
+            ws_a.add_table(
+                f"A1:I{last_a}",
+                {
+                    "name": "ActivitiesTable",
+                    "columns": [
+                        {"header": h} if h not in ("Effort (months)", "DurationTemp") else (
+                            {
+                                "header": "Effort (months)",
+                                "formula": (
+                                    'IF(AND([@[Start Date]]<>"",[@[End Date]]<>""),'
+                                    '([@[End Date]]-[@[Start Date]])/30,"")'
+                                )
+                            } if h == "Effort (months)" else
+                            {
+                                "header": "DurationTemp",
+                                "formula": (
+                                    'IF(AND([@[Start Date]]<>"",[@[End Date]]<>""),'
+                                    '[@[End Date]]-[@[Start Date]],"")'
+                                ),
+                                "format": fmt_num
+                            }
+                        )
+                        for h in headers
+                    ],
+                    "style": "Table Style Medium 2",
+                    "autofilter": True
+                }
+            )
+
+            # ------- Gantt chart --------
+            if starts and ends:
+                gantt = wb.add_chart({"type": "bar", "subtype": "stacked"})
+                gantt.add_series({
+                    "name": "Start",
+                    "categories": f"='Activities'!$B$2:$B${last_a}",
+                    "values": f"='Activities'!$F$2:$F${last_a}",  
+                    "fill": {"none": True},
+                    "border": {"none": True}
+                })
+                gantt.add_series({
+                    "name": "Duration",
+                    "categories": f"='Activities'!$B$2:$B${last_a}", 
+                    "values": f"='Activities'!$I$2:$I${last_a}",  
+                    "fill": {"color": "#4D96FF"},
+                    "border": {"color": "#4D96FF"}
+                })
+
+                gantt.set_title({"name": "Project Gantt Chart"})
+                gantt.set_x_axis({
+                    "date_axis": True,
+                    "num_format": "mmm yyyy",
+                    "major_unit": 30,
+                    "major_unit_type": "days"
+                })
+                gantt.set_y_axis({"reverse": True})
+                gantt.set_legend({"none": True})
+
+                ws_a.insert_chart("K1", gantt, {"x_scale": 2.2, "y_scale": 1.6})
+
+
+        # -------- Resources Plan --------
+        ws_r = wb.add_worksheet("Resources Plan")
+        if plan:
+            month_keys = [k for k in plan[0] if len(k.split()) == 2]
+            res_headers = ["Resources", "Rate/month"] + month_keys + ["Efforts", "Cost"]
+            ws_r.write_row("A1", res_headers, fmt_th)
+            ws_r.set_column("A:A", 25)
+            ws_r.set_column("B:B", 12)
+            for i in range(2, 2 + len(month_keys)):
+                ws_r.set_column(i, i, 10)
+            ws_r.set_column(2 + len(month_keys), 2 + len(month_keys), 10)
+            ws_r.set_column(3 + len(month_keys), 3 + len(month_keys), 14)
+
+            write, write_number, write_row = ws_r.write, ws_r.write_number, ws_r.write_row
+            zebra = (fmt_z2, fmt_z1)
+            for r, row in enumerate(plan, start=2):
+                write(r-1, 0, row["Resources"], zebra[r % 2])
+                write_number(r-1, 1, row.get("Rate/month", 2000.0), fmt_money)
+                write_row(r-1, 2, [row.get(m, 0.0) for m in month_keys], fmt_num)
+
+            last_r = len(plan) + 1
+
+            # Table
+            ws_r.add_table(
+                f"A1:{xl_col_to_name(len(res_headers)-1)}{last_r}",
+                {
+                    "name": "ResourcesTable",
+                    "columns": [
+                        {"header": h} if h not in ("Efforts", "Cost") else (
+                            {
+                                "header": "Efforts",
+                                "formula": "+".join(f"[@[{m}]]" for m in month_keys)
+                            } if h == "Efforts" else
+                            {
+                                "header": "Cost",
+                                "formula": "=[@Efforts]*[@[Rate/month]]"
+                            }
+                        )
+                        for h in res_headers
+                    ],
+                    "style": "Table Style Medium 2",
+                    "autofilter": True,
+                    "total_row": True
+                }
+            )
+
+            # Formulas
+            efforts_col = 2 + len(month_keys)
+            cost_col = 3 + len(month_keys)
+            efforts_letter = xl_col_to_name(efforts_col)
+            cost_letter = xl_col_to_name(cost_col)
+
+            # Same per-row formula for every resource, only the row number changes.
+            # Kept alongside the table column formulas: the total row overlays the
+            # last data row, so explicit cell formulas are still needed there.
+            month_cols = [xl_col_to_name(j) for j in range(2, 2+len(month_keys))]
+            sum_template = "=" + "+".join(f"{c}{{r}}" for c in month_cols)
+            cost_template = f"=B{{r}}*{efforts_letter}{{r}}"
+            write_formula = ws_r.write_formula
+            for r in range(2, last_r+1):
+                write_formula(r-1, efforts_col, sum_template.format(r=r), fmt_num)
+                write_formula(r-1, cost_col, cost_template.format(r=r), fmt_money)
+
+            # Totals
+            for c in range(len(res_headers)):
+                if c == 0:
+                    ws_r.write(last_r, c, "Total", fmt_total)
+                else:
+                    ws_r.write_blank(last_r, c, None, fmt_total)
+            ws_r.write_formula(
+                last_r, efforts_col,
+                f"=SUBTOTAL(109,{efforts_letter}2:{efforts_letter}{last_r})",
+                fmt_total
+            )
+            ws_r.write_formula(
+                last_r, cost_col,
+                f"=SUBTOTAL(109,{cost_letter}2:{cost_letter}{last_r})",
+                fmt_total
+            )
+
+            # Pie chart
+            pie = wb.add_chart({"type": "pie"})
+            pie.add_series({
+                "categories": f"='Resources Plan'!$A$2:$A${last_r}",
+                "values": f"='Resources Plan'!${cost_letter}$2:${cost_letter}${last_r}",
+                "data_labels": {"percentage": True, "value": True, "category": True}
+            })
+            pie.set_title({"name": "Cost by Role"})
+            ws_r.insert_chart("M1", pie, {"x_scale": 1.5, "y_scale": 1.5})
+
+        # -------- Project Summary --------
+        summary = data.get("project_summary", {})
+        if summary and isinstance(summary, dict):
+            ws_s = wb.add_worksheet("Project Summary")
+            ws_s.set_column("A:A", 25)
+            ws_s.set_column("B:B", 100)
+
+            # Add title
+            ws_s.merge_range("A1:B1", "Project Summary", title_format)
+
+            row = 2
+
+            # Executive Summary
+            exec_summary = summary.get("executive_summary", "")
+            if exec_summary:
+                ws_s.write(row, 0, "Executive Summary", fmt_th)
+                ws_s.write(row, 1, exec_summary, fmt_wrap_top)
+                row += 2
+
+            # Key Deliverables
+            deliverables = summary.get("key_deliverables", [])
+            if deliverables and isinstance(deliverables, list):
+                ws_s.write(row, 0, "Key Deliverables", fmt_th)
+                deliverables_text = "\n".join([f"• {item}" for item in deliverables])
+                ws_s.write(row, 1, deliverables_text, fmt_wrap_top)
+                row += 2
+
+            # Success Criteria
+            success = summary.get("success_criteria", [])
+            if success and isinstance(success, list):
+                ws_s.write(row, 0, "Success Criteria", fmt_th)
+                success_text = "\n".join([f"• {item}" for item in success])
+                ws_s.write(row, 1, success_text, fmt_wrap_top)
+                row += 2
+
+            # Risks and Mitigation
+            risks = summary.get("risks_and_mitigation", [])
+            if risks and isinstance(risks, list) and len(risks) > 0:
+                ws_s.write(row, 0, "Risks & Mitigation", fmt_th)
+                ws_s.write(row, 1, "", fmt_th)
+                row += 1
+
+                # Create table for risks
+                risk_headers = ["Risk", "Mitigation Strategy"]
+                ws_s.write_row(row, 0, risk_headers, fmt_th)
+                row += 1
+
+                for rk in normalize_risks(risks):
+                    ws_s.write_row(row, 0, rk, fmt_z1 if row % 2 else fmt_z2)
+                    row += 1
+
+        wb.close()
+        buf.truncate()
+        buf.seek(0)
+        return buf
+
+    except Exception as e:
+        import traceback
+        out = io.BytesIO()
+        wb = xlsxwriter.Workbook(out)
+        ws = wb.add_worksheet("Error")
+        ws.write(0, 0, "Error generating Excel")
+        ws.write(1, 0, str(e))
+        ws.write(2, 0, traceback.format_exc())
+        wb.close()
+        out.seek(0)
+        return out
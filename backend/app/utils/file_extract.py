@@ -0,0 +1,54 @@
+# app/utils/file_extract.py
+# Text extraction for uploaded RFP files. Runs inside extraction worker processes
+# (see scope_engine._extract_text_from_files), so keep this module free of app
+# state and network clients - it only turns bytes into text.
+import logging
+import openpyxl, pytesseract
+from io import BytesIO
+from pdfminer.high_level import extract_text as extract_pdf_text
+from docx import Document
+from pptx import Presentation
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+
+def extract_text(blob_bytes: bytes, suffix: str, file_name: str) -> str:
+    """Extract plain text from one file's bytes, picking the parser by extension."""
+    content = ""
+    try:
+        if suffix == ".pdf":
+            content = extract_pdf_text(BytesIO(blob_bytes))
+
+        elif suffix == ".docx":
+            doc = Document(BytesIO(blob_bytes))
+            content = "\n".join(p.text for p in doc.paragraphs)
+
+        elif suffix == ".pptx":
+            prs = Presentation(BytesIO(blob_bytes))
+            texts = []
+            for slide in prs.slides:
+                for shape in slide.shapes:
+                    if hasattr(shape, "text"):
+                        texts.append(shape.text)
+            content = "\n".join(texts)
+
+        elif suffix in [".xlsx", ".xlsm"]:
+            wb = openpyxl.load_workbook(BytesIO(blob_bytes))
+            sheet = wb.active
+            content = "\n".join(
+                " ".join(str(cell) if cell else "" for cell in row)
+                for row in sheet.iter_rows(values_only=True)
+            )
+
+        elif suffix in [".png", ".jpg", ".jpeg", ".tiff"]:
+            img = Image.open(BytesIO(blob_bytes))
+            content = pytesseract.image_to_string(img)
+
+        else:
+            content = blob_bytes.decode("utf-8", errors="ignore")
+
+    except Exception as e:
+        logger.warning(f"Extraction failed for {file_name}: {e}")
+
+    return content.strip()
@@ -0,0 +1,138 @@
+# app/utils/llm_cache.py
+# Response cache for expensive Ollama generations (scope JSON, architecture DOT).
+# Tier 1: exact prompt (SHA-256). Tier 2: a stored prompt of the same kind whose
+# embedding has cosine similarity >= the threshold. Tier 2 is only safe when kind is
+# already narrowed to one draft/project (the regeneration plan cache); full scope and
+# architecture prompts pass threshold=0. Only responses that passed the caller's
+# validation are stored.
+from __future__ import annotations
+import asyncio
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+import numpy as np
+from functools import lru_cache
+
+from app.config.config import (
+    LLM_CACHE_DB,
+    LLM_CACHE_TTL,
+    LLM_CACHE_SIM_THRESHOLD,
+    LLM_CACHE_MAX_ROWS,
+)
+from app.utils.ai_clients import embed_text_ollama
+
+logger = logging.getLogger(__name__)
+
+_db_lock = threading.Lock()
+
+
+@lru_cache(maxsize=1)
+def _get_db() -> sqlite3.Connection:
+    conn = sqlite3.connect(LLM_CACHE_DB, check_same_thread=False, timeout=5)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS llm_cache ("
+        " sha256 TEXT PRIMARY KEY, kind TEXT NOT NULL, model TEXT NOT NULL,"
+        " created_at REAL NOT NULL, vec BLOB, response TEXT NOT NULL)"
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS ix_llm_cache_kind ON llm_cache (kind, model, created_at)")
+    conn.commit()
+    return conn
+
+
+def _prompt_key(kind: str, model: str, prompt: str) -> str:
+    return hashlib.sha256(f"{kind}\0{model}\0{prompt}".encode("utf-8")).hexdigest()
+
+
+async def _prompt_vector(prompt: str) -> np.ndarray | None:
+    vectors = await embed_text_ollama([prompt])
+    if not vectors or not vectors[0]:
+        return None
+    vec = np.asarray(vectors[0], dtype=np.float32)
+    norm = float(np.linalg.norm(vec))
+    return vec / norm if norm else None
+
+
+def _lookup_exact(key: str) -> str | None:
+    with _db_lock:
+        row = _get_db().execute(
+            "SELECT response FROM llm_cache WHERE sha256 = ? AND created_at > ?",
+            (key, time.time() - LLM_CACHE_TTL),
+        ).fetchone()
+    return row[0] if row else None
+
+
+def _lookup_similar(kind: str, model: str, vec: np.ndarray, threshold: float) -> str | None:
+    with _db_lock:
+        rows = _get_db().execute(
+            "SELECT vec, response FROM llm_cache WHERE kind = ? AND model = ? AND created_at > ? AND vec IS NOT NULL",
+            (kind, model, time.time() - LLM_CACHE_TTL),
+        ).fetchall()
+
+    # Stored vectors are unit-normalised, so the dot product is the cosine similarity
+    rows = [r for r in rows if len(r[0]) == vec.nbytes]
+    if not rows:
+        return None
+    matrix = np.frombuffer(b"".join(r[0] for r in rows), dtype=np.float32).reshape(len(rows), -1)
+    sims = matrix @ vec
+    best = int(np.argmax(sims))
+    if sims[best] >= threshold:
+        logger.info(f"♻️ LLM cache semantic hit ({kind}, cosine={sims[best]:.3f})")
+        return rows[best][1]
+    return None
+
+
+def _store(kind: str, model: str, key: str, vec: np.ndarray | None, response: str) -> None:
+    with _db_lock:
+        conn = _get_db()
+        conn.execute(
+            "INSERT OR REPLACE INTO llm_cache VALUES (?, ?, ?, ?, ?, ?)",
+            (key, kind, model, time.time(), vec.tobytes() if vec is not None else None, response),
+        )
+        # Drop expired rows and keep the table (and the semantic scan) bounded
+        conn.execute("DELETE FROM llm_cache WHERE created_at <= ?", (time.time() - LLM_CACHE_TTL,))
+        conn.execute(
+            "DELETE FROM llm_cache WHERE sha256 IN ("
+            " SELECT sha256 FROM llm_cache ORDER BY created_at DESC LIMIT -1 OFFSET ?)",
+            (LLM_CACHE_MAX_ROWS,),
+        )
+        conn.commit()
+
+
+async def get(kind: str, model: str, prompt: str, threshold: float | None = None) -> str | None:
+    """
+    Cached response for this prompt (exact, then semantic), or None. threshold
+    overrides LLM_CACHE_SIM_THRESHOLD for this lookup (0 = exact only).
+    """
+    if not LLM_CACHE_DB:
+        return None
+    key = _prompt_key(kind, model, prompt)
+    threshold = LLM_CACHE_SIM_THRESHOLD if threshold is None else threshold
+    try:
+        cached = await asyncio.to_thread(_lookup_exact, key)
+        if cached is not None or threshold <= 0:
+            return cached
+        # Only an exact miss pays for the prompt embedding
+        vec = await _prompt_vector(prompt)
+        if vec is None:
+            return None
+        return await asyncio.to_thread(_lookup_similar, kind, model, vec, threshold)
+    except Exception as e:
+        logger.warning(f"⚠️ LLM cache lookup failed: {e}")
+        return None
+
+
+async def put(kind: str, model: str, prompt: str, response: str, threshold: float | None = None) -> None:
+    """Store a validated response for this prompt (threshold as passed to get())."""
+    if not LLM_CACHE_DB:
+        return
+    key = _prompt_key(kind, model, prompt)
+    threshold = LLM_CACHE_SIM_THRESHOLD if threshold is None else threshold
+    try:
+        # Same text as in get(), so this is served by the embedding caches
+        vec = await _prompt_vector(prompt) if threshold > 0 else None
+        await asyncio.to_thread(_store, kind, model, key, vec, response)
+    except Exception as e:
+        logger.warning(f"⚠️ LLM cache write failed: {e}")
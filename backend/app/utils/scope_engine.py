@@ -1,25 +1,33 @@
 # app/utils/scope_engine.py
 from __future__ import annotations
-import json, re, logging, math, os, tempfile,anyio,pytesseract, openpyxl,tiktoken, pytz, graphviz,requests
+import json, orjson, re, hashlib, logging, math, os,anyio,tiktoken, pytz, httpx, asyncio, multiprocessing, subprocess, contextlib
 from app import models
-from calendar import monthrange
-from pdfminer.high_level import extract_text as extract_pdf_text
-from docx import Document
-from pptx import Presentation
-from io import BytesIO
-from PIL import Image
+import numpy as np
+from cachetools import LRUCache, TTLCache
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from app.config import config
 from app.config.config import QDRANT_COLLECTION
-from typing import Dict, Any, List
+from functools import lru_cache
+from typing import Callable, Dict, Any, List
 from datetime import datetime, timedelta
-from app.utils import azure_blob
+from app.utils import azure_blob, llm_cache
+from app.utils.file_extract import extract_text
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import select, or_, func
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.orm import selectinload
+from qdrant_client.http import models as qmodels
+from azure.core.exceptions import ResourceModifiedError
 from app.utils.ai_clients import (
     get_llm_client,
     get_embed_client,
     get_qdrant_client,
+    get_http_client,
     embed_text_ollama,
+    minhash_signature,
 )
 
 
@@ -28,18 +36,131 @@ logger = logging.getLogger(__name__)
 # Init AI services
 llm_cfg = get_llm_client()
 embed_cfg = get_embed_client()
-qdrant = get_qdrant_client()
 
-def ollama_chat(prompt: str, model: str = llm_cfg["model"], temperature: float = 0.7) -> str:
-    """Call Ollama to generate text from a prompt."""
+def _ollama_options(temperature: float, **overrides: Any) -> Dict[str, Any]:
+    # Sampling/runtime settings must go under "options"; top-level keys are ignored
+    options = {
+        "temperature": temperature,
+        "num_ctx": config.OLLAMA_NUM_CTX,
+        "num_batch": config.OLLAMA_NUM_BATCH,
+    }
+    if config.OLLAMA_NUM_THREAD > 0:
+        options["num_thread"] = config.OLLAMA_NUM_THREAD
+    options.update({k: v for k, v in overrides.items() if v is not None})
+    return options
+
+
+class _JsonObjectEnd:
+    """
+    Streaming stop condition for ollama_chat: fed each response piece, returns True once
+    the first complete top-level JSON object has arrived (after any <think> block), so
+    the trailing fence/explanation is never generated. Brace runs that don't parse as a
+    JSON object (e.g. "{placeholder}" in prose) are skipped.
+    """
+
+    def __init__(self):
+        self._pre = ""          # text before the object starts
+        self._think_done = False
+        self._obj: List[str] = []
+        self._depth = 0
+        self._in_str = False
+        self._esc = False
+
+    def __call__(self, piece: str) -> bool:
+        if not self._obj:
+            self._pre += piece
+            if not self._think_done:
+                head = self._pre.lstrip()
+                if "<think>".startswith(head):
+                    return False  # could still be the opening tag
+                if head.startswith("<think>"):
+                    end = self._pre.find("</think>")
+                    if end < 0:
+                        return False
+                    self._pre = self._pre[end + len("</think>"):]
+                self._think_done = True
+            start = self._pre.find("{")
+            if start < 0:
+                return False
+            piece, self._pre = self._pre[start:], ""
+        return self._scan(piece)
+
+    def _scan(self, text: str) -> bool:
+        for i, ch in enumerate(text):
+            if self._in_str:
+                if self._esc:
+                    self._esc = False
+                elif ch == "\\":
+                    self._esc = True
+                elif ch == '"':
+                    self._in_str = False
+            elif ch == '"':
+                self._in_str = True
+            elif ch == "{":
+                self._depth += 1
+            elif ch == "}":
+                self._depth -= 1
+                if self._depth == 0:
+                    candidate = "".join(self._obj) + text[: i + 1]
+                    try:
+                        if isinstance(orjson.loads(candidate), dict):
+                            return True
+                    except orjson.JSONDecodeError:
+                        pass
+                    # Not the object we're after: look for the next one
+                    self._obj, self._in_str, self._esc = [], False, False
+                    return self(text[i + 1:])
+        self._obj.append(text)
+        return False
+
+
+async def ollama_chat(
+    prompt: str,
+    model: str = llm_cfg["model"],
+    temperature: float = 0.7,
+    stop_when: Callable[[str], bool] | None = None,
+    format: Dict[str, Any] | str | None = None,
+    **options: Any,
+) -> str:
+    """
+    Call Ollama to generate text from a prompt (shared keep-alive client, no thread hop).
+    The response is streamed, so tokens are consumed as they are generated instead of
+    waiting for one large body, and the read timeout applies between chunks.
+    stop_when is fed every piece; when it returns True the stream is closed, which
+    makes Ollama stop generating (e.g. _JsonObjectEnd() once the JSON is complete).
+    format ("json" or a JSON Schema) constrains the output (Ollama structured outputs).
+    Extra keyword arguments are passed through as Ollama options (num_predict, top_p, stop...).
+    """
+    pieces: List[str] = []
+    body = {
+        "model": model, "prompt": prompt, "stream": True,
+        "options": _ollama_options(temperature, **options),
+        "keep_alive": config.OLLAMA_KEEP_ALIVE,
+    }
+    if format is not None:
+        body["format"] = format
     try:
-        resp = requests.post(
+        async with get_http_client().stream(
+            "POST",
             f"{llm_cfg['host']}/api/generate",
-            json={"model": model, "prompt": prompt, "temperature": temperature, "stream": False},
-        )
-        resp.raise_for_status()
-        data = resp.json()
-        return data.get("response", "").strip()
+            json=body,
+            timeout=httpx.Timeout(config.OLLAMA_GENERATE_TIMEOUT, connect=10),
+        ) as resp:
+            resp.raise_for_status()
+            async for line in resp.aiter_lines():
+                if not line:
+                    continue
+                chunk = orjson.loads(line)
+                if "error" in chunk:
+                    raise RuntimeError(chunk["error"])
+                piece = chunk.get("response", "")
+                pieces.append(piece)
+                if chunk.get("done"):
+                    break
+                if stop_when is not None and piece and stop_when(piece):
+                    logger.info("✂️ Stopping generation early: response is complete")
+                    break
+        return "".join(pieces).strip()
     except Exception as e:
         logger.error(f"Ollama chat failed: {e}")
         return ""
@@ -69,22 +190,77 @@ ROLE_RATE_MAP: Dict[str, float] = {
 }
 
 #  helpers
+# Patterns used by the LLM-output parsers, compiled once
+_FENCE_RE = re.compile(r"```(?:json)?(.*?)```", re.DOTALL | re.IGNORECASE)
+_HEADER_RE = re.compile(r"^(#+\s*)?([A-Z][A-Za-z\s&/]+):?$")
+_NUM_PREFIX_RE = re.compile(r"^\d+[\).\s]+")
+_HASH_PREFIX_RE = re.compile(r"^#+\s*")
+# DOT sanitization (generate_architecture)
+_DOT_FENCE_RE = re.compile(r"```[a-zA-Z]*")
+_DOT_GRAPH_RE = re.compile(r"(?i)^graph\s")
+_DOT_CTRL_RE = re.compile(r"[^\x09\x0A\x0D\x20-\x7E]")
+# Instruction parsing (regenerate_from_instructions)
+_REMOVE_ROLE_RE = re.compile(r"remove\s+([a-zA-Z\s]+?)(?:\s*(?:from|,|\.|\band\b|$))", re.IGNORECASE)
+_DISCOUNT_RES = [
+    re.compile(p, re.IGNORECASE)
+    for p in (
+        r"(\d+(?:\.\d+)?)\s*%\s*discount",
+        r"discount\s+(?:of\s+)?(\d+(?:\.\d+)?)\s*%",
+        r"apply\s+(\d+(?:\.\d+)?)\s*%",
+        r"give\s+(\d+(?:\.\d+)?)\s*%",
+    )
+]
+_WORD_RE = re.compile(r"[a-z]+")
+_NUMBER_RE = re.compile(r"\d+(?:\.\d+)?")
+_REMOVAL_KEYWORDS = frozenset({"remove", "delete"})
+_DISCOUNT_KEYWORDS = frozenset({"discount", "reduction", "reduce cost"})
+# Every instruction keyword the regeneration paths branch on, found in one pass
+# (substring matches, like the `in` checks they replace)
+_INSTRUCTION_KW_RE = re.compile(
+    r"remove|delete|discount|reduction|reduce cost|add|split|merge|optimi[sz]e|rebalance"
+)
+# "activity 3", "activities 2 and 4", "activity #5, 6"
+_ACTIVITY_REF_RE = re.compile(r"\bactivit(?:y|ies)\s+(#?\d+(?:\s*(?:,|and|&)\s*#?\d+)*)")
+# Activity names that are really role names (a common LLM mistake)
+_COMMON_ROLES = frozenset({
+    "project manager", "business analyst", "data architect", "data engineer",
+    "backend developer", "frontend developer", "qa engineer", "devops engineer",
+    "cloud architect", "data analyst", "ux designer",
+})
+_JSON_DECODER = json.JSONDecoder()
+
+
+def _instruction_keywords(instructions_lower: str) -> set:
+    """Keywords from _INSTRUCTION_KW_RE present in the (lowercased) instructions."""
+    return {m.replace("optimise", "optimize") for m in _INSTRUCTION_KW_RE.findall(instructions_lower)}
+
+
 def _strip_code_fences(s: str) -> str:
-    m = re.search(r"```(?:json)?(.*?)```", s, flags=re.DOTALL | re.IGNORECASE)
+    m = _FENCE_RE.search(s)
     return m.group(1) if m else s
 
+def _dump_json(obj: Any) -> bytes:
+    """Pretty-printed UTF-8 JSON for blob uploads."""
+    return orjson.dumps(obj, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
+
+
 def _extract_json(s: str) -> dict:
-    raw = _strip_code_fences(s or "")
+    raw = _strip_code_fences(s or "").strip()
+    # Well-formed output (the common case) goes through orjson; anything it rejects
+    # (prose around the object, NaN, ...) falls through to the lenient path below
     try:
-        return json.loads(raw.strip())
-    except Exception:
-        start, end = raw.find("{"), raw.rfind("}")
-        if start >= 0 and end > start:
-            try:
-                return json.loads(raw[start:end+1])
-            except Exception:
-                return {}
-        return {}
+        return orjson.loads(raw)
+    except orjson.JSONDecodeError:
+        pass
+    # raw_decode parses the first complete JSON value and ignores anything after it,
+    # so prose before/after the object (models ignoring "no prose") costs one pass
+    start = 0 if raw.startswith("[") else raw.find("{")
+    while start >= 0:
+        try:
+            return _JSON_DECODER.raw_decode(raw, start)[0]
+        except ValueError:
+            start = raw.find("{", start + 1)
+    return {}
     
 
 
@@ -106,98 +282,81 @@ async def get_rate_map_for_project(db: AsyncSession, project) -> Dict[str, float
     Falls back to Sigmoid default rates if none exist
     """
     try:
-        # If project has company_id, try fetching company-specific rate cards
-        if getattr(project, "company_id", None):
-            result = await db.execute(
-                select(models.RateCard)
-                .filter(models.RateCard.company_id == project.company_id)
-            )
-            ratecards = result.scalars().all()
-            if ratecards:
-                return {r.role_name: float(r.monthly_rate) for r in ratecards}
-
-        sigmoid_result = await db.execute(
-            select(models.Company).filter(models.Company.name == "Sigmoid")
+        # Project company and Sigmoid rate cards in one round-trip; pick in Python
+        company_id = getattr(project, "company_id", None)
+        match = models.Company.name == "Sigmoid"
+        if company_id:
+            match = or_(models.Company.id == company_id, match)
+        result = await db.execute(
+            select(models.RateCard.company_id, models.RateCard.role_name, models.RateCard.monthly_rate)
+            .join(models.Company, models.RateCard.company_id == models.Company.id)
+            .where(match)
         )
-        sigmoid = sigmoid_result.scalars().first()
-        if sigmoid:
-            result = await db.execute(
-                select(models.RateCard)
-                .filter(models.RateCard.company_id == sigmoid.id)
-            )
-            sigmoid_rates = result.scalars().all()
-            if sigmoid_rates:
-                return {r.role_name: float(r.monthly_rate) for r in sigmoid_rates}
+
+        company_rates: Dict[str, float] = {}
+        sigmoid_rates: Dict[str, float] = {}
+        for cid, role_name, monthly_rate in result.all():
+            target = company_rates if company_id and cid == company_id else sigmoid_rates
+            target[role_name] = float(monthly_rate)
+
+        if company_rates:
+            return company_rates
+        if sigmoid_rates:
+            return sigmoid_rates
 
     except Exception as e:
         logger.warning(f"Failed to fetch rate cards: {e}")
     return ROLE_RATE_MAP
 
 
-async def _extract_text_from_files(files: List[dict]) -> str:
-    results: List[str] = []
+# OCR and PDF parsing are CPU-bound and hold the GIL for most of their runtime,
+# so uploads are extracted in worker processes (one file per worker). Created on
+# first use; "spawn" for the same reason as the export pool. Slow disks can still
+# bottleneck large bundles - this only parallelizes the parsing.
+_EXTRACT_POOL: ProcessPoolExecutor | None = None
 
-    async def _extract_single(f: dict) -> None:
-        try:
-            blob_bytes = await azure_blob.download_bytes(f["file_path"])
-            suffix = os.path.splitext(f["file_name"])[-1].lower()
 
-            def process_file() -> str:
-                content = ""
-                try:
-                    if suffix == ".pdf":
-                        with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
-                            tmp.write(blob_bytes)
-                            tmp_path = tmp.name
-                        try:
-                            content = extract_pdf_text(tmp_path)
-                        finally:
-                            os.remove(tmp_path)
-
-                    elif suffix == ".docx":
-                        doc = Document(BytesIO(blob_bytes))
-                        content = "\n".join(p.text for p in doc.paragraphs)
-
-                    elif suffix == ".pptx":
-                        prs = Presentation(BytesIO(blob_bytes))
-                        texts = []
-                        for slide in prs.slides:
-                            for shape in slide.shapes:
-                                if hasattr(shape, "text"):
-                                    texts.append(shape.text)
-                        content = "\n".join(texts)
-
-                    elif suffix in [".xlsx", ".xlsm"]:
-                        wb = openpyxl.load_workbook(BytesIO(blob_bytes))
-                        sheet = wb.active
-                        content = "\n".join(
-                            " ".join(str(cell) if cell else "" for cell in row)
-                            for row in sheet.iter_rows(values_only=True)
-                        )
-
-                    elif suffix in [".png", ".jpg", ".jpeg", ".tiff"]:
-                        img = Image.open(BytesIO(blob_bytes))
-                        content = pytesseract.image_to_string(img)
-
-                    else:
-                        with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
-                            tmp.write(blob_bytes)
-                            tmp_path = tmp.name
-                        try:
-                            with open(tmp_path, "r", encoding="utf-8", errors="ignore") as fh:
-                                content = fh.read()
-                        finally:
-                            os.remove(tmp_path)
+def _get_extract_pool() -> ProcessPoolExecutor:
+    global _EXTRACT_POOL
+    if _EXTRACT_POOL is None:
+        _EXTRACT_POOL = ProcessPoolExecutor(
+            max_workers=config.EXTRACT_PROCESSES,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _EXTRACT_POOL
 
-                except Exception as e:
-                    logger.warning(f"Extraction failed for {f['file_name']}: {e}")
 
-                return content.strip()
+async def _run_in_extract_pool(fn, *args):
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(_get_extract_pool(), fn, *args)
+    except BrokenProcessPool:
+        # A worker died (e.g. OOM on a huge scan); start a fresh pool next time
+        global _EXTRACT_POOL
+        logger.error("❌ Extraction worker pool broke - recreating on next upload")
+        _EXTRACT_POOL = None
+        raise
+
+
+# Files downloaded at once per extraction call; parsing is further bounded by the pool size
+EXTRACT_DOWNLOAD_CONCURRENCY = 8
+
+
+async def _extract_text_from_files(files: List[dict]) -> str:
+    # One slot per file so the joined text keeps upload order, whatever finishes first
+    results: List[str] = [""] * len(files)
+    download_slots = anyio.Semaphore(EXTRACT_DOWNLOAD_CONCURRENCY)
+
+    async def _extract_single(i: int, f: dict) -> None:
+        try:
+            async with download_slots:
+                blob_bytes = await azure_blob.download_bytes(f["file_path"])
+            suffix = os.path.splitext(f["file_name"])[-1].lower()
 
-            text = await anyio.to_thread.run_sync(process_file)
+            text = await _run_in_extract_pool(extract_text, blob_bytes, suffix, f["file_name"])
 
             if text:
-                results.append(text)
+                results[i] = text
             else:
                 logger.warning(f"Extracted no text from {f['file_name']}")
 
@@ -205,96 +364,295 @@ async def _extract_text_from_files(files: List[dict]) -> str:
             logger.warning(f"Failed to extract {f.get('file_name')} (path={f.get('file_path')}): {e}")
 
     async with anyio.create_task_group() as tg:
-        for f in files:
-            tg.start_soon(_extract_single, f)
+        for i, f in enumerate(files):
+            tg.start_soon(_extract_single, i, f)
+
+    return "\n\n".join(t for t in results if t)
 
-    return "\n\n".join(results)
 
+# Only the payload fields the prompts use; quantized collections are searched on the
+# int8 vectors and the oversampled candidates rescored with the originals
+_RAG_PAYLOAD_FIELDS = ["chunk_id", "parent_id", "chunk", "title"]
+_RAG_SEARCH_PARAMS = qmodels.SearchParams(
+    quantization=qmodels.QuantizationSearchParams(rescore=True, oversampling=2.0),
+)
 
-def _rag_retrieve(query: str, k: int = 5) -> List[Dict]:
+
+async def _rag_retrieve(query: str, k: int = 5) -> List[Dict]:
     """
     Retrieve semantically similar chunks from Qdrant for RAG.
     Uses Ollama embedding model and returns list of matched chunks.
     Skips retrieval if no valid embedding found.
     """
+    return await _rag_retrieve_many([query], k)
+
+
+# Retrieval results keyed by a digest of (queries, k); regenerating the same
+# project skips the embed call and vector search. Results are shared, read-only.
+_rag_cache: TTLCache | None = TTLCache(maxsize=256, ttl=config.RAG_CACHE_TTL) if config.RAG_CACHE_TTL > 0 else None
+
+
+def _rag_cache_key(queries: List[str], k: int) -> bytes:
+    h = hashlib.blake2b(digest_size=16)
+    h.update(f"{QDRANT_COLLECTION}\0{k}".encode("utf-8"))
+    for q in queries:
+        h.update(b"\0" + q.encode("utf-8"))
+    return h.digest()
+
+
+async def _rag_retrieve_many(queries: List[str], k: int = 5) -> List[Dict]:
+    """
+    Retrieve for several queries at once: all queries are embedded in a single
+    /api/embed call, hits are de-duplicated by chunk id (best score wins) and the
+    top k overall are returned, grouped by parent_id like _rag_retrieve.
+    """
+    # Drop empty / repeated queries (e.g. no RFP text, or name == domain)
+    queries = list(dict.fromkeys(q for q in queries if q and q.strip()))
+    if not queries:
+        return []
+
+    cache_key = _rag_cache_key(queries, k)
+    if _rag_cache is not None and cache_key in _rag_cache:
+        logger.info("♻️ Reusing cached KB retrieval")
+        return _rag_cache[cache_key]
+
     try:
-        q_emb_list = embed_text_ollama([query])
+        q_emb_list = await embed_text_ollama(queries)
 
         # Skip if no valid embeddings returned
-        if not q_emb_list or not q_emb_list[0]:
+        if not q_emb_list or not any(q_emb_list):
             logger.warning("⚠️ No valid embedding generated — skipping Qdrant retrieval.")
             return []
 
-        q_emb = q_emb_list[0]
-
-        # Sanity check vector dimension
-        if not isinstance(q_emb, list) or len(q_emb) == 0:
-            logger.warning("⚠️ Empty embedding vector — skipping retrieval.")
-            return []
-
         client = get_qdrant_client()
-        results = client.search(
-            collection_name=QDRANT_COLLECTION,
-            query_vector=q_emb,
-            limit=k,
-            with_payload=True
-        )
+        # chunk_id -> (parent_id, chunk); the chunk dicts are what gets returned
+        best: Dict[str, tuple] = {}
+        for q_emb in q_emb_list:
+            # Sanity check vector dimension
+            if not isinstance(q_emb, list) or len(q_emb) == 0:
+                logger.warning("⚠️ Empty embedding vector — skipping retrieval.")
+                continue
+
+            results = client.search(
+                collection_name=QDRANT_COLLECTION,
+                query_vector=q_emb,
+                limit=k,
+                with_payload=_RAG_PAYLOAD_FIELDS,
+                search_params=_RAG_SEARCH_PARAMS,
+            )
 
-        hits = []
-        for r in results:
-            payload = r.payload or {}
-            hits.append({
-                "id": payload.get("chunk_id", str(r.id)),
-                "parent_id": payload.get("parent_id"),
-                "content": payload.get("chunk", ""),
-                "title": payload.get("title", ""),
-                "score": r.score,
-            })
+            for r in results:
+                payload = r.payload or {}
+                chunk_id = payload.get("chunk_id", str(r.id))
+                seen = best.get(chunk_id)
+                if seen is not None and seen[1]["score"] >= r.score:
+                    continue
+                best[chunk_id] = (payload.get("parent_id"), {
+                    "id": chunk_id,
+                    "content": payload.get("chunk", ""),
+                    "title": payload.get("title", ""),
+                    "score": r.score,
+                })
 
         # Group by parent_id for consistency
-        grouped = {}
-        for h in hits:
-            grouped.setdefault(h["parent_id"], []).append({
-                "id": h["id"],
-                "content": h["content"],
-                "title": h["title"],
-                "score": h["score"],
-            })
+        grouped = defaultdict(list)
+        for parent_id, chunk in sorted(best.values(), key=lambda h: h[1]["score"], reverse=True)[:k]:
+            grouped[parent_id].append(chunk)
 
-        return [
+        kb_results = [
             {"parent_id": pid, "chunks": chs}
             for pid, chs in grouped.items()
         ]
+        # Empty results may come from skipped embeddings; retry those next time
+        if kb_results and _rag_cache is not None:
+            _rag_cache[cache_key] = kb_results
+        return kb_results
 
     except Exception as e:
         logger.warning(f"RAG retrieval (Qdrant) failed: {e}")
         return []
 
-def _build_scope_prompt(rfp_text: str, kb_chunks: List[str], project=None, questions_context: str | None = None) -> str:
-    import tiktoken
 
+def _merge_rag_results(*results: List[Dict], k: int = 5) -> List[Dict]:
+    """Merge grouped _rag_retrieve results: de-duplicate chunks (best score wins), keep the top k."""
+    best: Dict[str, tuple] = {}
+    for groups in results:
+        for group in groups:
+            for chunk in group["chunks"]:
+                seen = best.get(chunk["id"])
+                if seen is None or chunk["score"] > seen[1]["score"]:
+                    best[chunk["id"]] = (group["parent_id"], chunk)
+
+    grouped = defaultdict(list)
+    for parent_id, chunk in sorted(best.values(), key=lambda h: h[1]["score"], reverse=True)[:k]:
+        grouped[parent_id].append(chunk)
+    return [{"parent_id": pid, "chunks": chs} for pid, chs in grouped.items()]
+
+
+KB_NEAR_DUP_THRESHOLD = 0.9
+
+
+def _dedupe_kb_chunks(kb_results: List[Dict]) -> List[str]:
+    """
+    Flatten grouped RAG results into chunk texts, best score first, dropping exact
+    duplicates (content digest) and near-duplicates (MinHash similarity >=
+    KB_NEAR_DUP_THRESHOLD) so repeated RFP/KB sections don't spend prompt tokens twice.
+    """
+    chunks = sorted(
+        (ch for group in kb_results for ch in group["chunks"]),
+        key=lambda ch: ch["score"], reverse=True,
+    )
+    seen_digests = set()
+    kept: List[str] = []
+    kept_sigs: List[np.ndarray] = []
+    for ch in chunks:
+        content = ch["content"]
+        if not content:
+            continue
+        digest = hashlib.blake2b(content.encode("utf-8"), digest_size=8).digest()
+        if digest in seen_digests:
+            continue
+        seen_digests.add(digest)
+        sig = minhash_signature(content)
+        if kept_sigs and (np.stack(kept_sigs) == sig).mean(axis=1).max() >= KB_NEAR_DUP_THRESHOLD:
+            continue
+        kept.append(content)
+        kept_sigs.append(sig)
+    return kept
+
+
+# Scope-generation instructions. Kept byte-identical across calls and placed before
+# every per-request field, so Ollama can reuse the KV cache for this whole prefix.
+_SCOPE_STATIC = (
+    "You are an expert AI project planner.\n"
+    "Use the RFP/project text as the **primary source** \n"
+    "Use questions and answers to clarify ambiguities.\n"
+    "but enrich missing fields with the Knowledge Base context (if relevant).\n"
+    "Return ONLY valid JSON (no prose, no markdown, no commentary).\n\n"
+    "Output schema:\n"
+    "{\n"
+    '  "overview": {\n'
+    '    "Project Name": string,\n'
+    '    "Domain": string,\n'
+    '    "Complexity": string,\n'
+    '    "Tech Stack": string,\n'
+    '    "Use Cases": string,\n'
+    '    "Compliance": string,\n'
+    '    "Duration": number\n'
+    "  },\n"
+    '  "activities": [\n'
+    '    {\n'
+    '      "ID": int,\n'
+    '      "Activities": string,\n'
+    '      "Description": string | null,\n'
+    '      "Owner": string | null,\n'
+    '      "Resources": string | null,\n'
+    '      "Start Date": "yyyy-mm-dd",\n'
+    '      "End Date": "yyyy-mm-dd",\n'
+    '      "Effort Months": number\n'
+    "    }\n"
+    "  ],\n"
+    '  "resourcing_plan": [],\n'
+    '  "project_summary": {\n'
+    '    "executive_summary": string (2-3 paragraphs overview),\n'
+    '    "key_deliverables": [string] (list of 5-7 main deliverables),\n'
+    '    "success_criteria": [string] (list of 3-5 success metrics),\n'
+    '    "risks_and_mitigation": [{"risk": string, "mitigation": string}] (3-4 key risks)\n'
+    "  }\n"
+    "}\n\n"
+    "Scheduling Rules: \n"
+    "- The first activity must always start today (the date given as Today below).\n"
+    "- If two activities are **independent**, overlap their timelines by **70–80%** of their duration (not full overlap)."
+    "- If one activity **depends** on another, allow a small overlap of **10-15%** near the end of the predecessor if feasible."
+    "- Avoid full serialization unless strictly required by dependency."
+    "- Avoid full parallelism where all tasks start together — stagger independent ones by **5-10%**."
+    "- Ensure overall project duration stays **≤ 12 months**."
+    "- Auto-calculate **End Date = Start Date + Effort Months**.\n"
+    "- Auto-calculate **overview.Duration** as the total span in months from the earliest Start Date to the latest End Date.\n"
+    "- `Complexity` should be simple, medium, or large based on duration of project.\n"
+    "- **Always assign at least one Resource**."
+    "- Distinguish `Owner` (responsible lead role) and `Resources` (supporting roles)."
+    "- `Owner` and `Resources` must be valid IT roles (e.g., Backend Developer, AI Engineer, QA Engineer, etc.)."
+    "- `Owner` is always a role who manages that particular activity (not a personal name).\n"
+    "- `Resources` must contain only roles which are required for that particular activity, distinct from `Owner`.\n"
+    "- If `Resources` is missing, fallback to the same `Owner` role.\n"
+    "- Use less resources as much as possible.\n"
+    "- Effort Months should be small numbers 0.5 to 1.5 months (inclusive).\n"
+    "- IDs must start from 1 and increment sequentially.\n"
+    "- If the RFP or Knowledge Base text lacks detail, infer the missing pieces logically."
+    "- Include all relevant roles and activities that ensure delivery of the project scope."
+    "- Keep all field names exactly as in the schema.\n"
+    "- Generate a comprehensive project_summary with:\n"
+    "  * executive_summary: 2-3 paragraph high-level overview of the project, objectives, and expected outcomes\n"
+    "  * key_deliverables: List 5-7 concrete deliverables (e.g., 'Production-ready web application', 'API documentation', etc.)\n"
+    "  * success_criteria: List 3-5 measurable success metrics (e.g., '99.9% uptime', 'Response time < 200ms', etc.)\n"
+    "  * risks_and_mitigation: List 3-4 key risks with mitigation strategies (e.g., risk: 'Third-party API dependency', mitigation: 'Implement fallback mechanisms')\n"
+)
+
+# Per-request part of the scope prompt, appended after _SCOPE_STATIC (one .format call)
+_SCOPE_DYNAMIC = (
+    "\n---\nDYNAMIC CONTEXT:\n"
+    "Today: {today_str}\n\n"
+    "{user_context}"
+    "RFP / Project Files Content:\n{rfp_text}\n\n"
+    "Knowledge Base Context (for enrichment only):\n{kb_context}\n"
+    "Clarification Q&A (User-confirmed answers take highest priority)\n"
+    "Use these answers to override or clarify any ambiguous or conflicting information.\n"
+    "Do NOT hallucinate beyond these facts.\n\n"
+    "{questions_context}\n"
+)
+
+
+@lru_cache(maxsize=1)
+def get_tokenizer() -> tiktoken.Encoding:
+    """cl100k_base encoder, loaded once per process (first load may fetch the BPE file)."""
+    return tiktoken.get_encoding("cl100k_base")
+
+
+# Token counts of recently budgeted KB chunks; generate_project_scope and
+# _build_scope_prompt both budget the same chunks, so the second pass is free
+_TOKENIZER_THREADS = os.cpu_count() or 8
+_chunk_token_counts: LRUCache = LRUCache(maxsize=4096)
+
+
+def _count_tokens(chunks: List[str]) -> np.ndarray:
+    counts = {c: _chunk_token_counts.get(c) for c in chunks}
+    missing = [c for c, n in counts.items() if n is None]
+    if missing:
+        # One Rust-side batch call for everything not seen before
+        encoded = get_tokenizer().encode_ordinary_batch(missing, num_threads=_TOKENIZER_THREADS)
+        for c, tokens in zip(missing, encoded):
+            counts[c] = _chunk_token_counts[c] = len(tokens)
+    return np.fromiter((counts[c] for c in chunks), dtype=np.int64, count=len(chunks))
+
+
+def _fit_token_budget(chunks: List[str], used_tokens: int, max_total_tokens: int) -> tuple[List[str], int]:
+    """Longest prefix of chunks that fits in the remaining budget, and the new token total."""
+    if not chunks:
+        return [], used_tokens
+    lengths = _count_tokens(chunks)
+    totals = np.cumsum(lengths) + used_tokens
+    cut = int(np.searchsorted(totals, max_total_tokens, side="right"))
+    return chunks[:cut], int(totals[cut - 1]) if cut else used_tokens
+
+
+def _build_scope_prompt(rfp_text: str, kb_chunks: List[str], project=None, questions_context: str | None = None) -> str:
     # Tokenizer
-    tokenizer = tiktoken.get_encoding("cl100k_base")
+    tokenizer = get_tokenizer()
     # Safe token budget (128k, keep ~4k for completion & system messages)
     context_limit = 128000
     max_total_tokens = context_limit - 4000
     used_tokens = 0
 
     # Trim RFP text
-    rfp_tokens = tokenizer.encode(rfp_text or "")
+    rfp_tokens = tokenizer.encode_ordinary(rfp_text or "")
     if len(rfp_tokens) > 3000:
         rfp_tokens = rfp_tokens[:3000]
     rfp_text = tokenizer.decode(rfp_tokens)
     used_tokens += len(rfp_tokens)
 
     # Trim KB context
-    safe_kb_chunks = []
-    for ch in kb_chunks or []:
-        tokens = tokenizer.encode(ch)
-        if used_tokens + len(tokens) > max_total_tokens:
-            break
-        safe_kb_chunks.append(ch)
-        used_tokens += len(tokens)
+    safe_kb_chunks, used_tokens = _fit_token_budget(kb_chunks or [], used_tokens, max_total_tokens)
 
     kb_context = "\n\n".join(safe_kb_chunks) if safe_kb_chunks else "(no KB context found)"
 
@@ -321,101 +679,24 @@ def _build_scope_prompt(rfp_text: str, kb_chunks: List[str], project=None, quest
 
     today_str = datetime.today().date().isoformat()
 
-    return (
-        "You are an expert AI project planner.\n"
-        "Use the RFP/project text as the **primary source** \n"
-        "Use questions and answers to clarify ambiguities.\n"
-        "but enrich missing fields with the Knowledge Base context (if relevant).\n"
-        "Return ONLY valid JSON (no prose, no markdown, no commentary).\n\n"
-        "Output schema:\n"
-        "{\n"
-        '  "overview": {\n'
-        '    "Project Name": string,\n'
-        '    "Domain": string,\n'
-        '    "Complexity": string,\n'
-        '    "Tech Stack": string,\n'
-        '    "Use Cases": string,\n'
-        '    "Compliance": string,\n'
-        '    "Duration": number\n'
-        "  },\n"
-        '  "activities": [\n'
-        '    {\n'
-        '      "ID": int,\n'
-        '      "Activities": string,\n'
-        '      "Description": string | null,\n'
-        '      "Owner": string | null,\n'
-        '      "Resources": string | null,\n'
-        '      "Start Date": "yyyy-mm-dd",\n'
-        '      "End Date": "yyyy-mm-dd",\n'
-        '      "Effort Months": number\n'
-        "    }\n"
-        "  ],\n"
-        '  "resourcing_plan": [],\n'
-        '  "project_summary": {\n'
-        '    "executive_summary": string (2-3 paragraphs overview),\n'
-        '    "key_deliverables": [string] (list of 5-7 main deliverables),\n'
-        '    "success_criteria": [string] (list of 3-5 success metrics),\n'
-        '    "risks_and_mitigation": [{"risk": string, "mitigation": string}] (3-4 key risks)\n'
-        "  }\n"
-        "}\n\n"
-        "Scheduling Rules: \n"
-        f"- The first activity must always start today ({today_str}).\n"
-        "- If two activities are **independent**, overlap their timelines by **70–80%** of their duration (not full overlap)."
-        "- If one activity **depends** on another, allow a small overlap of **10-15%** near the end of the predecessor if feasible."
-        "- Avoid full serialization unless strictly required by dependency."
-        "- Avoid full parallelism where all tasks start together — stagger independent ones by **5-10%**."
-        "- Ensure overall project duration stays **≤ 12 months**."
-        "- Auto-calculate **End Date = Start Date + Effort Months**.\n"
-        "- Auto-calculate **overview.Duration** as the total span in months from the earliest Start Date to the latest End Date.\n"
-        "- `Complexity` should be simple, medium, or large based on duration of project.\n"
-        "- **Always assign at least one Resource**."
-        "- Distinguish `Owner` (responsible lead role) and `Resources` (supporting roles)."
-        "- `Owner` and `Resources` must be valid IT roles (e.g., Backend Developer, AI Engineer, QA Engineer, etc.)."
-        "- `Owner` is always a role who manages that particular activity (not a personal name).\n"
-        "- `Resources` must contain only roles which are required for that particular activity, distinct from `Owner`.\n"
-        "- If `Resources` is missing, fallback to the same `Owner` role.\n"
-        "- Use less resources as much as possible.\n"
-        "- Effort Months should be small numbers 0.5 to 1.5 months (inclusive).\n"
-        "- IDs must start from 1 and increment sequentially.\n"
-        "- If the RFP or Knowledge Base text lacks detail, infer the missing pieces logically."
-        "- Include all relevant roles and activities that ensure delivery of the project scope."
-        "- Keep all field names exactly as in the schema.\n"
-        "- Generate a comprehensive project_summary with:\n"
-        "  * executive_summary: 2-3 paragraph high-level overview of the project, objectives, and expected outcomes\n"
-        "  * key_deliverables: List 5-7 concrete deliverables (e.g., 'Production-ready web application', 'API documentation', etc.)\n"
-        "  * success_criteria: List 3-5 measurable success metrics (e.g., '99.9% uptime', 'Response time < 200ms', etc.)\n"
-        "  * risks_and_mitigation: List 3-4 key risks with mitigation strategies (e.g., risk: 'Third-party API dependency', mitigation: 'Implement fallback mechanisms')\n"
-        f"{user_context}"
-        f"RFP / Project Files Content:\n{rfp_text}\n\n"
-        f"Knowledge Base Context (for enrichment only):\n{kb_context}\n"
-        f"Clarification Q&A (User-confirmed answers take highest priority)\n"
-        f"Use these answers to override or clarify any ambiguous or conflicting information.\n"
-        f"Do NOT hallucinate beyond these facts.\n\n"
-        f"{questions_context}\n"
+    return _SCOPE_STATIC + _SCOPE_DYNAMIC.format(
+        today_str=today_str,
+        user_context=user_context,
+        rfp_text=rfp_text,
+        kb_context=kb_context,
+        questions_context=questions_context,
     )
 
 
-def _build_questionnaire_prompt(rfp_text: str, kb_chunks: List[str], project=None) -> str:
-    """
-    Build a prompt that forces the model to infer categories dynamically from RFP context.
-    """
+def _questionnaire_context(rfp_text: str, kb_chunks: List[str], project=None) -> str:
+    """Project / RFP / KB block shared by the questionnaire prompts."""
     name = getattr(project, "name", "Unnamed Project")
     domain = getattr(project, "domain", "General")
     tech = getattr(project, "tech_stack", "Modern Web Stack")
     compliance = getattr(project, "compliance", "General")
     duration = getattr(project, "duration", "TBD")
 
-    return f"""
-You are a **senior business analyst** preparing a requirement-clarification questionnaire
-based on an RFP document.
-
-Your goal: identify the main THEMES and subareas discussed in the RFP or Knowledge Base,
-and then create **categories of questions** that align with those themes.
-Do NOT reuse example categories blindly — derive them from the content itself.
-
----
-
-### Project Context
+    return f"""### Project Context
 - Project Name: {name}
 - Domain: {domain}
 - Tech Stack: {tech}
@@ -426,7 +707,24 @@ Do NOT reuse example categories blindly — derive them from the content itself.
 {rfp_text}
 
 ### Knowledge Base Context
-{kb_chunks}
+{kb_chunks}"""
+
+
+def _build_questionnaire_prompt(rfp_text: str, kb_chunks: List[str], project=None) -> str:
+    """
+    Build a prompt that forces the model to infer categories dynamically from RFP context.
+    """
+    return f"""
+You are a **senior business analyst** preparing a requirement-clarification questionnaire
+based on an RFP document.
+
+Your goal: identify the main THEMES and subareas discussed in the RFP or Knowledge Base,
+and then create **categories of questions** that align with those themes.
+Do NOT reuse example categories blindly — derive them from the content itself.
+
+---
+
+{_questionnaire_context(rfp_text, kb_chunks, project)}
 
 ---
 
@@ -481,6 +779,105 @@ Return ONLY valid JSON in this structure:
 - Output ONLY valid JSON (no explanations or markdown).
 """
 
+# Questionnaire fan-out (config.QUESTION_THEME_FANOUT): one short theme-extraction
+# call, then one small prompt per theme instead of a single prompt that generates
+# every category at once
+QUESTION_THEMES_MAX = 6
+
+
+def _build_theme_prompt(rfp_text: str, kb_chunks: List[str], project=None) -> str:
+    """Ask only for the RFP's key themes (short output)."""
+    return f"""
+You are a **senior business analyst** preparing a requirement-clarification questionnaire
+based on an RFP document.
+
+{_questionnaire_context(rfp_text, kb_chunks, project)}
+
+---
+
+### TASK
+Identify the {QUESTION_THEMES_MAX} or fewer **key themes or topics** of this RFP that need
+requirement clarification (e.g., Data Governance, SOX Controls, Cloud Migration, AI Enablement).
+Avoid generic themes like "Architecture" or "Data & Security" unless the RFP explicitly discusses them.
+
+Return ONLY valid JSON: {{"themes": ["Theme 1", "Theme 2"]}}
+"""
+
+
+def _build_theme_questions_prompt(rfp_text: str, kb_chunks: List[str], project, theme: str) -> str:
+    """Ask for the questions of a single theme. The context block comes first so every
+    per-theme prompt shares the same prefix."""
+    return f"""
+You are a **senior business analyst** preparing a requirement-clarification questionnaire
+based on an RFP document.
+
+{_questionnaire_context(rfp_text, kb_chunks, project)}
+
+---
+
+### TASK
+Write 5-6 specific questions for the theme **{theme}**.
+Questions should clarify requirements, assumptions, or current-state processes,
+and each must be concise, unambiguous, and require a short descriptive answer.
+
+### OUTPUT FORMAT
+Return ONLY valid JSON (no explanations or markdown):
+
+{{
+  "questions": [
+    {{
+      "category": "{theme}",
+      "items": [
+        {{"question": "...", "user_understanding": "", "comment": ""}}
+      ]
+    }}
+  ]
+}}
+"""
+
+
+def _extract_themes(raw_text: str) -> List[str]:
+    parsed = _extract_json(raw_text)
+    themes = parsed.get("themes") if isinstance(parsed, dict) else None
+    if not isinstance(themes, list):
+        return []
+    cleaned = (_safe_str(t) for t in themes if isinstance(t, str))
+    return list(dict.fromkeys(t for t in cleaned if t))[:QUESTION_THEMES_MAX]
+
+
+async def _generate_questions_by_theme(rfp_text: str, kb_chunks: List[str], project) -> list[dict]:
+    """
+    Extract themes, then generate each theme's questions concurrently (capped by
+    config.QUESTION_THEME_CONCURRENCY). Returns [] if no themes came back so the caller
+    can fall back to the single-prompt questionnaire.
+    """
+    theme_prompt = _build_theme_prompt(rfp_text, kb_chunks, project)
+    raw_themes = await ollama_chat(theme_prompt, temperature=0.3)
+    themes = _extract_themes(raw_themes)
+    if not themes:
+        logger.warning("⚠️ Theme extraction returned nothing — using single questionnaire prompt")
+        return []
+    logger.info(f"🧩 Questionnaire themes: {themes}")
+
+    sem = asyncio.Semaphore(config.QUESTION_THEME_CONCURRENCY)
+
+    async def _theme_questions(theme: str) -> dict:
+        prompt = _build_theme_questions_prompt(rfp_text, kb_chunks, project, theme)
+        async with sem:
+            raw_text = await ollama_chat(prompt, temperature=0.8)
+        # Whatever category the model echoed back, its items belong to this theme
+        items = [
+            item
+            for cat in _extract_questions_from_text(raw_text)
+            for item in cat["items"]
+            if item.get("question")
+        ]
+        return {"category": theme, "items": items}
+
+    categories = await asyncio.gather(*(_theme_questions(t) for t in themes))
+    return [cat for cat in categories if cat["items"]]
+
+
 def _extract_questions_from_text(raw_text: str) -> list[dict]:
     try:
         parsed = _extract_json(raw_text)
@@ -533,11 +930,11 @@ def _extract_questions_from_text(raw_text: str) -> list[dict]:
         line = line.strip()
         if not line:
             continue
-        if re.match(r"^(#+\s*)?([A-Z][A-Za-z\s&/]+):?$", line) and not line.endswith("?"):
-            current_cat = re.sub(r"^#+\s*", "", line).strip(": ").strip()
+        if _HEADER_RE.match(line) and not line.endswith("?"):
+            current_cat = _HASH_PREFIX_RE.sub("", line).strip(": ").strip()
             continue
         if "?" in line:
-            qtext = re.sub(r"^\d+[\).\s]+", "", line).strip()
+            qtext = _NUM_PREFIX_RE.sub("", line).strip()
             grouped.setdefault(current_cat, []).append({
                 "question": qtext,
                 "user_understanding": "",
@@ -552,46 +949,46 @@ async def generate_project_questions(db: AsyncSession, project) -> dict:
     """
 
     # ---------- Extract RFP ----------
-    rfp_text = ""
-    try:
-        if getattr(project, "files", None):
-            files = [{"file_name": f.file_name, "file_path": f.file_path} for f in project.files]
-            if files:
-                rfp_text = await _extract_text_from_files(files)
-    except Exception as e:
-        logger.warning(f"Failed to extract RFP for questions: {e}")
+    async def _extract_rfp() -> str:
+        try:
+            if getattr(project, "files", None):
+                files = [{"file_name": f.file_name, "file_path": f.file_path} for f in project.files]
+                if files:
+                    return await _extract_text_from_files(files)
+        except Exception as e:
+            logger.warning(f"Failed to extract RFP for questions: {e}")
+        return ""
 
     # ---------- Retrieve Knowledge Base ----------
-    kb_results = _rag_retrieve(rfp_text or project.name or project.domain)
-    kb_chunks = [ch["content"] for group in kb_results for ch in group["chunks"]] if kb_results else []
-
-    # ---------- Build prompt ----------
-    prompt = _build_questionnaire_prompt(rfp_text, kb_chunks, project)
+    # Name/domain retrieval doesn't need the RFP, so it overlaps with extraction;
+    # the RFP-based retrieval follows and both hit lists are merged
+    rfp_task = asyncio.create_task(_extract_rfp())
+    try:
+        prior_kb = await _rag_retrieve_many([project.name, project.domain])
+    except BaseException:
+        rfp_task.cancel()
+        raise
+    rfp_text = await rfp_task
+    rfp_kb = await _rag_retrieve(rfp_text) if rfp_text else []
+    kb_chunks = _dedupe_kb_chunks(_merge_rag_results(prior_kb, rfp_kb))
 
     # ---------- Query Ollama ----------
     try:
-        raw_text = await anyio.to_thread.run_sync(lambda: ollama_chat(prompt, temperature=0.8))
-        questions = _extract_questions_from_text(raw_text)
+        questions = []
+        if config.QUESTION_THEME_FANOUT:
+            questions = await _generate_questions_by_theme(rfp_text, kb_chunks, project)
+        if not questions:
+            prompt = _build_questionnaire_prompt(rfp_text, kb_chunks, project)
+            raw_text = await ollama_chat(prompt, temperature=0.8)
+            questions = _extract_questions_from_text(raw_text)
         total_q = sum(len(cat["items"]) for cat in questions)
         logger.info(f" Generated {total_q} questions under {len(questions)} categories for project {project.id}")
 
         # ---------- Save to Blob Storage ----------
-        blob_name = f"{PROJECTS_BASE}/{project.id}/questions.json"
+        discard_question_answers(project.id)
         try:
-            await azure_blob.upload_bytes(
-                json.dumps({"questions": questions}, ensure_ascii=False, indent=2).encode("utf-8"),
-                blob_name,
-            )
-
-            db_file = models.ProjectFile(
-                project_id=project.id,
-                file_name="questions.json",
-                file_path=blob_name,
-            )
-
-            db.add(db_file)
+            await _save_generated_file(db, project.id, "questions.json", _dump_json({"questions": questions}))
             await db.commit()
-            await db.refresh(db_file)
 
             logger.info(f" Saved questions.json for project {project.id}")
         except Exception as e:
@@ -603,46 +1000,52 @@ async def generate_project_questions(db: AsyncSession, project) -> dict:
         logger.error(f" Question generation failed: {e}")
         return {"questions": []}
     
+def _merge_answers(questions: list, user_answers: dict) -> None:
+    """Set user_understanding on every question answered in user_answers (category -> question -> answer)."""
+    for cat in questions:
+        cat_name = cat.get("category")
+        for item in cat.get("items", []):
+            q_text = item.get("question")
+            ans = (
+                user_answers.get(cat_name, {}).get(q_text)
+                if user_answers.get(cat_name)
+                else None
+            )
+            if ans:
+                item["user_understanding"] = ans
+
+
 # Update questions.json with user input answers
 async def update_questions_with_user_input(
-    db: AsyncSession, project, user_answers: dict
+    db: AsyncSession, project, user_answers: dict, cached_questions: dict | None = None
 ) -> dict:
+    """
+    Merge answers into questions.json. Pass the already-parsed questions document as
+    cached_questions to skip the blob download (it is updated in place); in that case
+    nothing is written and the caller is responsible for uploading the result.
+    """
     from app.utils import azure_blob
 
     blob_name = f"{PROJECTS_BASE}/{project.id}/questions.json"
     try:
         # Load current questions.json
-        q_bytes = await azure_blob.download_bytes(blob_name)
-        q_json = json.loads(q_bytes.decode("utf-8"))
+        if cached_questions is not None:
+            q_json = cached_questions
+        else:
+            q_bytes = await azure_blob.download_bytes(blob_name)
+            q_json = orjson.loads(q_bytes)
         questions = q_json.get("questions", [])
 
         # Merge answers into the structure
-        for cat in questions:
-            cat_name = cat.get("category")
-            for item in cat.get("items", []):
-                q_text = item.get("question")
-                ans = (
-                    user_answers.get(cat_name, {}).get(q_text)
-                    if user_answers.get(cat_name)
-                    else None
-                )
-                if ans:
-                    item["user_understanding"] = ans
-
-        # Upload updated JSON to Blob
-        new_bytes = json.dumps({"questions": questions}, ensure_ascii=False, indent=2).encode("utf-8")
-        await azure_blob.upload_bytes(new_bytes, blob_name)
-        logger.info(f" Updated questions.json with user input for project {project.id}")
+        _merge_answers(questions, user_answers)
 
-        #  Save / update DB record
-        db_file = models.ProjectFile(
-            project_id=project.id,
-            file_name="questions.json",
-            file_path=blob_name,
-        )
-        db.add(db_file)
+        if cached_questions is not None:
+            return {"questions": questions}
+
+        # Upload updated JSON to Blob + save / update DB record
+        await _save_generated_file(db, project.id, "questions.json", _dump_json({"questions": questions}))
         await db.commit()
-        await db.refresh(db_file)
+        logger.info(f" Updated questions.json with user input for project {project.id}")
 
         return {"questions": questions}
 
@@ -650,92 +1053,335 @@ async def update_questions_with_user_input(
         logger.error(f"Failed to update questions.json with user input: {e}")
         return {}
 
+
+# ---------------------------------------------------------------------------
+# Interactive answer saves
+# ---------------------------------------------------------------------------
+# The UI saves answers one question at a time. While a project has unsaved edits its
+# parsed questions.json stays in memory and is written back to Blob once per
+# QUESTIONS_FLUSH_SECONDS, instead of a GET + PUT per save. The write is conditional on
+# the ETag the document was read at: if another worker (or a regeneration) changed the
+# blob meanwhile, it is re-read and only this worker's answers are applied on top, and
+# they are dropped if the questionnaire itself was replaced. Other workers still read
+# the blob without the pending answers until the flush, so config defaults to
+# write-through when running more than one worker.
+_questions_pending: Dict[str, dict] = {}   # blob -> {"doc", "etag", "answers"}
+_questions_locks: Dict[str, list] = {}     # blob -> [lock, users]; dropped when unused
+_questions_flush_tasks: Dict[str, asyncio.Task] = {}
+
+
+def _questions_blob_name(project_id) -> str:
+    return f"{PROJECTS_BASE}/{project_id}/questions.json"
+
+
+@contextlib.asynccontextmanager
+async def _questions_lock(blob_name: str):
+    entry = _questions_locks.get(blob_name)
+    if entry is None:
+        entry = _questions_locks[blob_name] = [asyncio.Lock(), 0]
+    entry[1] += 1
+    try:
+        async with entry[0]:
+            yield
+    finally:
+        entry[1] -= 1
+        if entry[1] == 0:
+            _questions_locks.pop(blob_name, None)
+
+
+def _question_keys(doc: dict) -> set:
+    return {
+        (cat.get("category"), item.get("question"))
+        for cat in doc.get("questions", [])
+        for item in cat.get("items", [])
+    }
+
+
+async def _load_questions(blob_name: str) -> tuple[dict, str]:
+    data, etag = await azure_blob.download_bytes_with_etag(blob_name)
+    return orjson.loads(data), etag
+
+
+async def save_question_answers(db: AsyncSession, project, user_answers: dict) -> dict:
+    """Merge answers into the in-memory questions document and schedule a Blob write."""
+    if config.QUESTIONS_FLUSH_SECONDS <= 0:
+        return await update_questions_with_user_input(db, project, user_answers)
+
+    blob_name = _questions_blob_name(project.id)
+    async with _questions_lock(blob_name):
+        pending = _questions_pending.get(blob_name)
+        if pending is None:
+            # First save of a burst: one download, then edits stay in memory
+            try:
+                doc, etag = await _load_questions(blob_name)
+            except Exception as e:
+                logger.error(f"Failed to update questions.json with user input: {e}")
+                return {}
+            pending = {"doc": doc, "etag": etag, "answers": {}}
+
+        result = await update_questions_with_user_input(db, project, user_answers, cached_questions=pending["doc"])
+        if result:
+            for cat_name, answers in user_answers.items():
+                if isinstance(answers, dict):
+                    pending["answers"].setdefault(cat_name, {}).update(answers)
+            _questions_pending[blob_name] = pending
+            if blob_name not in _questions_flush_tasks:
+                _questions_flush_tasks[blob_name] = asyncio.create_task(_flush_questions_later(blob_name))
+        return result
+
+
+async def _flush_questions_later(blob_name: str) -> None:
+    await asyncio.sleep(config.QUESTIONS_FLUSH_SECONDS)
+    _questions_flush_tasks.pop(blob_name, None)
+    await flush_question_answers(blob_name)
+
+
+async def flush_question_answers(blob_name: str) -> None:
+    """Write pending answers for blob_name now (no-op if there are none)."""
+    async with _questions_lock(blob_name):
+        task = _questions_flush_tasks.pop(blob_name, None)
+        if task is not None and task is not asyncio.current_task():
+            task.cancel()
+        pending = _questions_pending.pop(blob_name, None)
+        if pending is None:
+            return
+        for attempt in range(3):
+            try:
+                await azure_blob.upload_bytes(_dump_json(pending["doc"]), blob_name, etag=pending["etag"])
+                logger.info(f" Flushed pending answers to {blob_name}")
+                return
+            except ResourceModifiedError:
+                # Written elsewhere since we read it: re-read and re-apply only our answers
+                try:
+                    doc, etag = await _load_questions(blob_name)
+                except Exception as e:
+                    logger.error(f"Failed to flush answers to {blob_name}: {e}")
+                    break
+                if _question_keys(doc) != _question_keys(pending["doc"]):
+                    logger.warning(f" questions.json was regenerated; dropping pending answers for {blob_name}")
+                    return
+                _merge_answers(doc.get("questions", []), pending["answers"])
+                pending = {"doc": doc, "etag": etag, "answers": pending["answers"]}
+            except Exception as e:
+                logger.error(f"Failed to flush answers to {blob_name}: {e}")
+                break
+        # Keep the edits and retry on the next save / flush
+        _questions_pending[blob_name] = pending
+
+
+async def flush_all_question_answers() -> None:
+    """Flush every project's pending answers (called on shutdown)."""
+    for blob_name in list(_questions_pending):
+        await flush_question_answers(blob_name)
+
+
+def discard_question_answers(project_id) -> None:
+    """
+    Drop this worker's unsaved answers for a project whose questionnaire is being
+    regenerated. Other workers' pending flushes fail their ETag check against the new
+    questions.json and drop theirs.
+    """
+    blob_name = _questions_blob_name(project_id)
+    _questions_pending.pop(blob_name, None)
+    task = _questions_flush_tasks.pop(blob_name, None)
+    if task is not None:
+        task.cancel()
+
     
+# Architecture-diagram instructions; static prefix of every architecture prompt (see _SCOPE_STATIC)
+_ARCHITECTURE_STATIC = """
+You are a **senior enterprise solution architect** tasked with designing a *tailored cloud system architecture diagram*
+strictly based on the provided RFP and contextual knowledge.
+
+###  STEP 1 — Reasoning (Internal)
+Analyze the provided RFP and knowledge base to:
+1. Identify all domain-specific **entities, systems, or technologies** mentioned or implied.
+2. Categorize each component into the most appropriate architecture layer:
+- Frontend (UI/Apps)
+- Backend (Services/APIs)
+- Data (Databases, Storage, External APIs)
+- AI/Analytics (ML, Insights, NLP, Recommendations)
+- Security/Monitoring/DevOps (IAM, Key Vault, CI/CD, Logging)
+3. Infer **connections and data flows** between components (e.g., API requests, pipelines, message queues).
+4. Skip any layers not relevant to this RFP.
+
+You will use this reasoning to build the architecture — but **do not include this reasoning** in your final output.
+
+---
+
+###  STEP 2 — Graphviz DOT Output
+Generate **only valid Graphviz DOT code** representing the inferred architecture.
+
+Follow these rules strictly:
+- Begin with: `digraph Architecture {`
+- End with: `}`
+- Use **horizontal layout** → `rankdir=LR`
+- Include **only relevant clusters** (omit unused layers)
+- Keep ≤ 15 nodes total
+- Use **orthogonal edges** (`splines=ortho`)
+- Each node label must clearly represent an actual system, service, or tool
+- Logical flow should follow Frontend → Backend → Data → AI → Security (only if applicable)
+-  **Ensure data layers both receive and provide information** — show arrows *into* and *out of* data/storage nodes if analytics, AI, or reporting components exist.
+
+---
+
+### VISUAL STYLE
+- **Graph:** dpi=200, bgcolor="white", nodesep=1.3, ranksep=1.3
+- **Clusters:** style="filled,rounded", fontname="Helvetica-Bold", fontsize=13
+- **Node Shapes and Colors:**
+- Frontend → `box`, pastel blue (`fillcolor="#E3F2FD"`)
+- Backend/API → `box3d`, pastel green (`fillcolor="#E8F5E9"`)
+- Data/Storage → `cylinder`, pastel yellow (`fillcolor="#FFFDE7"`)
+- AI/Analytics → `ellipse`, pastel purple (`fillcolor="#F3E5F5"`)
+- Security/Monitoring → `diamond`, gray (`fillcolor="#ECEFF1"`)
+- **Edges:** color="#607D8B", penwidth=1.5, arrowsize=0.9
+
+---
+
+###  STEP 3 — Domain Intelligence (Auto-Enrichment)
+If applicable, automatically enrich the architecture using these domain patterns:
+
+- **FinTech** → Payment Gateway, Fraud Detection, KYC/AML Service, Ledger DB
+- **HealthTech** → Patient Portal, EHR System, FHIR API, HIPAA Compliance Layer
+- **GovTech** → Citizen Portal, Secure API Gateway, Compliance & Audit Logging
+- **AI/ML Projects** → Model API, Embedding Store, Training Pipeline, Monitoring Service
+- **Data Platforms** → ETL Pipeline, Data Lake, BI Dashboard
+- **Enterprise SaaS** → Tenant Manager, Auth Service, Billing & Subscription Module
+
+Include these elements **only if they logically fit** the RFP description.
+
+---
+
+###  STEP 4 — OUTPUT RULES
+- Output *only* the Graphviz DOT syntax — **no markdown**, **no reasoning**, **no commentary**
+- The final response should be a single valid DOT diagram ready for rendering
+"""
+
+
 def _build_architecture_prompt(rfp_text: str, kb_chunks: List[str], project=None) -> str:
     name = (getattr(project, "name", "") or "Untitled Project").strip()
     domain = (getattr(project, "domain", "") or "General").strip()
     tech = (getattr(project, "tech_stack", "") or "Modern Web + Cloud Stack").strip()
+    kb_context = "\n\n".join(kb_chunks) if kb_chunks else "(no KB context found)"
 
-    return f"""
-    You are a **senior enterprise solution architect** tasked with designing a *tailored cloud system architecture diagram*
-    strictly based on the provided RFP and contextual knowledge.
-
-    ### PROJECT CONTEXT
-    - **Project Name:** {name}
-    - **Domain:** {domain}
-    - **Tech Stack:** {tech}
-
-    ### RFP SUMMARY
-    {rfp_text}
-
-    ### KNOWLEDGE BASE CONTEXT
-    {kb_chunks}
-
-    ---
-
-    ###  STEP 1 — Reasoning (Internal)
-    Analyze the provided RFP and knowledge base to:
-    1. Identify all domain-specific **entities, systems, or technologies** mentioned or implied.
-    2. Categorize each component into the most appropriate architecture layer:
-    - Frontend (UI/Apps)
-    - Backend (Services/APIs)
-    - Data (Databases, Storage, External APIs)
-    - AI/Analytics (ML, Insights, NLP, Recommendations)
-    - Security/Monitoring/DevOps (IAM, Key Vault, CI/CD, Logging)
-    3. Infer **connections and data flows** between components (e.g., API requests, pipelines, message queues).
-    4. Skip any layers not relevant to this RFP.
-
-    You will use this reasoning to build the architecture — but **do not include this reasoning** in your final output.
-
-    ---
-
-    ###  STEP 2 — Graphviz DOT Output
-    Generate **only valid Graphviz DOT code** representing the inferred architecture.
-
-    Follow these rules strictly:
-    - Begin with: `digraph Architecture {{`
-    - End with: `}}`
-    - Use **horizontal layout** → `rankdir=LR`
-    - Include **only relevant clusters** (omit unused layers)
-    - Keep ≤ 15 nodes total
-    - Use **orthogonal edges** (`splines=ortho`)
-    - Each node label must clearly represent an actual system, service, or tool
-    - Logical flow should follow Frontend → Backend → Data → AI → Security (only if applicable)
-    -  **Ensure data layers both receive and provide information** — show arrows *into* and *out of* data/storage nodes if analytics, AI, or reporting components exist.
-
-    ---
-
-    ### VISUAL STYLE
-    - **Graph:** dpi=200, bgcolor="white", nodesep=1.3, ranksep=1.3
-    - **Clusters:** style="filled,rounded", fontname="Helvetica-Bold", fontsize=13
-    - **Node Shapes and Colors:**
-    - Frontend → `box`, pastel blue (`fillcolor="#E3F2FD"`)
-    - Backend/API → `box3d`, pastel green (`fillcolor="#E8F5E9"`)
-    - Data/Storage → `cylinder`, pastel yellow (`fillcolor="#FFFDE7"`)
-    - AI/Analytics → `ellipse`, pastel purple (`fillcolor="#F3E5F5"`)
-    - Security/Monitoring → `diamond`, gray (`fillcolor="#ECEFF1"`)
-    - **Edges:** color="#607D8B", penwidth=1.5, arrowsize=0.9
-
-    ---
-
-    ###  STEP 3 — Domain Intelligence (Auto-Enrichment)
-    If applicable, automatically enrich the architecture using these domain patterns:
-
-    - **FinTech** → Payment Gateway, Fraud Detection, KYC/AML Service, Ledger DB
-    - **HealthTech** → Patient Portal, EHR System, FHIR API, HIPAA Compliance Layer
-    - **GovTech** → Citizen Portal, Secure API Gateway, Compliance & Audit Logging
-    - **AI/ML Projects** → Model API, Embedding Store, Training Pipeline, Monitoring Service
-    - **Data Platforms** → ETL Pipeline, Data Lake, BI Dashboard
-    - **Enterprise SaaS** → Tenant Manager, Auth Service, Billing & Subscription Module
-
-    Include these elements **only if they logically fit** the RFP description.
-
-    ---
-
-    ###  STEP 4 — OUTPUT RULES
-    - Output *only* the Graphviz DOT syntax — **no markdown**, **no reasoning**, **no commentary**
-    - The final response should be a single valid DOT diagram ready for rendering
+    return _ARCHITECTURE_STATIC + f"""
+---
+DYNAMIC CONTEXT:
+
+### PROJECT CONTEXT
+- **Project Name:** {name}
+- **Domain:** {domain}
+- **Tech Stack:** {tech}
+
+### RFP SUMMARY
+{rfp_text}
+
+### KNOWLEDGE BASE CONTEXT
+{kb_context}
+"""
+
+# Final chunk of every PNG (zero length, "IEND", CRC); separates the PNG from the
+# SVG that follows it on dot's stdout
+_PNG_IEND = b"\x00\x00\x00\x00IEND\xaeB`\x82"
+
+
+def _render_dot(dot_code: str) -> tuple[bytes, bytes]:
+    """
+    Render DOT to PNG and SVG bytes with a single `dot` run: the source goes in on
+    stdin and both outputs come back on stdout (PNG first), so the graph is parsed
+    and laid out once and nothing touches disk. Returns (png_bytes, svg_bytes).
     """
+    proc = subprocess.run(["dot", "-Tpng", "-Tsvg"], input=dot_code.encode("utf-8"), capture_output=True)
+    if proc.returncode != 0:
+        stderr = proc.stderr.decode("utf-8", errors="ignore").strip()
+        raise RuntimeError(f"dot exited with {proc.returncode}: {stderr[:500]}")
+    cut = proc.stdout.find(_PNG_IEND)
+    if cut < 0:
+        raise RuntimeError("dot output did not contain a complete PNG")
+    cut += len(_PNG_IEND)
+    png_bytes, svg_bytes = proc.stdout[:cut], proc.stdout[cut:]
+    if not svg_bytes.strip():
+        raise RuntimeError("dot output did not contain an SVG")
+    return png_bytes, svg_bytes
+
+
+async def _upload_diagrams(
+    png_bytes: bytes, blob_name_png: str, svg_bytes: bytes, blob_name_svg: str,
+    metadata: Dict[str, str] | None = None,
+) -> None:
+    """Upload the rendered PNG (with optional metadata) and SVG to Azure Blob, both at once."""
+    await asyncio.gather(
+        azure_blob.upload_bytes(png_bytes, blob_name_png, metadata=metadata),
+        azure_blob.upload_bytes(svg_bytes, blob_name_svg),
+    )
+
+
+async def _upsert_project_file(
+    db: AsyncSession, project_id, file_name: str, file_path: str
+) -> models.ProjectFile:
+    """
+    Point the project's record for a generated file (models.GENERATED_FILE_NAMES) at
+    file_path, inserting it if missing: one INSERT ... ON CONFLICT DO UPDATE against
+    uq_projectfile_generated, so concurrent saves can't create duplicate rows.
+    """
+    insert = sqlite_insert if db.get_bind().dialect.name == "sqlite" else pg_insert
+    stmt = insert(models.ProjectFile).values(
+        project_id=project_id, file_name=file_name, file_path=file_path, is_generated=True
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[models.ProjectFile.project_id, models.ProjectFile.file_name],
+        index_where=models.GENERATED_FILE_WHERE,
+        set_={"file_path": stmt.excluded.file_path, "uploaded_at": func.now()},
+    ).returning(models.ProjectFile)
+    return await db.scalar(stmt, execution_options={"populate_existing": True})
+
+
+async def _save_generated_file(
+    db: AsyncSession, project_id, file_name: str, data: bytes
+) -> models.ProjectFile:
+    """
+    Upload a generated file to <project>/<file_name> and upsert its record at the
+    same time (different services, so neither waits on the other). The caller
+    commits; if the upload fails the pending upsert is rolled back with it.
+    """
+    blob_name = f"{PROJECTS_BASE}/{project_id}/{file_name}"
+    results = await asyncio.gather(
+        azure_blob.upload_bytes(data, blob_name, overwrite=True),
+        _upsert_project_file(db, project_id, file_name, blob_name),
+        return_exceptions=True,
+    )
+    # Wait for both before raising, so the session is idle when the caller rolls back
+    for res in results:
+        if isinstance(res, BaseException):
+            raise res
+    return results[1]
+
+
+async def _store_architecture_files(
+    db: AsyncSession, project, blob_name_png: str, blob_name_svg: str
+) -> models.ProjectFile:
+    """
+    Repoint the project's architecture.png/.svg records at the new blobs (upserts,
+    one commit). Blobs of the old records are deleted afterwards, except paths that
+    were just overwritten by the new upload.
+    """
+    old_paths = await db.scalars(
+        select(models.ProjectFile.file_path).filter(
+            models.ProjectFile.project_id == project.id,
+            models.ProjectFile.file_name.in_(("architecture.png", "architecture.svg")),
+            models.ProjectFile.is_generated,
+        )
+    )
+    stale_paths = set(old_paths) - {blob_name_png, blob_name_svg}
+
+    db_file_png = await _upsert_project_file(db, project.id, "architecture.png", blob_name_png)
+    await _upsert_project_file(db, project.id, "architecture.svg", blob_name_svg)
+    await db.commit()
+
+    if stale_paths:
+        await asyncio.gather(*(azure_blob.delete_blob(p) for p in stale_paths))
+    return db_file_png
+
 
 async def _generate_fallback_architecture(
     db: AsyncSession,
@@ -795,14 +1441,8 @@ digraph Architecture {
 """
 
     # --- Render DOT → PNG & SVG ---
-    tmp_base = tempfile.NamedTemporaryFile(delete=False, suffix=".dot").name
     try:
-        graph = graphviz.Source(fallback_dot, engine="dot")
-        graph.render(tmp_base, format="png", cleanup=True)
-        graph.render(tmp_base, format="svg", cleanup=True)
-
-        png_path = tmp_base + ".png"
-        svg_path = tmp_base + ".svg"
+        png_bytes, svg_bytes = await anyio.to_thread.run_sync(_render_dot, fallback_dot)
     except Exception as e:
         logger.error(f" Fallback Graphviz rendering failed: {e}")
         return None, ""
@@ -811,42 +1451,69 @@ digraph Architecture {
     blob_name_png = f"{blob_base_path}/architecture_fallback_{project.id}.png"
     blob_name_svg = f"{blob_base_path}/architecture_fallback_{project.id}.svg"
 
-    try:
-        with open(png_path, "rb") as fh:
-            await azure_blob.upload_bytes(fh.read(), blob_name_png)
-        with open(svg_path, "rb") as fh:
-            await azure_blob.upload_bytes(fh.read(), blob_name_svg)
-    finally:
-        for path in [png_path, svg_path, tmp_base]:
-            try:
-                os.remove(path)
-            except FileNotFoundError:
-                pass
+    await _upload_diagrams(png_bytes, blob_name_png, svg_bytes, blob_name_svg)
 
     # --- Save both records in DB ---
-    db_file_png = models.ProjectFile(
-        project_id=project.id,
-        file_name="architecture.png",
-        file_path=blob_name_png,
-    )
-    db_file_svg = models.ProjectFile(
-        project_id=project.id,
-        file_name="architecture.svg",
-        file_path=blob_name_svg,
+    db_file_png = await _store_architecture_files(db, project, blob_name_png, blob_name_svg)
+
+    logger.info(
+        f" Fallback architecture diagrams stored for project {project.id}: "
+        f"{blob_name_png}, {blob_name_svg}"
     )
 
-    db.add_all([db_file_png, db_file_svg])
-    await db.commit()
-    await db.refresh(db_file_png)
-    await db.refresh(db_file_svg)
+    return db_file_png, blob_name_png
+
+
+
+def _architecture_input_key(prompt: str, project) -> str:
+    """
+    Hash of the rendered architecture prompt (RFP, KB chunks and every project field it
+    uses) for this project; stored as metadata on the diagram's PNG blob.
+    """
+    return hashlib.sha256(f"{getattr(project, 'id', '')}\0{prompt}".encode("utf-8")).hexdigest()
+
 
-    logger.info(
-        f" Fallback architecture diagrams stored for project {project.id}: "
-        f"{blob_name_png}, {blob_name_svg}"
-    )
+async def _architecture_is_current(blob_name_png: str, input_key: str) -> bool:
+    """True if the stored PNG was rendered from the same inputs (blob metadata only, no DB)."""
+    try:
+        meta = await azure_blob.get_blob_metadata(blob_name_png)
+    except Exception as e:
+        logger.warning(f"Could not read architecture metadata for {blob_name_png}: {e}")
+        return False
+    return meta.get("input_key") == input_key
 
-    return db_file_png, blob_name_png
 
+async def _architecture_dot_unless_current(prompt: str, blob_name_png: str, input_key: str) -> str | None:
+    """
+    DOT for the architecture prompt, or None when the stored diagram already matches
+    input_key (generate_architecture then reuses it). No DB access, safe to run as a task.
+    """
+    if await _architecture_is_current(blob_name_png, input_key):
+        return None
+    return await _generate_architecture_dot(prompt)
+
+
+async def _generate_architecture_dot(prompt: str, retry: int = 0) -> str:
+    """Call Ollama locally to generate DOT diagram (no DB access, safe to run as a task)."""
+    if retry == 0:
+        # Exact prompt only: these prompts share a long static prefix, so embedding
+        # similarity can't tell one project's inputs from another's
+        cached = await llm_cache.get("architecture", llm_cfg["model"], prompt, threshold=0)
+        if cached:
+            logger.info("♻️ Reusing cached architecture DOT")
+            return cached
+    try:
+        # Structured output: low temperature and a token cap keep decoding short
+        return await ollama_chat(
+            prompt, temperature=0.2, top_p=0.9, num_predict=config.OLLAMA_DOT_NUM_PREDICT
+        )
+    except Exception as e:
+        if retry < 2:
+            logger.warning(f"Ollama call failed (retry {retry+1}/3): {e}")
+            await anyio.sleep(2)
+            return await _generate_architecture_dot(prompt, retry + 1)
+        logger.error(f"Ollama architecture generation failed after retries: {e}")
+        return ""
 
 
 async def generate_architecture(
@@ -855,39 +1522,50 @@ async def generate_architecture(
     rfp_text: str,
     kb_chunks: List[str],
     blob_base_path: str,
+    dot_code: str | None = None,
 ) -> tuple[models.ProjectFile | None, str]:
     """
     Generate a visually clean, context-aware architecture diagram (PNG & SVG)
     from RFP + KB context using Ollama + Graphviz.
     Uses dynamic prompts that adapt layers automatically (no static template).
     Includes retry logic, sanitization, validation, and fallback diagram.
+    Pass dot_code when the DOT was already generated (see generate_project_scope).
+    Skips regeneration when the stored diagram was built from the same prompt inputs.
     """
 
     prompt = _build_architecture_prompt(rfp_text, kb_chunks, project)
+    blob_name_png = f"{blob_base_path}/architecture_{project.id}.png"
+    blob_name_svg = f"{blob_base_path}/architecture_{project.id}.svg"
+    input_key = _architecture_input_key(prompt, project)
+
+    # ---------- Step 0: Reuse the current diagram if the inputs are unchanged ----------
+    if dot_code is None and await _architecture_is_current(blob_name_png, input_key):
+        existing = await db.scalar(
+            select(models.ProjectFile)
+            .where(
+                models.ProjectFile.project_id == project.id,
+                models.ProjectFile.file_name == "architecture.png",
+                models.ProjectFile.file_path == blob_name_png,
+                models.ProjectFile.is_generated,
+            )
+            .limit(1)
+        )
+        if existing:
+            logger.info(f"♻️ Architecture inputs unchanged for project {project.id}, reusing {blob_name_png}")
+            return existing, blob_name_png
 
     # ---------- Step 1: Ask Ollama for Graphviz DOT code ----------
-    async def _generate_dot_from_ai(retry: int = 0) -> str:
-        """Call Ollama locally to generate DOT diagram."""
-        try:
-            return await anyio.to_thread.run_sync(lambda: ollama_chat(prompt, temperature=0.7))
-        except Exception as e:
-            if retry < 2:
-                logger.warning(f"Ollama call failed (retry {retry+1}/3): {e}")
-                await anyio.sleep(2)
-                return await _generate_dot_from_ai(retry + 1)
-            logger.error(f"Ollama architecture generation failed after retries: {e}")
-            return ""
-
-
-    dot_code = await _generate_dot_from_ai()
+    if dot_code is None:
+        dot_code = await _generate_architecture_dot(prompt)
     if not dot_code:
         logger.warning(" No DOT code returned by AI — generating fallback diagram")
         return await _generate_fallback_architecture(db, project, blob_base_path)
+    ai_dot = dot_code
 
     # ---------- Step 2: Clean & sanitize DOT ----------
-    dot_code = re.sub(r"```[a-zA-Z]*", "", dot_code).replace("```", "").strip()
+    dot_code = _DOT_FENCE_RE.sub("", dot_code).replace("```", "").strip()
     dot_code = dot_code.strip("`").strip()
-    dot_code = re.sub(r"(?i)^graph\s", "digraph ", dot_code)
+    dot_code = _DOT_GRAPH_RE.sub("digraph ", dot_code)
 
     # Fix brace mismatch
     open_braces = dot_code.count("{")
@@ -901,7 +1579,7 @@ async def generate_architecture(
         dot_code = f"digraph Architecture {{\n{dot_code}\n}}"
 
     # Remove control characters
-    dot_code = re.sub(r"[^\x09\x0A\x0D\x20-\x7E]", "", dot_code)
+    dot_code = _DOT_CTRL_RE.sub("", dot_code)
 
     # ---------- Step 3: Do NOT override GPT’s style ----------
     # Keep GPT’s own clusters, nodes, and colors — just ensure it's syntactically valid
@@ -909,68 +1587,22 @@ async def generate_architecture(
 
     # ---------- Step 4: Render DOT → PNG & SVG ----------
     try:
-        tmp_base = tempfile.NamedTemporaryFile(delete=False, suffix=".dot").name
-        graph = graphviz.Source(dot_code, engine="dot")
-
         # Render both PNG and SVG for better clarity
-        graph.render(tmp_base, format="png", cleanup=True)
-        graph.render(tmp_base, format="svg", cleanup=True)
-
-        png_path = tmp_base + ".png"
-        svg_path = tmp_base + ".svg"
+        png_bytes, svg_bytes = await anyio.to_thread.run_sync(_render_dot, dot_code)
     except Exception as e:
         logger.error(f" Graphviz rendering failed: {e}\n--- DOT Snippet ---\n{dot_code[:800]}")
         return await _generate_fallback_architecture(db, project, blob_base_path)
 
-    # ---------- Step 5: Upload PNG to Azure Blob ----------
-    blob_name_png = f"{blob_base_path}/architecture_{project.id}.png"
-    blob_name_svg = f"{blob_base_path}/architecture_{project.id}.svg"
-
-    try:
-        with open(png_path, "rb") as fh:
-            await azure_blob.upload_bytes(fh.read(), blob_name_png)
-
-        with open(svg_path, "rb") as fh:
-            await azure_blob.upload_bytes(fh.read(), blob_name_svg)
-    finally:
-        for path in [png_path, svg_path, tmp_base]:
-            try:
-                os.remove(path)
-            except FileNotFoundError:
-                pass
-
-    # ---------- Step 6: Replace old architecture file ----------
-    result = await db.execute(
-        select(models.ProjectFile).filter(
-            models.ProjectFile.project_id == project.id,
-            models.ProjectFile.file_name == "architecture.png",
-        )
-    )
-    old_file = result.scalars().first()
-    if old_file:
-        try:
-            await azure_blob.delete_blob(old_file.file_path)
-            await db.delete(old_file)
-            await db.commit()
-        except Exception as e:
-            logger.warning(f" Failed to delete old architecture.png: {e}")
+    # Only DOT that actually renders is worth reusing
+    await llm_cache.put("architecture", llm_cfg["model"], prompt, ai_dot, threshold=0)
 
-    # ---------- Step 7: Save new ProjectFile records (PNG + SVG) ----------
-    db_file_png = models.ProjectFile(
-        project_id=project.id,
-        file_name="architecture.png",
-        file_path=blob_name_png,
-    )
-    db_file_svg = models.ProjectFile(
-        project_id=project.id,
-        file_name="architecture.svg",
-        file_path=blob_name_svg,
+    # ---------- Step 5: Upload PNG to Azure Blob ----------
+    await _upload_diagrams(
+        png_bytes, blob_name_png, svg_bytes, blob_name_svg, metadata={"input_key": input_key}
     )
 
-    db.add_all([db_file_png, db_file_svg])
-    await db.commit()
-    await db.refresh(db_file_png)
-    await db.refresh(db_file_svg)
+    # ---------- Step 6: Replace old records with the new PNG + SVG ----------
+    db_file_png = await _store_architecture_files(db, project, blob_name_png, blob_name_svg)
 
     logger.info(
         f" Architecture diagrams stored successfully for project {project.id}: "
@@ -991,26 +1623,14 @@ async def clean_scope(db: AsyncSession, data: Dict[str, Any], project=None) -> D
 
     activities: List[Dict[str, Any]] = []
     start_dates, end_dates = [], []
-    role_month_map: Dict[str, Dict[str, float]] = {}
     role_order: List[str] = []
-
-    # --- Helper: compute monthly allocation based on actual days in month ---
-    def month_effort(s: datetime, e: datetime) -> Dict[str, float]:
-        cur = s
-        month_eff = {}
-        while cur <= e:
-            year, month = cur.year, cur.month
-            days_in_month = monthrange(year, month)[1]
-            start_day = cur.day if cur.month == s.month else 1
-            end_day = e.day if cur.month == e.month else days_in_month
-            days_count = end_day - start_day + 1
-            month_eff[f"{cur.strftime('%b %Y')}"] = round(days_count / 30.0, 2)
-            # move to next month
-            if month == 12:
-                cur = datetime(year + 1, 1, 1)
-            else:
-                cur = datetime(cur.year, cur.month + 1, 1)
-        return month_eff
+    role_idx: Dict[str, int] = {}
+    # Filled in the single activity pass for the usage matrix: day ordinals per
+    # activity and one (role, activity) entry per role involvement
+    start_days: List[int] = []
+    end_days: List[int] = []
+    inv_roles: List[int] = []
+    inv_acts: List[int] = []
 
     # --- Process activities ---
     for idx, a in enumerate(data.get("activities") or [], start=1):
@@ -1030,14 +1650,13 @@ async def clean_scope(db: AsyncSession, data: Dict[str, Any], project=None) -> D
         if e < s:
             e = s + timedelta(days=30)
 
-        # --- allocate per month (no splitting among roles) ---
-        month_alloc = month_effort(s, e)
+        # --- record roles in first-seen order (monthly effort is computed below) ---
         for role in roles:
-            if role not in role_month_map:
-                role_month_map[role] = {}
+            if role not in role_idx:
+                role_idx[role] = len(role_order)
                 role_order.append(role)
-            for m, eff in month_alloc.items():
-                role_month_map[role][m] = role_month_map[role].get(m, 0.0) + eff
+            inv_roles.append(role_idx[role])
+            inv_acts.append(idx - 1)
 
         dur_days = max(1, (e - s).days)
         activities.append({
@@ -1053,6 +1672,8 @@ async def clean_scope(db: AsyncSession, data: Dict[str, Any], project=None) -> D
 
         start_dates.append(s)
         end_dates.append(e)
+        start_days.append(s.toordinal())
+        end_days.append(e.toordinal())
 
         # --- Sort activities ---
     activities.sort(key=lambda x: x["Start Date"])
@@ -1070,49 +1691,29 @@ async def clean_scope(db: AsyncSession, data: Dict[str, Any], project=None) -> D
     month_labels = [f"Month {i}" for i in range(1, total_months + 1)]
 
     # --- Build per-role, per-month day usage ---
-    role_month_usage: Dict[str, Dict[str, float]] = {r: {m: 0.0 for m in month_labels} for r in role_order}
-
-    # Compute total active days per relative month window
-    for act in activities:
-        s = _parse_date_safe(act.get("Start Date"), today)
-        e = _parse_date_safe(act.get("End Date"), s + timedelta(days=30))
-        if e < s:
-            e = s + timedelta(days=30)
-
-        involved_roles = [act.get("Owner") or "Unassigned"] + [
-            r.strip() for r in str(act.get("Resources") or "").split(",") if r.strip()
-        ]
-
-        for m_idx in range(total_months):
-            rel_start = min_start + timedelta(days=m_idx * 30)
-            rel_end = min_start + timedelta(days=(m_idx + 1) * 30)
-
-            # overlap between activity and this relative month window
-            overlap_start = max(s, rel_start)
-            overlap_end = min(e, rel_end)
-            overlap_days = 0
-            if overlap_end >= overlap_start:
-                overlap_days = (overlap_end - overlap_start).days + 1
-
-            if overlap_days > 0:
-                for r in involved_roles:
-                    if r not in role_month_usage:
-                        role_month_usage[r] = {ml: 0.0 for ml in month_labels}
-                    role_month_usage[r][f"Month {m_idx + 1}"] += overlap_days
+    # Activities as day offsets from min_start; relative month m covers days
+    # [30*m, 30*(m+1)] (both ends inclusive)
+    base = min_start.toordinal()
+    starts = np.asarray(start_days, dtype=np.int64) - base
+    ends = np.asarray(end_days, dtype=np.int64) - base
+    # Repeated roles within an activity count once per mention, as before
+    involvement = np.zeros((len(role_order), len(start_days)), dtype=np.int64)
+    np.add.at(involvement, (np.asarray(inv_roles, dtype=np.intp), np.asarray(inv_acts, dtype=np.intp)), 1)
+
+    # Overlap (days) of every activity with every month window, then summed per role
+    month_start = np.arange(total_months, dtype=np.int64) * 30
+    overlap = (
+        np.minimum(ends[:, None], month_start + 30)
+        - np.maximum(starts[:, None], month_start)
+        + 1
+    ).clip(min=0).reshape(len(start_days), total_months)
+    days = involvement @ overlap
 
     # --- Convert days to effort with 4-tier partial-month logic ---
-    for r, months in role_month_usage.items():
-        for m, days in months.items():
-            if days > 21:
-                months[m] = 1.0
-            elif 15 <= days <= 21:
-                months[m] = 0.75
-            elif 8 <= days < 15:
-                months[m] = 0.5
-            elif 1 <= days < 8:
-                months[m] = 0.25
-            else:
-                months[m] = 0.0
+    effort = np.select([days > 21, days >= 15, days >= 8, days >= 1], [1.0, 0.75, 0.5, 0.25], default=0.0)
+    role_month_usage: Dict[str, Dict[str, float]] = {
+        r: dict(zip(month_labels, effort[i].tolist())) for i, r in enumerate(role_order)
+    }
 
     try:
         if db:
@@ -1190,42 +1791,80 @@ async def clean_scope(db: AsyncSession, data: Dict[str, Any], project=None) -> D
     return data
 
 
+async def _load_questions_context(project_id) -> str | None:
+    """Flush pending answers and render questions.json as Q&A lines for the scope prompt."""
+    questions_context = None
+    try:
+        q_blob_name = _questions_blob_name(project_id)
+        await flush_question_answers(q_blob_name)
+        if await azure_blob.blob_exists(q_blob_name):
+            q_bytes = await azure_blob.download_bytes(q_blob_name)
+            q_json = orjson.loads(q_bytes)
+
+            q_lines = []
+            for category in q_json.get("questions", []):
+                cat_name = category.get("category", "General")
+                q_lines.append(f"### {cat_name}")
+                for item in category.get("items", []):
+                    q = item.get("question", "").strip()
+                    a = item.get("user_understanding", "").strip() or "(unanswered)"
+                    comment = item.get("comment", "").strip()
+                    line = f"Q: {q}\nA: {a}"
+                    if comment:
+                        line += f"\nComment: {comment}"
+                    q_lines.append(line)
+
+            questions_context = "\n".join(q_lines)
+            logger.info(f"Loaded {len(q_lines)} question lines for project {project_id}")
+        else:
+            logger.info(f"No questions.json found for project {project_id}, skipping Q&A context.")
+
+    except Exception as e:
+        logger.warning(f" Could not include questions.json context: {e}")
+        questions_context = None
+    return questions_context
+
+
 async def generate_project_scope(db: AsyncSession, project) -> dict:
     """
     Generate project scope + architecture diagram + store architecture in DB + return combined JSON.
     """
 
+    # questions.json and the RFP files only need blob IO, so start both before the
+    # DB / tokenizer setup below and let them run alongside it
+    questions_task = asyncio.create_task(_load_questions_context(project.id))
+    files: List[dict] = []
+    try:
+        if getattr(project, "files", None):
+            files = [{"file_name": f.file_name, "file_path": f.file_path} for f in project.files]
+    except Exception as e:
+        logger.warning(f" Could not access project.files: {e}")
+        files = []
+    extract_task = asyncio.create_task(_extract_text_from_files(files)) if files else None
+
     #  Ensure the project has a valid company reference (fallback to Sigmoid)
     if not getattr(project, "company_id", None):
         from app.utils import ratecards
         sigmoid = await ratecards.get_or_create_sigmoid_company(db)
+        # Persisted with the generated scope (single commit at the end)
         project.company_id = sigmoid.id
-        await db.commit()
-        await db.refresh(project)
         logger.info(f"Linked project {project.id} to Sigmoid company as fallback")
 
-    tokenizer = tiktoken.get_encoding("cl100k_base")
+    tokenizer = get_tokenizer()
     context_limit = 128000
     max_total_tokens = context_limit - 4000
     used_tokens = 0
 
     # ---------- Extract RFP ----------
     rfp_text = ""
-    try:
-        files: List[dict] = []
-        if getattr(project, "files", None):
-            try:
-                files = [{"file_name": f.file_name, "file_path": f.file_path} for f in project.files]
-            except Exception as e:
-                logger.warning(f" Could not access project.files: {e}")
-                files = []
-        if files:
-            rfp_text = await _extract_text_from_files(files)
-    except Exception as e:
-        logger.warning(f"File extraction for project {getattr(project, 'id', None)} failed: {e}")
+    if extract_task is not None:
+        try:
+            rfp_text = await extract_task
+        except Exception as e:
+            logger.warning(f"File extraction for project {getattr(project, 'id', None)} failed: {e}")
 
     # ---------- Trim RFP text ----------
-    rfp_tokens = tokenizer.encode(rfp_text or "")
+    rfp_tokens = tokenizer.encode_ordinary(rfp_text or "")
     if len(rfp_tokens) > 5000:
         rfp_tokens = rfp_tokens[:5000]
     rfp_text = tokenizer.decode(rfp_tokens)
@@ -1308,65 +1947,45 @@ Project Summary:
 Generate activities with realistic start/end dates, proper role assignments, meaningful descriptions, and a comprehensive project summary.
 """
 
-    kb_results = _rag_retrieve(rfp_text or fallback_text)
-    kb_chunks = []
-    stop = False
-    for group in kb_results:
-        for ch in group["chunks"]:
-            chunk_tokens = len(tokenizer.encode(ch["content"]))
-            if used_tokens + chunk_tokens > max_total_tokens:
-                stop = True
-                break
-            kb_chunks.append(ch["content"])
-            used_tokens += chunk_tokens
-        if stop:
-            break
+    kb_results = await _rag_retrieve(rfp_text or fallback_text)
+    candidates = _dedupe_kb_chunks(kb_results)
+    kb_chunks, used_tokens = _fit_token_budget(candidates, used_tokens, max_total_tokens)
 
     logger.info(
         f"Final RFP tokens: {len(rfp_tokens)}, KB tokens: {used_tokens - len(rfp_tokens)}, Total: {used_tokens}/{max_total_tokens}"
     )
 
-    # ---------- Load questions.json (if exists) and build Q&A context ----------
-    questions_context = None
-    try:
-        q_blob_name = f"{PROJECTS_BASE}/{project.id}/questions.json"
-        if await azure_blob.blob_exists(q_blob_name):
-            q_bytes = await azure_blob.download_bytes(q_blob_name)
-            q_json = json.loads(q_bytes.decode("utf-8"))
-
-            q_lines = []
-            for category in q_json.get("questions", []):
-                cat_name = category.get("category", "General")
-                q_lines.append(f"### {cat_name}")
-                for item in category.get("items", []):
-                    q = item.get("question", "").strip()
-                    a = item.get("user_understanding", "").strip() or "(unanswered)"
-                    comment = item.get("comment", "").strip()
-                    line = f"Q: {q}\nA: {a}"
-                    if comment:
-                        line += f"\nComment: {comment}"
-                    q_lines.append(line)
-
-            questions_context = "\n".join(q_lines)
-            logger.info(f"Loaded {len(q_lines)} question lines for project {project.id}")
-        else:
-            logger.info(f"No questions.json found for project {project.id}, skipping Q&A context.")
-
-    except Exception as e:
-        logger.warning(f" Could not include questions.json context: {e}")
-        questions_context = None
-
-    
-
+    # ---------- Q&A context (loaded while the RFP was being extracted) ----------
+    questions_context = await questions_task
 
     # ---------- Build + query ----------
     prompt = _build_scope_prompt(rfp_text, kb_chunks, project, questions_context=questions_context)
+    # The architecture DOT only needs the RFP/KB context, so its LLM call runs
+    # alongside the scope call (skipped when the stored diagram has the same inputs);
+    # rendering and DB writes happen once both are done
+    blob_base_path = f"{PROJECTS_BASE}/{getattr(project, 'id', 'unknown')}"
+    arch_prompt = _build_architecture_prompt(rfp_text, kb_chunks, project)
+    arch_task = asyncio.create_task(
+        _architecture_dot_unless_current(
+            arch_prompt,
+            f"{blob_base_path}/architecture_{project.id}.png",
+            _architecture_input_key(arch_prompt, project),
+        )
+    )
     try:
         # Step 1: Generate scope via Ollama
-        logger.info(f"🤖 Calling Ollama for scope generation... (prompt length: {len(prompt)} chars)")
-        raw_text = await anyio.to_thread.run_sync(lambda: ollama_chat(prompt))
+        # Exact prompt only (see _generate_architecture_dot)
+        cached_text = await llm_cache.get("scope", llm_cfg["model"], prompt, threshold=0)
+        if cached_text:
+            logger.info("♻️ Reusing cached scope response")
+            raw_text = cached_text
+        else:
+            logger.info(f"🤖 Calling Ollama for scope generation... (prompt length: {len(prompt)} chars)")
+            raw_text = await ollama_chat(
+                prompt, stop_when=_JsonObjectEnd(), num_predict=config.OLLAMA_SCOPE_NUM_PREDICT
+            )
         logger.info(f"📝 Ollama raw response length: {len(raw_text)} chars")
-        logger.debug(f"📝 Ollama response preview (first 500 chars): {raw_text[:500]}")
+        logger.debug("📝 Ollama response preview (first 500 chars): %s", raw_text[:500])
 
         if not raw_text or len(raw_text.strip()) < 50:
             logger.error(f"❌ Ollama returned empty or too short response: {len(raw_text)} chars")
@@ -1374,6 +1993,7 @@ Generate activities with realistic start/end dates, proper role assignments, mea
             logger.error("   1. Ollama service is not running properly")
             logger.error("   2. The model (deepseek-r1) is not loaded")
             logger.error("   3. Out of memory or timeout")
+            arch_task.cancel()
             return {}
 
         raw = _extract_json(raw_text)
@@ -1395,8 +2015,12 @@ Generate activities with realistic start/end dates, proper role assignments, mea
                 logger.error("   1. Ollama service is running: curl http://localhost:11434/api/tags")
                 logger.error("   2. Model is loaded: ollama list")
                 logger.error("   3. Sufficient memory available")
+                arch_task.cancel()
                 return {}
 
+        if not cached_text and raw:
+            await llm_cache.put("scope", llm_cfg["model"], prompt, raw_text, threshold=0)
+
         cleaned_scope = await clean_scope(db, raw, project=project)
         # Update project fields from generated overview (just like finalize_scope)
         overview = cleaned_scope.get("overview", {})
@@ -1408,20 +2032,12 @@ Generate activities with realistic start/end dates, proper role assignments, mea
             project.use_cases = overview.get("Use Cases") or project.use_cases
             project.compliance = overview.get("Compliance") or project.compliance
             project.duration = str(overview.get("Duration") or project.duration)
-
-            try:
-                await db.commit()
-                await db.refresh(project)
-                logger.info(f" Project metadata updated from generated scope for project {project.id}")
-            except Exception as e:
-                logger.warning(f" Failed to update project metadata: {e}")
-
+            # Committed together with the architecture / finalized_scope.json records below
 
         # Step 2: Generate + store architecture diagram
         try:
-            blob_base_path = f"{PROJECTS_BASE}/{getattr(project, 'id', 'unknown')}"
             db_file, arch_blob = await generate_architecture(
-                db, project, rfp_text, kb_chunks, blob_base_path
+                db, project, rfp_text, kb_chunks, blob_base_path, dot_code=await arch_task
             )
             cleaned_scope["architecture_diagram"] = arch_blob or None
         except Exception as e:
@@ -1430,64 +2046,271 @@ Generate activities with realistic start/end dates, proper role assignments, mea
 
         # Step 3: Auto-save finalized_scope.json in Azure Blob + DB
         try:
-            from sqlalchemy import select
-            result = await db.execute(
-                select(models.ProjectFile).filter(
-                    models.ProjectFile.project_id == project.id,
-                    models.ProjectFile.file_name == "finalized_scope.json",
-                )
-            )
-            old_file = result.scalars().first()
-            if old_file:
-                logger.info(f"Overwriting existing finalized_scope.json for project {project.id}")
-            else:
-                old_file = models.ProjectFile(
-                    project_id=project.id,
-                    file_name="finalized_scope.json",
-                )
-
-            blob_name = f"{PROJECTS_BASE}/{project.id}/finalized_scope.json"
-
-            await azure_blob.upload_bytes(
-                json.dumps(cleaned_scope, ensure_ascii=False, indent=2).encode("utf-8"),
-                blob_name,
-                overwrite=True, 
-            )
-
-            old_file.file_path = blob_name
-            db.add(old_file)
-            await db.commit()
-            await db.refresh(old_file)
+            await _save_generated_file(db, project.id, "finalized_scope.json", _dump_json(cleaned_scope))
 
             logger.info(f" finalized_scope.json overwritten for project {project.id}")
 
         except Exception as e:
             logger.warning(f" Failed to auto-save finalized_scope.json: {e}")
+
+        # One commit for the company link, metadata update and finalized_scope.json record
+        try:
+            await db.commit()
+            logger.info(f" Project metadata updated from generated scope for project {project.id}")
+        except Exception as e:
+            logger.warning(f" Failed to update project metadata: {e}")
+            await db.rollback()
         return cleaned_scope
 
     except Exception as e:
         logger.error(f"Ollama scope generation failed: {e}")
+        arch_task.cancel()
         return {}
 
 
-async def regenerate_from_instructions(
-    db: AsyncSession,
-    project: models.Project,
-    draft: dict,
-    instructions: str
-) -> dict:
+# JSON Schema for regenerated scopes, passed as Ollama's `format` so decoding is
+# constrained to this shape (Ollama >= 0.5 structured outputs)
+SCOPE_SCHEMA: Dict[str, Any] = {
+    "type": "object",
+    "properties": {
+        "overview": {"type": "object"},
+        "activities": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "ID": {"type": "integer"},
+                    "Activities": {"type": "string"},
+                    "Description": {"type": "string"},
+                    "Owner": {"type": "string"},
+                    "Resources": {"type": "string"},
+                    "Start Date": {"type": "string", "format": "date"},
+                    "End Date": {"type": "string", "format": "date"},
+                    "Effort Months": {"type": "number"},
+                },
+                "required": [
+                    "ID", "Activities", "Description", "Owner", "Resources",
+                    "Start Date", "End Date", "Effort Months",
+                ],
+            },
+        },
+        "resourcing_plan": {"type": "array", "items": {"type": "object"}},
+        "discount_percentage": {"type": "number"},
+    },
+    "required": ["overview", "activities"],
+}
+
+
+def _match_role_removal(instructions_lower: str) -> re.Match | None:
     """
-    Regenerate the project scope from user instructions using a creative AI-guided prompt.
-    Enhances activity sequencing, roles, and effort estimates while preserving valid JSON structure.
+    Match "remove <role>" (multi-word role up to the end or a delimiter); group(1) is
+    the role. Pass the lowercased instructions: the role is compared in lowercase.
     """
-    logger.info(f" Regenerating scope for project {project.id} with creative AI response...")
+    return _REMOVE_ROLE_RE.search(instructions_lower)
 
-    if not instructions or not instructions.strip():
-        cleaned = await clean_scope(db, draft, project=project)
-        return {**cleaned, "_finalized": True}
+
+def _match_discount(instructions: str) -> re.Match | None:
+    """Match a discount request ("5% discount", "apply 10% discount", ...); group(1) is the percentage."""
+    for pattern in _DISCOUNT_RES:
+        match = pattern.search(instructions)
+        if match:
+            return match
+    return None
 
 
-    prompt = f"""
+def _discount_percentage(match: re.Match) -> int | float:
+    """Percentage from a _match_discount match; whole numbers stay ints (5.5% stays 5.5)."""
+    value = float(match.group(1))
+    return int(value) if value.is_integer() else value
+
+
+def _remove_role_from_activity(
+    act: dict, role_to_remove: str, resources_list: List[str] | None = None
+) -> bool:
+    """
+    Drop a role from one activity in place: if it owns the activity, ownership goes to
+    the first other resource (or Project Manager), and the role is removed from Resources.
+    resources_list is the already-split Resources, if the caller has it.
+    Returns True if anything changed.
+    """
+    if resources_list is None:
+        resources_list = [r.strip() for r in str(act.get('Resources') or '').split(',') if r.strip()]
+    changes_made = False
+
+    # Check if this role is the owner
+    if role_to_remove in act.get('Owner', '').lower():
+        remaining = [r for r in resources_list if role_to_remove not in r.lower()]
+        if remaining:
+            # Use the first remaining resource as the new owner (and drop it from resources)
+            new_owner, resources_list = remaining[0], remaining[1:]
+            act['Owner'] = new_owner
+            act['Resources'] = ', '.join(resources_list)
+            logger.debug("  → Reassigned activity '%s' from removed role to '%s'", act.get('Activities', 'Unknown'), new_owner)
+        else:
+            # No resources available, use a generic default
+            act['Owner'] = 'Project Manager'
+            logger.debug("  → Reassigned activity '%s' from removed role to 'Project Manager'", act.get('Activities', 'Unknown'))
+        changes_made = True
+
+    # Remove from resources field (case-insensitive partial match)
+    filtered_resources = [r for r in resources_list if role_to_remove not in r.lower()]
+    if len(filtered_resources) != len(resources_list):
+        act['Resources'] = ', '.join(filtered_resources)
+        changes_made = True
+    return changes_made
+
+
+def _remove_role_from_activities(activities: List[dict], role_to_remove: str) -> bool:
+    """Drop a role from every activity in place; True if anything changed."""
+    changes_made = False
+    for act in activities:
+        changes_made |= _remove_role_from_activity(act, role_to_remove)
+    return changes_made
+
+
+# Instructions containing any of these need the LLM even if they also ask for a discount/removal
+_CREATIVE_VERBS = frozenset({"add", "split", "merge", "optimize", "rebalance"})
+# Words that may surround a discount / "remove <role>" request without changing its meaning
+_FAST_PATH_FILLER = frozenset({
+    "please", "and", "also", "then", "the", "a", "an", "of", "on", "to", "from", "for",
+    "in", "all", "every", "activities", "activity", "scope", "project", "plan", "role",
+    "discount", "percent", "total", "cost", "overall", "kindly", "can", "you", "just",
+    "apply", "give", "offer", "with", "it",
+})
+
+
+def _apply_deterministic_mutation(draft: dict, instructions: str) -> dict | None:
+    """
+    Apply instructions that only ask for a discount and/or removing a role the draft
+    uses, without the LLM (same edits as the post-processing fallbacks). Returns the
+    updated scope, or None when anything else is asked for.
+    """
+    text = instructions.lower()
+    keywords = _instruction_keywords(text)
+    if keywords & _CREATIVE_VERBS:
+        return None
+
+    discount_match = _match_discount(text)
+    remove_match = _match_role_removal(text) if "remove" in keywords else None
+    if not discount_match and not remove_match:
+        return None
+
+    # Anything left besides the matched requests and filler words needs the LLM
+    leftover = text
+    for match in (discount_match, remove_match):
+        if match:
+            leftover = leftover.replace(match.group(0), " ")
+    if any(word not in _FAST_PATH_FILLER for word in _WORD_RE.findall(leftover)):
+        return None
+    # A number the patterns didn't consume (e.g. a second percentage) isn't understood either
+    if _NUMBER_RE.search(leftover):
+        return None
+
+    updated = {**draft, "activities": [dict(act) for act in draft.get("activities") or []]}
+    if remove_match:
+        role_to_remove = remove_match.group(1).strip()
+        draft_roles = set()
+        for act in updated["activities"]:
+            draft_roles.add(str(act.get("Owner", "")).strip().lower())
+            draft_roles.update(r.strip().lower() for r in str(act.get("Resources", "")).split(","))
+        # "remove <something>" that isn't a role in use (e.g. an activity) is a creative edit
+        if role_to_remove not in draft_roles:
+            return None
+        _remove_role_from_activities(updated["activities"], role_to_remove)
+    if discount_match:
+        updated["discount_percentage"] = _discount_percentage(discount_match)
+    return updated
+
+
+def _activity_stats(activities: List[dict], role_to_remove: str | None = None) -> Dict[str, Any]:
+    """
+    One pass over the regenerated activities for the validation counters and role sets
+    (as generated). With role_to_remove, the role-removal fallback is applied in the same
+    pass, after each activity has been counted; "removed" tells whether it changed anything.
+    """
+    unassigned = empty_desc = role_named = 0
+    # Only "do all activities share one date range?" matters, so stop comparing
+    # once two distinct ranges have been seen
+    first_dates = None
+    distinct_dates = False
+    owners = set()
+    resources = set()
+    removed = False
+    for act in activities:
+        owners.add(act.get('Owner', 'Unknown'))
+        if act.get('Owner', '').lower() in ('unassigned', ''):
+            unassigned += 1
+        if not act.get('Description', '').strip():
+            empty_desc += 1
+        if act.get('Activities', '').lower().strip() in _COMMON_ROLES:
+            role_named += 1
+        if not distinct_dates:
+            pair = (act.get('Start Date'), act.get('End Date'))
+            if first_dates is None:
+                first_dates = pair
+            elif pair != first_dates:
+                distinct_dates = True
+        res = act.get('Resources', '')
+        res_list = [r.strip() for r in str(res).split(',') if r.strip()] if res else []
+        resources.update(res_list)
+        if role_to_remove:
+            removed |= _remove_role_from_activity(act, role_to_remove, res_list)
+    return {
+        "unassigned": unassigned,
+        "empty_desc": empty_desc,
+        "role_named": role_named,
+        "first_dates": first_dates,
+        "distinct_dates": distinct_dates,
+        "owners": owners,
+        "resources": resources,
+        "removed": removed,
+    }
+
+
+def _draft_sig(draft: dict) -> str:
+    """Stable content hash of a draft scope (key order independent)."""
+    return hashlib.sha256(orjson.dumps(draft, option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS)).hexdigest()
+
+
+def _referenced_activities(draft: dict, instructions_lower: str) -> List[int]:
+    """Positions (in draft["activities"]) of activities the instruction names, by ID or by name."""
+    ids = {int(n) for m in _ACTIVITY_REF_RE.findall(instructions_lower) for n in _NUMBER_RE.findall(m)}
+    targets = []
+    for i, act in enumerate(draft.get("activities") or []):
+        name = str(act.get("Activities", "")).strip().lower()
+        if act.get("ID") in ids or (len(name) >= 4 and name in instructions_lower):
+            targets.append(i)
+    return targets
+
+
+def _regen_cache_kind(draft: dict, instructions_lower: str) -> str:
+    """
+    llm_cache namespace for a regeneration: the exact draft (_draft_sig) plus the
+    instruction keywords (remove/add/split/merge...), the activities it references and
+    the numbers and role names it mentions, so a semantic hit can only come from a
+    paraphrase ("give a 5% discount" vs "apply 5% discount"), never "5%" vs "10%",
+    another role or activity, or the opposite operation ("add" vs "remove").
+    """
+    text = instructions_lower
+    roles = {r.lower() for r in ROLE_RATE_MAP}
+    for act in draft.get("activities", []) or []:
+        roles.add(str(act.get("Owner", "")).strip().lower())
+        roles.update(r.strip().lower() for r in str(act.get("Resources", "")).split(","))
+    mentioned = sorted(r for r in roles if r and r in text)
+    numbers = _NUMBER_RE.findall(text)
+    guard = hashlib.sha256(orjson.dumps([
+        _draft_sig(draft),
+        sorted(_instruction_keywords(text)),
+        _referenced_activities(draft, text),
+        numbers,
+        mentioned,
+    ])).hexdigest()
+    return f"regenerate:{guard}"
+
+
+# Instruction-driven regeneration prompt (_regenerate_with_llm); rendered with
+# .format(instructions=..., draft_json=...)
+_REGEN_PROMPT_TEMPLATE = """
 You are an **expert AI project planner and delivery architect** responsible for maintaining a project scope in JSON format.
 
 You are given:
@@ -1513,34 +2336,8 @@ Your task:
 - Use valid ISO dates (`yyyy-mm-dd`).
 - Keep total duration ≤ 12 months.
 
-**CRITICAL: What activities look like**
-CORRECT activity example:
-```json
-{{
-  "ID": 1,
-  "Activities": "Project Initiation and Requirements Gathering",
-  "Description": "Define project scope, gather requirements, create initial documentation",
-  "Owner": "Project Manager",
-  "Resources": "Business Analyst, Data Architect",
-  "Start Date": "2025-01-15",
-  "End Date": "2025-02-28",
-  "Effort Months": 1.5
-}}
-```
-
-WRONG activity example (DO NOT DO THIS):
-```json
-{{
-  "ID": 1,
-  "Activities": "Project Manager",  ← WRONG! This is a role name, not an activity!
-  "Description": "",  ← WRONG! Must have meaningful description!
-  "Owner": "Unassigned",  ← WRONG! Must have a real owner!
-  "Resources": "",
-  "Start Date": "2025-01-15",
-  "End Date": "2025-02-15",
-  "Effort Months": 1
-}}
-```
+**CRITICAL:** "Activities" is a task name (e.g. "Project Initiation and Requirements Gathering"),
+never a role name; every activity needs a meaningful "Description" and a real "Owner" role (not "Unassigned").
 
 ####  Temporal Adjustment Rules
 Use these to keep the schedule consistent and continuous.
@@ -1655,19 +2452,113 @@ User Instructions:
 {instructions}
 
 Current Draft Scope:
-{json.dumps(draft, indent=2, ensure_ascii=False)}
+{draft_json}
 
 Return only the updated JSON.
 """
 
 
+# Instructions mentioning any of these may touch activities they don't name
+_GLOBAL_EDIT_WORDS = frozenset({
+    "all", "every", "each", "other", "timeline", "schedule", "duration", "overall",
+    "project", "phase", "phases", "roles", "team", "budget", "cost",
+})
+
+_REGEN_LOCAL_EDIT_NOTE = """
+NOTE: This is a local edit. `activities` above holds ONLY the activities the instruction
+refers to; `activities_summary` lists every activity as [ID, name, start, end] for
+scheduling context. Return in `activities` ONLY the replacements for the included
+activities (e.g. both halves of a split, or the single merged activity). All other
+activities are kept unchanged automatically — do not return them.
+"""
+
+
+def _local_edit_targets(draft: dict, instructions_lower: str, keywords: set) -> List[int] | None:
+    """
+    Positions (in draft["activities"]) of the activities a local edit refers to, by ID
+    ("split activity 3") or by name, or None when the instruction may touch the rest
+    of the scope (role/discount/add requests, global wording, or no clear reference).
+    """
+    activities = draft.get("activities") or []
+    if keywords - {"split", "merge"} or len(activities) < 2:
+        return None
+    if _GLOBAL_EDIT_WORDS.intersection(_WORD_RE.findall(instructions_lower)):
+        return None
+
+    targets = _referenced_activities(draft, instructions_lower)
+    return targets if 0 < len(targets) < len(activities) else None
+
+
+def _trim_draft(draft: dict, targets: List[int]) -> dict:
+    """The referenced activities in full plus a one-line summary of every activity."""
+    activities = draft.get("activities") or []
+    return {
+        "overview": draft.get("overview", {}),
+        "activities": [activities[i] for i in targets],
+        "activities_summary": [
+            [a.get("ID"), a.get("Activities"), a.get("Start Date"), a.get("End Date")]
+            for a in activities
+        ],
+    }
+
+
+def _merge_local_edit(draft: dict, targets: List[int], edited: List[dict]) -> List[dict]:
+    """Draft activities with the targeted ones replaced by edited (at the first target)."""
+    first, target_set = targets[0], set(targets)
+    merged: List[dict] = []
+    for i, act in enumerate(draft.get("activities") or []):
+        if i == first:
+            merged.extend(edited)
+        if i not in target_set:
+            merged.append(act)
+    return merged
+
+
+async def _regenerate_with_llm(
+    db: AsyncSession,
+    project: models.Project,
+    draft: dict,
+    instructions: str
+) -> dict:
+    """Creative path of regenerate_from_instructions: prompt Ollama, validate, clean."""
+    instructions_lower = instructions.lower()
+    keywords = _instruction_keywords(instructions_lower)
+    # Local edits ("split activity 3") only need the activities they refer to in full
+    targets = _local_edit_targets(draft, instructions_lower, keywords)
+    if targets is None:
+        prompt = _REGEN_PROMPT_TEMPLATE.format(instructions=instructions, draft_json=_dump_json(draft).decode())
+    else:
+        logger.info(f"✂️ Local edit: sending {len(targets)}/{len(draft['activities'])} activities in full")
+        prompt = _REGEN_PROMPT_TEMPLATE.format(
+            instructions=instructions, draft_json=_dump_json(_trim_draft(draft, targets)).decode()
+        ) + _REGEN_LOCAL_EDIT_NOTE
+
+
     # ---- Query Ollama creatively ----
     # Use lower temperature for more consistent instruction-following
     try:
-        raw_text = await anyio.to_thread.run_sync(lambda: ollama_chat(prompt, temperature=0.2))
+        # Same draft + same (or paraphrased) instruction → reuse the validated result
+        cache_kind = _regen_cache_kind(draft, instructions_lower) if config.PLAN_CACHE_ENABLED else None
+        instruction_key = " ".join(instructions_lower.split())
+        cached_text = None
+        if cache_kind:
+            cached_text = await llm_cache.get(
+                cache_kind, llm_cfg["model"], instruction_key, threshold=config.PLAN_CACHE_SIM_THRESHOLD
+            )
+        if cached_text:
+            logger.info("♻️ Reusing cached regeneration for this draft and instruction")
+            raw_text = cached_text
+        else:
+            raw_text = await ollama_chat(
+                prompt, temperature=0.2, stop_when=_JsonObjectEnd(), format=SCOPE_SCHEMA
+            )
         logger.info(f"🤖 LLM response length: {len(raw_text)} chars")
-        logger.debug(f"LLM raw response (first 500 chars): {raw_text[:500]}")
+        logger.debug("LLM raw response (first 500 chars): %s", raw_text[:500])
         updated_scope = _extract_json(raw_text)
+        # Only the targeted activities came back; an empty edit is left to the checks below
+        if targets is not None and updated_scope.get("activities"):
+            updated_scope["activities"] = _merge_local_edit(draft, targets, updated_scope["activities"])
+        updated_scope.pop("activities_summary", None)
 
         logger.info(f"📊 Extracted scope structure: overview={bool(updated_scope.get('overview'))}, "
                    f"activities={len(updated_scope.get('activities', []))}, "
@@ -1676,26 +2567,26 @@ Return only the updated JSON.
         # Validate activity count - prevent accidental scope replacement
         original_activity_count = len(draft.get('activities', []))
         new_activity_count = len(updated_scope.get('activities', []))
-        is_removal_instruction = any(word in instructions.lower() for word in ['remove', 'delete'])
+        is_removal_instruction = bool(keywords & _REMOVAL_KEYWORDS)
 
         # Advanced validation: Check if activities are valid/meaningful
         activities_are_valid = True
         validation_failures = []
 
-        if updated_scope.get('activities'):
-            unassigned_count = sum(1 for act in updated_scope['activities'] if act.get('Owner', '').lower() in ['unassigned', ''])
-            empty_desc_count = sum(1 for act in updated_scope['activities'] if not act.get('Description', '').strip())
-
-            # Check if activity names are just role names (common LLM mistake)
-            common_roles = ['project manager', 'business analyst', 'data architect', 'data engineer',
-                           'backend developer', 'frontend developer', 'qa engineer', 'devops engineer',
-                           'cloud architect', 'data analyst', 'ux designer']
-            role_name_activities = sum(1 for act in updated_scope['activities']
-                                      if act.get('Activities', '').lower().strip() in common_roles)
+        # Role-removal fallback (if the LLM left the role in) runs inside the stats pass
+        role_match = _match_role_removal(instructions_lower) if 'remove' in keywords else None
+        role_to_remove = role_match.group(1).strip() if role_match else None
+        if role_to_remove:
+            logger.info(f"🔧 Post-processing: attempting to remove '{role_to_remove}'")
 
-            # Check if all activities have identical dates (suspicious)
-            dates = [(act.get('Start Date'), act.get('End Date')) for act in updated_scope['activities']]
-            unique_date_pairs = len(set(dates))
+        stats = _activity_stats(updated_scope.get('activities') or [], role_to_remove)
+        if updated_scope.get('activities'):
+            unassigned_count = stats["unassigned"]
+            empty_desc_count = stats["empty_desc"]
+            # Activity names that are just role names (common LLM mistake)
+            role_name_activities = stats["role_named"]
+            # All activities having identical dates is suspicious
+            all_same_dates = not stats["distinct_dates"]
 
             # Validation thresholds
             if unassigned_count > new_activity_count * 0.5:  # More than 50% unassigned
@@ -1710,12 +2601,14 @@ Return only the updated JSON.
                 activities_are_valid = False
                 validation_failures.append(f"{role_name_activities}/{new_activity_count} activities are named after roles (e.g. 'Project Manager', 'Data Engineer')")
 
-            if unique_date_pairs == 1 and new_activity_count > 1:  # All activities have same dates
+            if all_same_dates and new_activity_count > 1:  # All activities have same dates
                 activities_are_valid = False
-                validation_failures.append(f"All {new_activity_count} activities have identical dates: {dates[0]}")
+                validation_failures.append(f"All {new_activity_count} activities have identical dates: {stats['first_dates']}")
 
         # If LLM significantly reduced activities OR created invalid activities, restore original
+        restored = False
         if (new_activity_count < (original_activity_count * 0.7) and not is_removal_instruction) or not activities_are_valid:
+            restored = True
             if not activities_are_valid:
                 logger.error(f"❌ LLM GENERATED INVALID ACTIVITIES!")
                 for failure in validation_failures:
@@ -1732,103 +2625,43 @@ Return only the updated JSON.
                 updated_scope["resourcing_plan"] = draft.get("resourcing_plan", [])
 
             logger.info(f"   ✅ Restored {len(updated_scope['activities'])} valid activities from draft")
+            stats = _activity_stats(updated_scope['activities'], role_to_remove)
 
-        # Log roles found in activities
+        # Log roles found in activities (the full role sets only at DEBUG)
         if updated_scope.get('activities'):
-            owners = set(act.get('Owner', 'Unknown') for act in updated_scope['activities'])
-            all_resources = set()
-            for act in updated_scope['activities']:
-                resources = act.get('Resources', '')
-                if resources:
-                    all_resources.update(r.strip() for r in str(resources).split(',') if r.strip())
+            owners = stats["owners"]
+            all_resources = stats["resources"]
             all_roles = owners | all_resources
-            logger.info(f"🎭 Roles in LLM response - Owners: {owners}, Resources: {all_resources}")
+            logger.debug("🎭 Roles in LLM response - Owners: %s, Resources: %s", owners, all_resources)
 
             # Validate that "remove" instructions were followed
-            if instructions and 'remove' in instructions.lower():
+            if 'remove' in keywords:
                 for role in all_roles:
-                    if role.lower() in instructions.lower() and 'remove' in instructions.lower():
+                    if role.lower() in instructions_lower:
                         logger.error(f"❌ LLM FAILED to remove '{role}' - still present in activities despite user instruction!")
 
             # Validate that "add" instructions were followed
-            if instructions and 'add' in instructions.lower():
+            if 'add' in keywords:
                 # This is harder to validate automatically, but we log for manual inspection
-                logger.info(f"ℹ️ User requested to add role(s). Current roles: {all_roles}")
-
-        # Post-processing fallback: manually remove roles if LLM failed
-        if instructions and 'remove' in instructions.lower() and updated_scope.get('activities'):
-            # Extract role to remove from instructions (basic pattern matching)
-            import re
-            # Pattern to match "remove <role>" where role can be multi-word
-            # Matches everything after "remove" until end of string or common delimiters
-            remove_pattern = r'remove\s+([a-zA-Z\s]+?)(?:\s*(?:from|,|\.|\band\b|$))'
-            match = re.search(remove_pattern, instructions.lower(), re.IGNORECASE)
-            if match:
-                role_to_remove = match.group(1).strip()
-                logger.info(f"🔧 Post-processing: attempting to remove '{role_to_remove}'")
-
-                # Track if we made changes
-                changes_made = False
-
-                # Process each activity
-                for act in updated_scope['activities']:
-                    # Check if this role is the owner
-                    if act.get('Owner', '').lower() == role_to_remove or role_to_remove in act.get('Owner', '').lower():
-                        # Find a replacement owner from resources or use a default
-                        resources = act.get('Resources', '')
-                        if resources and resources.strip():
-                            # Use the first resource as the new owner
-                            new_owner = resources.split(',')[0].strip()
-                            # Remove new owner from resources to avoid duplication
-                            remaining_resources = [r.strip() for r in resources.split(',')[1:] if r.strip()]
-                            act['Owner'] = new_owner
-                            act['Resources'] = ', '.join(remaining_resources)
-                            logger.info(f"  → Reassigned activity '{act.get('Activities', 'Unknown')}' from removed role to '{new_owner}'")
-                            changes_made = True
-                        else:
-                            # No resources available, use a generic default
-                            act['Owner'] = 'Project Manager'
-                            logger.info(f"  → Reassigned activity '{act.get('Activities', 'Unknown')}' from removed role to 'Project Manager'")
-                            changes_made = True
-
-                    # Remove from resources field
-                    if act.get('Resources'):
-                        resources_list = [r.strip() for r in str(act['Resources']).split(',') if r.strip()]
-                        # Filter out the role to remove (case-insensitive partial match)
-                        filtered_resources = [r for r in resources_list
-                                             if role_to_remove not in r.lower() and r.lower() != role_to_remove]
-                        if len(filtered_resources) != len(resources_list):
-                            act['Resources'] = ', '.join(filtered_resources)
-                            changes_made = True
-
-                if changes_made:
-                    logger.info(f"✅ Post-processing successfully removed role '{role_to_remove}' from activities")
+                logger.debug("ℹ️ User requested to add role(s). Current roles: %s", all_roles)
+
+        # Post-processing fallback: roles the LLM failed to remove were dropped in the stats pass
+        if role_to_remove and stats["removed"]:
+            logger.info(f"✅ Post-processing successfully removed role '{role_to_remove}' from activities")
 
         # Post-processing: parse discount percentage from instructions
         if instructions:
-            import re
-            # Pattern to match discount requests: "5% discount", "apply 10% discount", "give 15% discount", etc.
-            discount_patterns = [
-                r'(\d+)\s*%\s*discount',
-                r'discount\s+(?:of\s+)?(\d+)\s*%',
-                r'apply\s+(\d+)\s*%',
-                r'give\s+(\d+)\s*%',
-            ]
-            discount_found = False
-            for pattern in discount_patterns:
-                match = re.search(pattern, instructions.lower())
-                if match:
-                    discount_percentage = int(match.group(1))
-                    logger.info(f"💰 Post-processing: detected {discount_percentage}% discount request")
-
-                    # Add discount to updated_scope if not already present
-                    if "discount_percentage" not in updated_scope or not updated_scope.get("discount_percentage"):
-                        updated_scope["discount_percentage"] = discount_percentage
-                        logger.info(f"  → Added discount_percentage: {discount_percentage}")
-                    discount_found = True
-                    break
+            match = _match_discount(instructions)
+            if match:
+                discount_percentage = _discount_percentage(match)
+                logger.info(f"💰 Post-processing: detected {discount_percentage}% discount request")
 
-            if not discount_found and any(word in instructions.lower() for word in ['discount', 'reduction', 'reduce cost']):
+                # Add discount to updated_scope if not already present
+                if "discount_percentage" not in updated_scope or not updated_scope.get("discount_percentage"):
+                    updated_scope["discount_percentage"] = discount_percentage
+                    logger.info(f"  → Added discount_percentage: {discount_percentage}")
+
+            if not match and keywords & _DISCOUNT_KEYWORDS:
                 logger.warning(f"⚠️ User mentioned discount but couldn't parse percentage. Instructions: {instructions[:100]}")
 
         # Safety check: if LLM returned empty activities, preserve original
@@ -1839,6 +2672,13 @@ Return only the updated JSON.
             updated_scope["activities"] = draft.get("activities", [])
             if "resourcing_plan" not in updated_scope or not updated_scope.get("resourcing_plan"):
                 updated_scope["resourcing_plan"] = draft.get("resourcing_plan", [])
+            restored = True
+
+        # Only LLM output that passed validation is worth reusing
+        if cache_kind and not cached_text and not restored:
+            await llm_cache.put(
+                cache_kind, llm_cfg["model"], instruction_key, raw_text, threshold=config.PLAN_CACHE_SIM_THRESHOLD
+            )
 
         cleaned = await clean_scope(db, updated_scope, project=project)
         logger.info(f"✅ Cleaned scope: {len(cleaned.get('activities', []))} activities, "
@@ -1848,6 +2688,34 @@ Return only the updated JSON.
         logger.error(f" Creative regeneration failed: {e}")
         cleaned = await clean_scope(db, draft, project=project)
 
+    return cleaned
+
+
+async def regenerate_from_instructions(
+    db: AsyncSession,
+    project: models.Project,
+    draft: dict,
+    instructions: str
+) -> dict:
+    """
+    Regenerate the project scope from user instructions using a creative AI-guided prompt.
+    Enhances activity sequencing, roles, and effort estimates while preserving valid JSON structure.
+    Plain discount / role-removal instructions are applied directly without the LLM.
+    """
+    logger.info(f" Regenerating scope for project {project.id} with creative AI response...")
+
+    if not instructions or not instructions.strip():
+        cleaned = await clean_scope(db, draft, project=project)
+        return {**cleaned, "_finalized": True}
+
+    # ---- Discount / role removal only: apply directly, no LLM round-trip ----
+    fast_scope = _apply_deterministic_mutation(draft, instructions)
+    if fast_scope is not None:
+        logger.info(f"⚡ Applied instructions deterministically (no LLM): '{instructions[:100]}'")
+        cleaned = await clean_scope(db, fast_scope, project=project)
+    else:
+        cleaned = await _regenerate_with_llm(db, project, draft, instructions)
+
     # ---- Update project metadata from overview ----
     overview = cleaned.get("overview", {})
     if overview:
@@ -1858,31 +2726,11 @@ Return only the updated JSON.
         project.use_cases = overview.get("Use Cases") or project.use_cases
         project.compliance = overview.get("Compliance") or project.compliance
         project.duration = str(overview.get("Duration") or project.duration)
-        await db.commit()
-        await db.refresh(project)
         logger.info(f" Project metadata synced for project {project.id}")
 
-    # ---- Overwrite finalized_scope.json in Blob ----
-    result = await db.execute(
-        select(models.ProjectFile).filter(
-            models.ProjectFile.project_id == project.id,
-            models.ProjectFile.file_name == "finalized_scope.json",
-        )
-    )
-    old_file = result.scalars().first() or models.ProjectFile(
-        project_id=project.id, file_name="finalized_scope.json"
-    )
-
-    blob_name = f"{PROJECTS_BASE}/{project.id}/finalized_scope.json"
-    await azure_blob.upload_bytes(
-        json.dumps(cleaned, ensure_ascii=False, indent=2).encode("utf-8"),
-        blob_name,
-        overwrite=True,
-    )
-    old_file.file_path = blob_name
-    db.add(old_file)
+    # ---- Overwrite finalized_scope.json in Blob (committed with the metadata) ----
+    await _save_generated_file(db, project.id, "finalized_scope.json", _dump_json(cleaned))
     await db.commit()
-    await db.refresh(old_file)
 
     logger.info(f" Creative finalized_scope.json regenerated for project {project.id}")
     return {**cleaned, "_finalized": True}
@@ -1901,12 +2749,11 @@ async def finalize_scope(
     logger.info(f"Finalizing scope (no LLM) for project {project_id}...")
 
     # ---- Load project ----
-    result = await db.execute(
-        select(models.Project)
-        .options(selectinload(models.Project.company))
-        .filter(models.Project.id == project_id)
+    # Callers have usually loaded it in this session already (projects.get_project),
+    # in which case the identity map answers without a round-trip
+    project = await db.get(
+        models.Project, project_id, options=[selectinload(models.Project.company)]
     )
-    project = result.scalars().first()
     if not project:
         raise ValueError(f"Project {project_id} not found")
 
@@ -1923,36 +2770,10 @@ async def finalize_scope(
         project.use_cases = overview.get("Use Cases") or project.use_cases
         project.compliance = overview.get("Compliance") or project.compliance
         project.duration = str(overview.get("Duration") or project.duration)
-        await db.commit()
-        await db.refresh(project)
-
-    # ---- Step 3: Save finalized_scope.json ----
-    result = await db.execute(
-        select(models.ProjectFile).filter(
-            models.ProjectFile.project_id == project_id,
-            models.ProjectFile.file_name == "finalized_scope.json"
-        )
-    )
-    old_file = result.scalars().first()
-    if old_file:
-        logger.info(f" Overwriting existing finalized_scope.json for project {project_id}")
-    else:
-        old_file = models.ProjectFile(
-            project_id=project_id,
-            file_name="finalized_scope.json",
-        )
-
-    blob_name = f"{PROJECTS_BASE}/{project_id}/finalized_scope.json"
-    await azure_blob.upload_bytes(
-        json.dumps(finalized, ensure_ascii=False, indent=2).encode("utf-8"),
-        blob_name,
-        overwrite=True,
-    )
 
-    old_file.file_path = blob_name
-    db.add(old_file)
+    # ---- Step 3: Save finalized_scope.json (committed with the metadata) ----
+    db_file = await _save_generated_file(db, project.id, "finalized_scope.json", _dump_json(finalized))
     await db.commit()
-    await db.refresh(old_file)
 
     logger.info(f" Finalized scope saved (no LLM) for project {project_id}")
-    return old_file, {**finalized, "_finalized": True}
+    return db_file, {**finalized, "_finalized": True}
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Script to add the composite (project_id, file_name) indexes on project_files:
+the lookup index and the partial unique index over generated files
+(finalized_scope.json, questions.json, architecture.png/.svg) that the scope
+engine upserts against. Generated records are flagged with the is_generated
+column, which is added and backfilled here; user uploads keep their own records
+even when they share those names.
+
+Older databases may hold duplicate generated records; all but the newest per
+project are removed first, and their blobs are deleted unless a remaining record
+still points at the same path.
+New databases get the column and both indexes from create_all (models.ProjectFile);
+run this once against databases created before they were declared.
+
+Usage:
+    python migrate_project_file_index.py
+"""
+import sys
+import os
+import asyncio
+
+# Add the backend directory to the path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import text, inspect, bindparam
+from sqlalchemy.ext.asyncio import create_async_engine
+from app.config.config import DATABASE_URL
+from app.models import GENERATED_FILE_NAMES, GENERATED_FILE_WHERE
+from app.utils import azure_blob
+
+
+async def migrate():
+    """Add is_generated, dedupe generated records and create both indexes if missing."""
+    engine = create_async_engine(DATABASE_URL)
+    orphaned = []
+    try:
+        async with engine.begin() as conn:
+            print("📝 Creating index on project_files (project_id, file_name)...")
+            await conn.execute(text(
+                "CREATE INDEX IF NOT EXISTS ix_projectfile_pid_fname "
+                "ON project_files (project_id, file_name)"
+            ))
+            print("✅ Index 'ix_projectfile_pid_fname' ready")
+
+            columns = await conn.run_sync(
+                lambda c: {col["name"] for col in inspect(c).get_columns("project_files")}
+            )
+            if "is_generated" not in columns:
+                print("📝 Adding column project_files.is_generated...")
+                await conn.execute(text(
+                    "ALTER TABLE project_files ADD COLUMN is_generated BOOLEAN NOT NULL DEFAULT false"
+                ))
+
+            # Generated files live at <project>/<name> or <project>/architecture_<id>.<ext>;
+            # user uploads are stored as <project>/<uuid>_<original name>
+            print("📝 Flagging generated-file records...")
+            result = await conn.execute(
+                text(
+                    "UPDATE project_files SET is_generated = :flag "
+                    "WHERE file_name IN :names AND NOT is_generated "
+                    "AND file_path NOT LIKE '%\\_' || file_name ESCAPE '\\'"
+                ).bindparams(bindparam("names", expanding=True)),
+                {"flag": True, "names": list(GENERATED_FILE_NAMES)},
+            )
+            print(f"   Flagged {result.rowcount} record(s)")
+
+            # An older version of this index was keyed on file name alone
+            await conn.execute(text("DROP INDEX IF EXISTS uq_projectfile_generated"))
+
+            print("📝 Removing duplicate generated-file records...")
+            duplicates = (await conn.execute(text(
+                "SELECT id, file_path FROM ("
+                "  SELECT id, file_path, ROW_NUMBER() OVER ("
+                "   PARTITION BY project_id, file_name"
+                "   ORDER BY uploaded_at DESC, id DESC) AS rn"
+                f"  FROM project_files WHERE {GENERATED_FILE_WHERE.text}"
+                " ) ranked WHERE rn > 1"
+            ))).all()
+            if duplicates:
+                await conn.execute(
+                    text("DELETE FROM project_files WHERE id IN :ids").bindparams(
+                        bindparam("ids", expanding=True)
+                    ),
+                    {"ids": [row.id for row in duplicates]},
+                )
+                still_used = set((await conn.execute(
+                    text("SELECT file_path FROM project_files WHERE file_path IN :paths").bindparams(
+                        bindparam("paths", expanding=True)
+                    ),
+                    {"paths": list({row.file_path for row in duplicates})},
+                )).scalars())
+                orphaned = sorted({row.file_path for row in duplicates} - still_used)
+            print(f"   Removed {len(duplicates)} duplicate record(s)")
+
+            print("📝 Creating unique index on generated project files...")
+            await conn.execute(text(
+                "CREATE UNIQUE INDEX IF NOT EXISTS uq_projectfile_generated "
+                f"ON project_files (project_id, file_name) WHERE {GENERATED_FILE_WHERE.text}"
+            ))
+            print("✅ Index 'uq_projectfile_generated' ready")
+    except Exception as e:
+        print(f"❌ Error: {e}")
+        sys.exit(1)
+    finally:
+        await engine.dispose()
+
+    # Blobs go only after the records are committed away
+    if orphaned:
+        print(f"📝 Deleting {len(orphaned)} orphaned blob(s)...")
+        try:
+            for path in orphaned:
+                deleted = await azure_blob.delete_blob(path)
+                print(f"   {'🗑️ ' if deleted else '⚠️  not deleted:'} {path}")
+        finally:
+            await azure_blob.close()
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("Project File Index Migration Script")
+    print("=" * 60)
+    print(f"Database: {DATABASE_URL.split('@')[-1]}")
+    print("=" * 60)
+    asyncio.run(migrate())
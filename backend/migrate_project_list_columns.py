@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Script to migrate projects.tech_stack / use_cases / compliance from TEXT to JSONB arrays.
+Existing comma-separated values are split into JSON arrays, and a GIN index is added on
+tech_stack for containment filters (@>). Run once against PostgreSQL after deploying the
+CommaList column type.
+
+Usage:
+    python migrate_project_list_columns.py
+"""
+import sys
+import os
+import asyncio
+
+# Add the backend directory to the path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+from app.config.config import DATABASE_URL
+
+LIST_COLUMNS = ("tech_stack", "use_cases", "compliance")
+
+
+def _alter_sql(column: str) -> str:
+    return f"""
+        ALTER TABLE projects
+        ALTER COLUMN {column} TYPE JSONB
+        USING CASE
+            WHEN {column} IS NULL THEN NULL
+            ELSE to_jsonb(array_remove(regexp_split_to_array(trim({column}), '\\s*,\\s*'), ''))
+        END
+    """
+
+
+async def migrate():
+    """Convert the list-like TEXT columns to JSONB and create the GIN index."""
+    engine = create_async_engine(DATABASE_URL)
+    try:
+        async with engine.begin() as conn:
+            for column in LIST_COLUMNS:
+                result = await conn.execute(text(
+                    "SELECT data_type FROM information_schema.columns "
+                    "WHERE table_name = 'projects' AND column_name = :col"
+                ), {"col": column})
+                data_type = result.scalar_one_or_none()
+                if data_type == "jsonb":
+                    print(f"ℹ️  Column '{column}' is already JSONB")
+                    continue
+                print(f"📝 Converting '{column}' ({data_type}) to JSONB...")
+                await conn.execute(text(_alter_sql(column)))
+                print(f"✅ Column '{column}' converted")
+
+            print("📝 Creating GIN index on 'tech_stack'...")
+            await conn.execute(text(
+                "CREATE INDEX IF NOT EXISTS ix_projects_tech_stack_gin "
+                "ON projects USING gin (tech_stack)"
+            ))
+            print("✅ Index 'ix_projects_tech_stack_gin' ready")
+    except Exception as e:
+        print(f"❌ Error: {e}")
+        sys.exit(1)
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("Project List Columns Migration Script")
+    print("=" * 60)
+    print(f"Database: {DATABASE_URL.split('@')[-1]}")
+    print(f"Columns: {', '.join(LIST_COLUMNS)}")
+    print("=" * 60)
+
+    if not DATABASE_URL.startswith("postgresql"):
+        print("❌ This migration only applies to PostgreSQL databases")
+        sys.exit(1)
+
+    response = input("\nThis will rewrite the projects table. Continue? (yes/no): ")
+    if response.lower() in ['yes', 'y']:
+        asyncio.run(migrate())
+    else:
+        print("❌ Operation cancelled")
+        sys.exit(0)
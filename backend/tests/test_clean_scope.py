@@ -0,0 +1,55 @@
+import random
+from datetime import datetime, timedelta
+
+import pytest
+from app.utils import scope_engine
+from app.utils.scope_engine import clean_scope
+
+
+def _reference_usage(activities):
+    """Per-role monthly effort computed activity by activity (the original loop)."""
+    parse = lambda d: datetime.strptime(d, "%Y-%m-%d")
+    spans = [(parse(a["Start Date"]), parse(a["End Date"])) for a in activities]
+    min_start = min(s for s, _ in spans)
+    max_end = max(e for _, e in spans)
+    total_months = max(1, -(-(max_end - min_start).days // 30))
+    usage = {}
+    for act, (s, e) in zip(activities, spans):
+        roles = [act["Owner"]] + [r.strip() for r in act["Resources"].split(",") if r.strip()]
+        for m in range(total_months):
+            lo = max(s, min_start + timedelta(days=m * 30))
+            hi = min(e, min_start + timedelta(days=(m + 1) * 30))
+            days = (hi - lo).days + 1 if hi >= lo else 0
+            for r in roles:
+                months = usage.setdefault(r, [0] * total_months)
+                months[m] += days
+    tier = lambda d: 1.0 if d > 21 else 0.75 if d >= 15 else 0.5 if d >= 8 else 0.25 if d >= 1 else 0.0
+    return {r: [tier(d) for d in months] for r, months in usage.items()}
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("seed", range(20))
+async def test_clean_scope_matches_per_activity_usage(seed):
+    rng = random.Random(seed)
+    roles = list(scope_engine.ROLE_RATE_MAP)[:6]
+    start = datetime(2025, 1, 1)
+    activities = []
+    for i in range(rng.randint(1, 12)):
+        s = start + timedelta(days=rng.randint(0, 200))
+        e = s + timedelta(days=rng.randint(-5, 120))  # some end before they start
+        activities.append({
+            "Activities": f"Activity {i}",
+            "Owner": rng.choice(roles),
+            "Resources": ", ".join(rng.sample(roles, rng.randint(0, 3))),
+            "Start Date": s.strftime("%Y-%m-%d"),
+            "End Date": e.strftime("%Y-%m-%d"),
+        })
+
+    cleaned = await clean_scope(None, {"activities": activities})
+
+    expected = _reference_usage(cleaned["activities"])
+    plan = {row["Resources"]: row for row in cleaned["resourcing_plan"]}
+    assert set(plan) == set(expected)
+    for role, months in expected.items():
+        assert [plan[role][f"Month {m + 1}"] for m in range(len(months))] == months
+        assert plan[role]["Efforts"] == pytest.approx(sum(months))
@@ -0,0 +1,43 @@
+import pytest
+from app.utils import ai_clients
+
+
+@pytest.fixture
+def embed_calls(monkeypatch, tmp_path):
+    """Point the disk cache at a temp file and stand in for Ollama; yields the request log."""
+    calls = []
+
+    async def fake_request(url, model, batch, expected_dim):
+        calls.append(list(batch))
+        return [[float(len(t)), 0.5, -0.25] for t in batch]
+
+    monkeypatch.setattr(ai_clients, "EMBED_CACHE_DB", str(tmp_path / "embeddings.db"))
+    monkeypatch.setattr(ai_clients, "_request_embeddings", fake_request)
+    ai_clients._get_embed_db.cache_clear()
+    ai_clients._embed_cache.clear()
+    yield calls
+    if ai_clients._get_embed_db.cache_info().currsize:
+        ai_clients._get_embed_db().close()
+    ai_clients._get_embed_db.cache_clear()
+    ai_clients._embed_cache.clear()
+
+
+@pytest.mark.asyncio
+async def test_vectors_round_trip_through_the_disk_cache(embed_calls):
+    first = await ai_clients.embed_text_ollama(["alpha", "beta", "alpha"])
+    assert embed_calls == [["alpha", "beta"]]
+
+    # A fresh process only has the SQLite file
+    ai_clients._embed_cache.clear()
+    disk_hits = ai_clients.embed_cache_info()["disk_hits"]
+    second = await ai_clients.embed_text_ollama(["beta", "alpha", "gamma"])
+
+    assert embed_calls == [["alpha", "beta"], ["gamma"]]
+    assert second[:2] == [first[1], first[0]]
+    assert ai_clients.embed_cache_info()["disk_hits"] == disk_hits + 2
+
+
+def test_disk_cache_is_keyed_by_model(embed_calls):
+    ai_clients._disk_cache_put("model-a", [("alpha", [1.0, 2.0])])
+    assert ai_clients._disk_cache_get("model-a", ["alpha", "beta"]) == {"alpha": [1.0, 2.0]}
+    assert ai_clients._disk_cache_get("model-b", ["alpha"]) == {}
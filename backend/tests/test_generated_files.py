@@ -0,0 +1,61 @@
+import uuid
+
+import pytest
+import pytest_asyncio
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from app import crud, models
+from app.config.database import Base
+from app.utils.scope_engine import _upsert_project_file
+
+
+@pytest_asyncio.fixture
+async def db():
+    engine = create_async_engine("sqlite+aiosqlite://")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    async with AsyncSession(engine, expire_on_commit=False) as session:
+        yield session
+    await engine.dispose()
+
+
+async def _project(db):
+    project = models.Project(name="Demo", owner_id=uuid.uuid4())
+    db.add(project)
+    await db.commit()
+    return project
+
+
+@pytest.mark.asyncio
+async def test_upsert_keeps_one_generated_record(db):
+    project = await _project(db)
+    first = await _upsert_project_file(db, project.id, "questions.json", "projects/p/questions.json")
+    await db.commit()
+    second = await _upsert_project_file(db, project.id, "questions.json", "projects/p/questions_v2.json")
+    await db.commit()
+
+    assert first.id == second.id
+    assert second.is_generated and second.file_path == "projects/p/questions_v2.json"
+    paths = (await db.scalars(select(models.ProjectFile.file_path))).all()
+    assert paths == ["projects/p/questions_v2.json"]
+
+
+@pytest.mark.asyncio
+async def test_user_uploads_with_generated_names_are_left_alone(db):
+    project = await _project(db)
+    db.add_all([
+        models.ProjectFile(project_id=project.id, file_name="questions.json", file_path=f"projects/p/u{i}_questions.json")
+        for i in range(2)
+    ])
+    await db.commit()
+
+    generated = await _upsert_project_file(db, project.id, "questions.json", "projects/p/questions.json")
+    await db.commit()
+
+    rows = (await db.scalars(select(models.ProjectFile).order_by(models.ProjectFile.file_path))).all()
+    assert [(r.file_path, r.is_generated) for r in rows] == [
+        ("projects/p/questions.json", True),
+        ("projects/p/u0_questions.json", False),
+        ("projects/p/u1_questions.json", False),
+    ]
+    assert await crud.get_file_by_name(db, project.id, "questions.json") == generated.file_path
@@ -0,0 +1,17 @@
+from app.utils.scope_engine import _JsonObjectEnd
+
+
+# ---------- Streaming stop condition ----------
+def _feed(detector, pieces):
+    return [detector(p) for p in pieces]
+
+
+def test_json_object_end_stops_at_first_complete_object():
+    pieces = ["<thi", "nk>{not json}</think>", "```json\n{\"a\": ", "\"}{\", \"b\": {\"c\": 1}", "}"]
+    assert _feed(_JsonObjectEnd(), pieces) == [False, False, False, False, True]
+
+
+def test_json_object_end_skips_brace_runs_that_are_not_json():
+    detector = _JsonObjectEnd()
+    assert detector("Use {placeholder} values: ") is False
+    assert detector('{"ok": true}') is True
@@ -0,0 +1,37 @@
+import pytest
+from app.utils.scope_engine import _instruction_keywords, _local_edit_targets, _merge_local_edit
+
+
+def _draft():
+    return {
+        "overview": {"Project Name": "Demo"},
+        "activities": [
+            {"ID": 1, "Activities": "Requirements Gathering", "Owner": "Business Analyst",
+             "Resources": "Data Engineer, QA Engineer", "Start Date": "2025-01-01", "End Date": "2025-02-01"},
+            {"ID": 2, "Activities": "Data Pipeline Build", "Owner": "Backend Developer",
+             "Resources": "Business Analyst", "Start Date": "2025-01-20", "End Date": "2025-03-15"},
+            {"ID": 3, "Activities": "QA Testing", "Owner": "QA Engineer",
+             "Resources": "", "Start Date": "2025-03-01", "End Date": "2025-04-01"},
+            {"ID": 4, "Activities": "Deployment", "Owner": "DevOps Engineer",
+             "Resources": "Backend Developer", "Start Date": "2025-04-01", "End Date": "2025-04-20"},
+        ],
+    }
+
+
+@pytest.mark.parametrize("instructions, expected", [
+    ("split activity 3 into two", [2]),
+    ("merge activities 2 and 4", [1, 3]),
+    ("Split Data Pipeline Build into ingestion and transform", [1]),
+    ("split all activities", None),
+    ("remove Business Analyst", None),
+    ("shorten the timeline", None),
+])
+def test_local_edit_targets(instructions, expected):
+    lower = instructions.lower()
+    assert _local_edit_targets(_draft(), lower, _instruction_keywords(lower)) == expected
+
+
+def test_merge_local_edit_splices_at_first_target():
+    draft = _draft()
+    merged = _merge_local_edit(draft, [1, 3], [{"Activities": "Merged"}])
+    assert [a["Activities"] for a in merged] == ["Requirements Gathering", "Merged", "QA Testing"]
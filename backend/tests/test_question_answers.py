@@ -0,0 +1,99 @@
+import asyncio
+from types import SimpleNamespace
+
+import orjson
+import pytest
+from azure.core.exceptions import ResourceModifiedError
+from app.utils import azure_blob, scope_engine
+
+PROJECT = SimpleNamespace(id="p1")
+BLOB = scope_engine._questions_blob_name(PROJECT.id)
+
+
+def _questions(*texts):
+    return {"questions": [{"category": "Scope", "items": [{"question": t} for t in texts]}]}
+
+
+def _answers(blobs):
+    doc = orjson.loads(blobs.data[BLOB])
+    return {i["question"]: i.get("user_understanding") for c in doc["questions"] for i in c["items"]}
+
+
+class FakeBlobs:
+    """In-memory questions.json store with Azure-style ETag checks."""
+
+    def __init__(self):
+        self.data, self.etags, self.writes = {}, {}, 0
+
+    def put(self, name, doc):
+        self.writes += 1
+        self.data[name] = orjson.dumps(doc)
+        self.etags[name] = str(self.writes)
+
+    async def download_bytes_with_etag(self, name, base=""):
+        return self.data[name], self.etags[name]
+
+    async def upload_bytes(self, data, name, base="", overwrite=True, metadata=None, etag=None):
+        if etag and etag != self.etags[name]:
+            raise ResourceModifiedError("412 Precondition Failed")
+        self.put(name, orjson.loads(data))
+        return name
+
+
+@pytest.fixture
+def blobs(monkeypatch):
+    fake = FakeBlobs()
+    fake.put(BLOB, _questions("Q1", "Q2"))
+    monkeypatch.setattr(azure_blob, "download_bytes_with_etag", fake.download_bytes_with_etag)
+    monkeypatch.setattr(azure_blob, "upload_bytes", fake.upload_bytes)
+    monkeypatch.setattr(scope_engine.config, "QUESTIONS_FLUSH_SECONDS", 0.05)
+    yield fake
+    for task in list(scope_engine._questions_flush_tasks.values()):
+        task.cancel()
+    scope_engine._questions_flush_tasks.clear()
+    scope_engine._questions_pending.clear()
+
+
+@pytest.mark.asyncio
+async def test_answers_are_batched_and_flushed(blobs):
+    await scope_engine.save_question_answers(None, PROJECT, {"Scope": {"Q1": "a1"}})
+    await scope_engine.save_question_answers(None, PROJECT, {"Scope": {"Q2": "a2"}})
+    assert _answers(blobs) == {"Q1": None, "Q2": None}
+
+    await asyncio.sleep(0.1)
+    assert _answers(blobs) == {"Q1": "a1", "Q2": "a2"}
+    assert blobs.writes == 2
+    assert not scope_engine._questions_pending and not scope_engine._questions_locks
+
+
+@pytest.mark.asyncio
+async def test_flush_reapplies_answers_over_another_workers_write(blobs):
+    await scope_engine.save_question_answers(None, PROJECT, {"Scope": {"Q1": "mine"}})
+    # Another worker flushes its own answer in the meantime
+    other = _questions("Q1", "Q2")
+    other["questions"][0]["items"][1]["user_understanding"] = "theirs"
+    blobs.put(BLOB, other)
+
+    await scope_engine.flush_question_answers(BLOB)
+    assert _answers(blobs) == {"Q1": "mine", "Q2": "theirs"}
+
+
+@pytest.mark.asyncio
+async def test_flush_drops_answers_for_a_regenerated_questionnaire(blobs):
+    await scope_engine.save_question_answers(None, PROJECT, {"Scope": {"Q1": "stale"}})
+    # Regenerated on another worker
+    blobs.put(BLOB, _questions("New question"))
+
+    await scope_engine.flush_question_answers(BLOB)
+    assert _answers(blobs) == {"New question": None}
+    assert BLOB not in scope_engine._questions_pending
+
+
+@pytest.mark.asyncio
+async def test_discard_cancels_the_pending_flush(blobs):
+    await scope_engine.save_question_answers(None, PROJECT, {"Scope": {"Q1": "a1"}})
+    scope_engine.discard_question_answers(PROJECT.id)
+
+    await asyncio.sleep(0.1)
+    assert _answers(blobs) == {"Q1": None, "Q2": None}
+    assert blobs.writes == 1
@@ -0,0 +1,34 @@
+import shutil
+import subprocess
+
+import pytest
+from app.utils import scope_engine
+from app.utils.scope_engine import _render_dot
+
+
+_FAKE_PNG = b"\x89PNG\r\n\x1a\n" + b"\x00" * 16 + scope_engine._PNG_IEND
+_FAKE_SVG = b'<?xml version="1.0"?>\n<svg></svg>\n'
+
+
+def test_render_dot_splits_png_and_svg(monkeypatch):
+    def fake_run(cmd, input, capture_output):
+        return subprocess.CompletedProcess(cmd, 0, stdout=_FAKE_PNG + _FAKE_SVG, stderr=b"")
+
+    monkeypatch.setattr(scope_engine.subprocess, "run", fake_run)
+    assert _render_dot("digraph { a -> b }") == (_FAKE_PNG, _FAKE_SVG)
+
+
+def test_render_dot_rejects_truncated_output(monkeypatch):
+    def fake_run(cmd, input, capture_output):
+        return subprocess.CompletedProcess(cmd, 0, stdout=_FAKE_PNG[:-4], stderr=b"")
+
+    monkeypatch.setattr(scope_engine.subprocess, "run", fake_run)
+    with pytest.raises(RuntimeError):
+        _render_dot("digraph { a -> b }")
+
+
+@pytest.mark.skipif(shutil.which("dot") is None, reason="graphviz not installed")
+def test_render_dot_with_graphviz():
+    png, svg = _render_dot("digraph { a -> b }")
+    assert png.startswith(b"\x89PNG") and png.endswith(scope_engine._PNG_IEND)
+    assert b"<svg" in svg
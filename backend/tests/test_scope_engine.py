@@ -0,0 +1,70 @@
+import pytest
+from app.utils.scope_engine import _apply_deterministic_mutation
+
+
+def _draft():
+    return {
+        "overview": {"Project Name": "Demo"},
+        "activities": [
+            {"ID": 1, "Activities": "Requirements Gathering", "Owner": "Business Analyst",
+             "Resources": "Data Engineer, QA Engineer", "Start Date": "2025-01-01", "End Date": "2025-02-01"},
+            {"ID": 2, "Activities": "Data Pipeline Build", "Owner": "Backend Developer",
+             "Resources": "Business Analyst", "Start Date": "2025-01-20", "End Date": "2025-03-15"},
+            {"ID": 3, "Activities": "QA Testing", "Owner": "QA Engineer",
+             "Resources": "", "Start Date": "2025-03-01", "End Date": "2025-04-01"},
+            {"ID": 4, "Activities": "Deployment", "Owner": "DevOps Engineer",
+             "Resources": "Backend Developer", "Start Date": "2025-04-01", "End Date": "2025-04-20"},
+        ],
+    }
+
+
+def _roles(scope):
+    roles = set()
+    for act in scope["activities"]:
+        roles.add(act["Owner"])
+        roles.update(r.strip() for r in act["Resources"].split(",") if r.strip())
+    return roles
+
+
+def test_fast_path_discount_only():
+    draft = _draft()
+    updated = _apply_deterministic_mutation(draft, "Please give 10% discount")
+    assert updated["discount_percentage"] == 10
+    assert updated["activities"] == draft["activities"]
+
+
+def test_fast_path_removes_role_without_touching_draft():
+    draft = _draft()
+    updated = _apply_deterministic_mutation(draft, "remove Business Analyst from the project and apply 5% discount")
+    assert updated["discount_percentage"] == 5
+    assert "Business Analyst" not in _roles(updated)
+    assert len(updated["activities"]) == len(draft["activities"])
+    # The draft itself is left as it was
+    assert draft["activities"][0]["Owner"] == "Business Analyst"
+
+
+def test_fast_path_owner_is_not_reassigned_to_the_removed_role():
+    draft = {"activities": [
+        {"Activities": "Req", "Owner": "Business Analyst", "Resources": "Business Analyst, Data Engineer"},
+        {"Activities": "Sign-off", "Owner": "Business Analyst", "Resources": "Business Analyst"},
+    ]}
+    updated = _apply_deterministic_mutation(draft, "remove business analyst and give 10% discount")
+    assert [(a["Owner"], a["Resources"]) for a in updated["activities"]] == [
+        ("Data Engineer", ""),
+        ("Project Manager", ""),
+    ]
+
+
+def test_fast_path_keeps_fractional_discount():
+    assert _apply_deterministic_mutation(_draft(), "give 5.5% discount")["discount_percentage"] == 5.5
+
+
+@pytest.mark.parametrize("instructions", [
+    "add QA and apply 5% discount",           # creative verb
+    "apply 5% discount and shorten timeline",  # unrecognised leftover
+    "remove testing phase",                    # not a role in the draft
+    "split activity 3",
+    "apply 5% discount, then 10 percent",      # unconsumed number
+])
+def test_fast_path_defers_to_llm(instructions):
+    assert _apply_deterministic_mutation(_draft(), instructions) is None